@@ -1,9 +1,13 @@
 # api/__init__.py
 
-from flask import Flask
+import time
+from flask import Flask, g, request
 
-def create_app():
-    """Flaskアプリケーションインスタンスを作成して返すファクトリ関数"""
+def create_app(validate_on_startup: bool = False):
+    """
+    Flaskアプリケーションインスタンスを作成して返すファクトリ関数。
+    validate_on_startup=True の場合、起動前にチェーン全体を再検証し、不正があれば起動しない。
+    """
     app = Flask(__name__)
 
     # --- ここからが重要 ---
@@ -14,6 +18,31 @@ def create_app():
     app.register_blueprint(api_blueprint, url_prefix='/api')
     # --- ここまでが重要 ---
 
+    # エンドポイントごとの処理時間とステータスコードを記録する（TJC_METRICS=0 の場合は登録しない）
+    from app.metrics import METRICS_ENABLED, REQUEST_DURATION, REQUESTS
+    if METRICS_ENABLED:
+        @app.before_request
+        def start_timer():
+            g.request_started = time.perf_counter()
+
+        @app.after_request
+        def record_request(response):
+            endpoint = request.endpoint or "unknown"
+            REQUEST_DURATION.observe(endpoint, time.perf_counter() - g.request_started)
+            REQUESTS.inc(endpoint, response.status_code)
+            return response
+
+    # 起動時に一度だけチェーンを読み込み、以降はプロセス内で共有する
+    from app.blockchain import get_shared_blockchain
+    blockchain = get_shared_blockchain()
+
+    if validate_on_startup:
+        from app.validation import validate_blockchain
+        result = validate_blockchain(blockchain)
+        if not result["valid"]:
+            raise RuntimeError(f"チェーンの検証に失敗しました: ブロック {result['first_invalid_index']}: {result['reason']}")
+        print(f"チェーンを検証しました: {result['blocks']} ブロック ({result['elapsed']:.2f} 秒)")
+
     # ルートパスへの簡単な応答を追加
     @app.route("/")
     def index():
@@ -1,24 +1,42 @@
 # api/routes.py
 
-from flask import Blueprint, request, jsonify, g
+from flask import Blueprint, Response, request, jsonify
 from datetime import datetime
 import hashlib
+import hmac
 import json
+import os
 import time
 
 # 必要なモジュールを正しくインポートする
-from app.user import create_user, get_user, load_users
-from app.wallet import verify_user_signature
-from app.blockchain import Blockchain
-from app.block import Block
+from app.user import create_user, get_user, load_users, count_users, get_balances, list_users_by_balance
+from app.wallet import verify_user_signature, is_canonical_signature, get_verifying_key_cache_stats, SIGNATURE_SIZE
+from app import metrics
+from app.blockchain import get_shared_blockchain, reload_shared_blockchain, StaleBlockError
+from app.block import Block, transaction_to_dict
+from app.difficulty import next_retarget_index, is_valid_timestamp
+from app.tx_table import numpy_available
 
 bp = Blueprint("api", __name__)
 
+LONG_POLL_TIMEOUT = 25.0        # /info?wait_for_change= の既定の待ち時間（秒）
+LONG_POLL_MAX_TIMEOUT = 60.0    # 同じく上限（秒）
+MAX_BATCH_SIZE = 1000           # /send_batch で1ブロックに含められる送金の上限
+MAX_CHAIN_RUN = 100             # /send_chain で一度に受け付けるブロック数の上限
+MAX_BALANCE_LOOKUP = 1000       # /balances で一度に問い合わせられるユーザー数の上限
+MAX_TOP_SENDERS = 100           # /stats/top_senders で一度に返せる人数の上限
+# 運用者向けAPI（/admin/...）のトークン。設定すると X-Admin-Token ヘッダーが一致するリクエストだけを受け付け、
+# 未設定の場合はループバックアドレスからのリクエストだけを受け付ける
+ADMIN_TOKEN = os.environ.get("TJC_ADMIN_TOKEN")
+
 def get_blockchain():
-    """リクエスト内で使いまわせるように、gオブジェクトにBlockchainインスタンスを格納"""
-    if 'blockchain' not in g:
-        g.blockchain = Blockchain()
-    return g.blockchain
+    """プロセス全体で共有しているBlockchainインスタンスを返す（リクエスト毎の再読み込みはしない）"""
+    return get_shared_blockchain()
+
+@bp.before_request
+def sync_shared_state():
+    """複数のワーカープロセスで保存先を共有している場合、他のプロセスが追加したブロックと残高の変更だけを取り込む"""
+    get_shared_blockchain().sync()
 
 @bp.route("/create_user", methods=["POST"])
 def create_user_endpoint():
@@ -57,36 +75,46 @@ def send_and_mine():
 
     if not all([from_username, to_username, amount, signature, nonce is not None, timestamp is not None]):
         return jsonify({"error": "必須パラメータ(from_username, to_username, amount, signature, nonce, timestamp)が不足しています"}), 400
+    if not is_valid_timestamp(timestamp):
+        return timestamp_format_error()
     
     sender = get_user(from_username)
     if not sender: return jsonify({"error": "送金元ユーザーが存在しません"}), 404
     if not get_user(to_username): return jsonify({"error": "送金先ユーザーが存在しません"}), 404
     if sender["balance"] < amount: return jsonify({"error": "残高不足です"}), 400
+    if not is_canonical_signature(signature):
+        return signature_format_error()
 
     message = f"send:{from_username}->{to_username}:{amount}"
     if not verify_user_signature(sender["public_key"], message, signature):
         return jsonify({"error": "署名検証に失敗しました。"}), 400
 
     blockchain = get_blockchain()
-    latest_block = blockchain.get_latest_block()
+    # クライアントがPoWを計算した対象のブロック（省略時は現在の最新ブロック）
+    tip = blockchain.tip
+    previous_hash = data.get("previous_hash", tip.hash)
+    index = data.get("index", tip.index + 1)
 
-    # トランザクションIDを計算
-    tx_payload_for_id = {"from": from_username, "to": to_username, "amount": amount, "signature": signature, "comment": comment}
-    txid = hashlib.sha256(json.dumps(tx_payload_for_id, sort_keys=True).encode()).hexdigest()
-    tx = {**tx_payload_for_id, "txid": txid}
+    tx = build_transaction(from_username, to_username, amount, signature, comment)
+    if blockchain.find_replayed([tx]) is not None:
+        return replayed_response()
 
     # 新しいブロックをクライアントからの情報で構築
     new_block = Block(
-        index=latest_block.index + 1,
+        index=index,
         transactions=[tx],
-        previous_hash=latest_block.hash,
-        difficulty=blockchain.difficulty,
+        previous_hash=previous_hash,
+        difficulty=data.get("difficulty", tip.difficulty),
         timestamp=timestamp,
         nonce=nonce
     )
 
     # ブロックをチェーンに追加（この中でPoW検証が行われる）
-    if blockchain.add_block(new_block):
+    try:
+        added = blockchain.add_block(new_block)
+    except StaleBlockError as e:
+        return stale_block_response(blockchain, e)
+    if added:
         return jsonify({
             "message": "送金成功！ブロックがチェーンに追加されました。",
             "block_hash": new_block.hash
@@ -94,15 +122,206 @@ def send_and_mine():
     else:
         return jsonify({"error": "ブロックの検証に失敗しました。PoWが無効か、チェーンが更新された可能性があります。"}), 400
 
+@bp.route("/send_batch", methods=["POST"])
+def send_batch_and_mine():
+    """
+    複数の送金（送金元は1人でも複数人でもよい）を1つのブロックにまとめ、1回のPoWでチェーンに追加する。
+    残高は送金元ごとに合算して確認し、ブロック単位で全て反映されるか全く反映されないかのどちらかになる。
+    """
+    data = request.get_json()
+    transfers = data.get("transfers")
+    nonce = data.get("nonce")
+    timestamp = data.get("timestamp")
+
+    if not transfers or not isinstance(transfers, list) or nonce is None or timestamp is None:
+        return jsonify({"error": "必須パラメータ(transfers, nonce, timestamp)が不足しています"}), 400
+    if not is_valid_timestamp(timestamp):
+        return timestamp_format_error()
+    if len(transfers) > MAX_BATCH_SIZE:
+        return jsonify({"error": f"1ブロックに含められる送金は {MAX_BATCH_SIZE} 件までです"}), 400
+
+    transactions, error = build_batch_transactions(transfers)
+    if error:
+        return error
+
+    blockchain = get_blockchain()
+    if blockchain.find_replayed(transactions) is not None:
+        return replayed_response()
+    tip = blockchain.tip
+    new_block = Block(
+        index=data.get("index", tip.index + 1),
+        transactions=transactions,
+        previous_hash=data.get("previous_hash", tip.hash),
+        difficulty=data.get("difficulty", tip.difficulty),
+        timestamp=timestamp,
+        nonce=nonce
+    )
+
+    try:
+        added = blockchain.add_block(new_block)
+    except StaleBlockError as e:
+        return stale_block_response(blockchain, e)
+    if added:
+        return jsonify({
+            "message": f"送金成功！{len(transactions)} 件の送金を含むブロックがチェーンに追加されました。",
+            "block_hash": new_block.hash,
+            "txids": [tx["txid"] for tx in transactions]
+        }), 201
+    else:
+        return jsonify({"error": "ブロックの検証に失敗しました。PoWが無効か、残高が不足している可能性があります。"}), 400
+
+@bp.route("/send_chain", methods=["POST"])
+def send_chain_and_mine():
+    """
+    クライアントが手元で連続して採掘した複数のブロック（ブロックN+1はブロックNのハッシュの上に採掘）を受け付け、
+    全て追加するか1つも追加しない。
+    blocks は [{"transfers": [...], "nonce": ..., "timestamp": ...}, ...]、
+    previous_hash / index は先頭ブロックのもの（2番目以降は直前のブロックから決まる）。
+    """
+    data = request.get_json()
+    blocks_data = data.get("blocks")
+    if not blocks_data or not isinstance(blocks_data, list):
+        return jsonify({"error": "必須パラメータ(blocks)が不足しています"}), 400
+    if len(blocks_data) > MAX_CHAIN_RUN:
+        return jsonify({"error": f"一度に送信できるブロックは {MAX_CHAIN_RUN} 個までです"}), 400
+
+    blockchain = get_blockchain()
+    tip = blockchain.tip
+    previous_hash = data.get("previous_hash", tip.hash)
+    index = data.get("index", tip.index + 1)
+    difficulty = data.get("difficulty", tip.difficulty)
+
+    new_blocks = []
+    for i, block_data in enumerate(blocks_data):
+        if not isinstance(block_data, dict) or not block_data.get("transfers") or block_data.get("nonce") is None or block_data.get("timestamp") is None:
+            return jsonify({"error": f"blocks[{i}]: transfers, nonce, timestamp が必要です"}), 400
+        if not is_valid_timestamp(block_data["timestamp"]):
+            return timestamp_format_error(f"blocks[{i}]: ")
+        # 残高は後続ブロックの入金も含めて順に確認する必要があるため、コミット時にまとめて確認する
+        transactions, error = build_batch_transactions(block_data["transfers"], check_balance=False)
+        if error:
+            return error
+        new_block = Block(
+            index=index + i,
+            transactions=transactions,
+            previous_hash=previous_hash,
+            difficulty=block_data.get("difficulty", difficulty),
+            timestamp=block_data["timestamp"],
+            nonce=block_data["nonce"]
+        )
+        new_blocks.append(new_block)
+        previous_hash = new_block.hash
+    if blockchain.find_replayed([tx for new_block in new_blocks for tx in new_block.transactions]) is not None:
+        return replayed_response()
+
+    try:
+        added = blockchain.add_blocks(new_blocks)
+    except StaleBlockError as e:
+        return stale_block_response(blockchain, e)
+    if added:
+        return jsonify({
+            "message": f"送金成功！{len(new_blocks)} 個のブロックがチェーンに追加されました。",
+            "block_hashes": [new_block.hash for new_block in new_blocks]
+        }), 201
+    else:
+        return jsonify({"error": "ブロックの検証に失敗しました。PoWが無効か、残高が不足している可能性があります。"}), 400
+
+def build_transaction(from_username, to_username, amount, signature, comment) -> dict:
+    """送金内容からトランザクションIDを計算し、ブロックに格納するトランザクションを作る"""
+    tx_payload_for_id = {"from": from_username, "to": to_username, "amount": amount, "signature": signature, "comment": comment}
+    txid = hashlib.sha256(json.dumps(tx_payload_for_id, sort_keys=True).encode()).hexdigest()
+    return {**tx_payload_for_id, "txid": txid}
+
+def build_batch_transactions(transfers: list, check_balance: bool = True):
+    """
+    送金リストを検証してトランザクションのリストにする。
+    戻り値は (トランザクションのリスト, None) か、問題があれば (None, エラー応答)。
+    """
+    transactions = []
+    deltas = {}
+    users = {}
+    for i, transfer in enumerate(transfers):
+        if not isinstance(transfer, dict):
+            return None, (jsonify({"error": f"transfers[{i}] の形式が不正です"}), 400)
+        from_username = transfer.get("from_username")
+        to_username = transfer.get("to_username")
+        amount = transfer.get("amount")
+        signature = transfer.get("signature")
+        comment = transfer.get("comment", "")
+        if not all([from_username, to_username, signature]) or not isinstance(amount, int) or amount <= 0:
+            return None, (jsonify({"error": f"transfers[{i}]: from_username, to_username, signature と正の整数の amount が必要です"}), 400)
+
+        for username in (from_username, to_username):
+            if username not in users:
+                users[username] = get_user(username)
+        if not users[from_username]: return None, (jsonify({"error": f"transfers[{i}]: 送金元ユーザーが存在しません"}), 404)
+        if not users[to_username]: return None, (jsonify({"error": f"transfers[{i}]: 送金先ユーザーが存在しません"}), 404)
+
+        if not is_canonical_signature(signature):
+            return None, signature_format_error(f"transfers[{i}]: ")
+        message = f"send:{from_username}->{to_username}:{amount}"
+        if not verify_user_signature(users[from_username]["public_key"], message, signature):
+            return None, (jsonify({"error": f"transfers[{i}]: 署名検証に失敗しました。"}), 400)
+
+        deltas[from_username] = deltas.get(from_username, 0) - amount
+        deltas[to_username] = deltas.get(to_username, 0) + amount
+        transactions.append(build_transaction(from_username, to_username, amount, signature, comment))
+
+    # ブロック全体を反映した後の残高で確認する（コミット時にも同じ確認が原子的に行われる）
+    overdrawn = [username for username, delta in deltas.items() if users[username]["balance"] + delta < 0]
+    if check_balance and overdrawn:
+        return None, (jsonify({"error": f"残高不足です: {', '.join(overdrawn)}"}), 400)
+    return transactions, None
+
+def signature_format_error(prefix: str = ""):
+    """署名が sign_message の出力と同じ形式（小文字の16進）でない場合の応答"""
+    return jsonify({"error": f"{prefix}signature は {SIGNATURE_SIZE * 2} 桁の小文字の16進で指定してください"}), 400
+
+def timestamp_format_error(prefix: str = ""):
+    """タイムスタンプが数値（UNIX時刻）でない場合の応答"""
+    return jsonify({"error": f"{prefix}timestamp は数値（UNIX時刻）で指定してください"}), 400
+
+def replayed_response():
+    """既にチェーンに含まれている署名付き送金が再送された場合の応答（採掘し直しても受け付けられないので 409 にはしない）"""
+    return jsonify({"error": "同じ署名の送金が既にチェーンに含まれています。送金ごとに署名し直してください。"}), 400
+
+def stale_block_response(blockchain, error: StaleBlockError):
+    """他のブロックが先に追加された場合の 409 応答。クライアントがすぐ再計算できるよう最新情報を含める"""
+    return jsonify({
+        "error": "チェーンが更新されたため、ブロックを追加できませんでした。最新ブロックで再計算してください。",
+        "difficulty": error.tip.difficulty,
+        "next_retarget_index": next_retarget_index(error.tip.index + 1, blockchain.params),
+        "latest_block_hash": error.tip.hash,
+        "latest_block_index": error.tip.index
+    }), 409
+
 @bp.route("/info", methods=["GET"])
 def get_info():
-    """クライアントがPoWを計算するのに必要な情報を返す"""
+    """
+    クライアントがPoWを計算するのに必要な情報を返す。
+    wait_for_change=<ハッシュ> を指定すると、最新ブロックがそのハッシュから変わるまで
+    （最大 timeout 秒）応答を保留するロングポーリングになる。
+    """
     blockchain = get_blockchain()
-    latest_block = blockchain.get_latest_block()
+    known_hash = request.args.get("wait_for_change")
+    if known_hash:
+        try:
+            timeout = min(float(request.args.get("timeout", LONG_POLL_TIMEOUT)), LONG_POLL_MAX_TIMEOUT)
+        except ValueError:
+            return jsonify({"error": "timeout は数値で指定してください"}), 400
+        latest_block = blockchain.wait_for_tip_change(known_hash, max(timeout, 0))
+    else:
+        latest_block = blockchain.tip
     return jsonify({
-        "difficulty": blockchain.difficulty,
+        "difficulty": latest_block.difficulty,
+        # この番号以降のブロックは難易度が変わりうる（リターゲットしない場合は None）
+        "next_retarget_index": next_retarget_index(latest_block.index + 1, blockchain.params),
+        "target_block_interval": blockchain.params.target_block_interval or None,
+        # チェーンの作成時に記録した難易度の規則のパラメータ（ライトクライアントがヘッダーの検証に使う）
+        "chain_params": blockchain.params._asdict(),
         "latest_block_hash": latest_block.hash,
-        "latest_block_index": latest_block.index
+        "latest_block_index": latest_block.index,
+        "changed": bool(known_hash) and latest_block.hash != known_hash
     })
 
 @bp.route("/balance", methods=["GET"])
@@ -113,33 +332,253 @@ def balance():
     if not user: return jsonify({"error": "ユーザーが見つかりません"}), 404
     return jsonify({"username": username, "balance": user["balance"]}), 200
 
+@bp.route("/balances", methods=["GET"])
+def balances():
+    """
+    usernames=a,b,c で指定した複数ユーザーの残高をまとめて返す。
+    存在しないユーザーは missing に入れる。
+    """
+    usernames = [u for u in request.args.get("usernames", "").split(",") if u]
+    if not usernames: return jsonify({"error": "usernames パラメータが必要です"}), 400
+    if len(usernames) > MAX_BALANCE_LOOKUP:
+        return jsonify({"error": f"一度に問い合わせられるユーザーは {MAX_BALANCE_LOOKUP} 人までです"}), 400
+    found = get_balances(usernames)
+    return jsonify({
+        "balances": found,
+        "missing": [u for u in usernames if u not in found]
+    }), 200
+
 @bp.route("/chain", methods=["GET"])
 def get_full_chain():
+    """
+    チェーンをブロック単位でJSONストリームとして返す（全体をメモリ上に組み立てない）。
+    from_index / to_index（両端を含む）/ limit で範囲を絞り込み、
+    headers_only=1 を指定すると transactions を省いたヘッダーのみを返す。
+    """
     blockchain = get_blockchain()
-    chain_data = [block.__dict__ for block in blockchain.chain]
-    return jsonify({"chain": chain_data, "length": len(chain_data)}), 200
+    try:
+        from_index = int(request.args.get("from_index", 0))
+        to_index = request.args.get("to_index")
+        to_index = int(to_index) if to_index is not None else None
+        limit = request.args.get("limit")
+        limit = int(limit) if limit is not None else None
+    except ValueError:
+        return jsonify({"error": "from_index, to_index, limit は整数で指定してください"}), 400
+    if from_index < 0 or (to_index is not None and to_index < 0) or (limit is not None and limit < 0):
+        return jsonify({"error": "from_index, to_index, limit は0以上で指定してください"}), 400
+    if to_index is not None and from_index > to_index:
+        return jsonify({"error": "from_index は to_index 以下で指定してください"}), 400
+    headers_only = request.args.get("headers_only", "").lower() in ("1", "true", "yes")
+
+    # 応答開始時点のチェーンを対象にする（ストリーミング中に追加されたブロックは含めない）
+    chain = blockchain.chain
+    chain_length = len(chain)
+    stop = chain_length if to_index is None else min(chain_length, to_index + 1)
+    if limit is not None:
+        stop = min(stop, from_index + limit)
+    start = min(from_index, max(stop, 0))
+
+    def generate():
+        yield '{"chain": ['
+        for i, block in enumerate(chain.iter_blocks(start, stop), start=start):
+            block_data = block.to_dict(include_transactions=not headers_only)
+            yield ("," if i > start else "") + json.dumps(block_data, sort_keys=True)
+        yield f'], "chain_length": {chain_length}, "length": {stop - start}}}'
+
+    return Response(generate(), mimetype="application/json"), 200
 
 @bp.route("/transactions", methods=["GET"])
 def get_all_transactions():
-    """ブロックチェーン全体をスキャンしてトランザクション履歴を返す"""
+    """
+    トランザクション履歴を返す。
+    username を指定した場合はユーザー別の索引を使い、チェーン全体は走査しない。
+    limit または before（前回レスポンスの next_cursor）を指定すると新しい順のページ単位で返す。
+    """
     blockchain = get_blockchain()
     username = request.args.get("username")
+    limit = request.args.get("limit")
+    before = request.args.get("before")
+
+    if limit is not None or before is not None:
+        if not username:
+            return jsonify({"error": "limit, before を使う場合は username パラメータが必要です"}), 400
+        try:
+            limit = int(limit) if limit is not None else None
+            before = tuple(int(v) for v in before.split(":")) if before is not None else None
+        except ValueError:
+            return jsonify({"error": "limit は整数、before は '<ブロック番号>:<位置>' 形式で指定してください"}), 400
+        if (limit is not None and limit <= 0) or (before is not None and len(before) != 2):
+            return jsonify({"error": "limit は整数、before は '<ブロック番号>:<位置>' 形式で指定してください"}), 400
+
+        entries, has_more = blockchain.get_user_transactions(username, limit=limit, before=before)
+        page = [
+            {**tx, "block_index": i, "timestamp": blockchain.chain[i].timestamp}
+            for i, pos, tx in entries
+        ]
+        next_cursor = f"{entries[-1][0]}:{entries[-1][1]}" if entries and has_more else None
+        return jsonify({"transactions": page, "next_cursor": next_cursor})
+
+    if username:
+        entries, _ = blockchain.get_user_transactions(username)
+        return jsonify([transaction_to_dict(tx) for _, _, tx in reversed(entries)])
+
     all_txs = []
     # ジェネシスブロック（index=0）以降の全ブロックを走査
-    for block in blockchain.chain[1:]:
-        all_txs.extend(block.transactions)
-    
-    if username:
-        user_txs = [tx for tx in all_txs if tx.get("from") == username or tx.get("to") == username]
-        return jsonify(user_txs)
-        
+    for block in blockchain.chain.iter_blocks(1):
+        all_txs.extend(transaction_to_dict(tx) for tx in block.transactions)
     return jsonify(all_txs)
 
+@bp.route("/block", methods=["GET"], defaults={"block_hash": None})
+@bp.route("/block/<block_hash>", methods=["GET"])
+def get_block(block_hash):
+    """
+    ブロックを1件返す。/block/<ハッシュ> または /block?index=<ブロック番号> で指定する。
+    保存先の索引から該当ブロックだけを読み込むので、チェーン全体を取得する必要はない。
+    headers_only=1 を指定すると transactions を省いたヘッダーのみを返す。
+    """
+    blockchain = get_blockchain()
+    if block_hash is not None:
+        block = blockchain.get_block_by_hash(block_hash)
+    else:
+        index = request.args.get("index")
+        if index is None: return jsonify({"error": "ブロックのハッシュか index パラメータが必要です"}), 400
+        try:
+            index = int(index)
+        except ValueError:
+            return jsonify({"error": "index は整数で指定してください"}), 400
+        block = blockchain.get_block(index)
+    if block is None: return jsonify({"error": "ブロックが見つかりません"}), 404
+
+    headers_only = request.args.get("headers_only", "").lower() in ("1", "true", "yes")
+    return jsonify({
+        "block": block.to_dict(include_transactions=not headers_only),
+        "confirmations": blockchain.tip.index - block.index + 1
+    }), 200
+
+@bp.route("/tx_proof", methods=["GET"])
+def get_tx_proof():
+    """
+    txid で指定したトランザクションの包含証明を返す。
+    ブロックヘッダー（transactions を除いたブロック）と、txid からマークルルートまでの兄弟ノードの列を含むので、
+    クライアントはチェーン全体を取得せずに送金がブロックに含まれていることを確認できる。
+    """
+    txid = request.args.get("txid")
+    if not txid: return jsonify({"error": "txid パラメータが必要です"}), 400
+    proof = get_blockchain().get_tx_proof(txid)
+    if proof is None: return jsonify({"error": "トランザクションが見つかりません"}), 404
+    return jsonify(proof), 200
+
+def parse_time(value):
+    """UNIX時刻（秒）か ISO 8601 形式の日時を UNIX時刻にする。省略時は None、解釈できなければ ValueError"""
+    if value is None or value == "":
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+def get_stats_table():
+    """集計用の送金の表を返す。戻り値は (表, None) か、使えなければ (None, エラー応答)"""
+    if not numpy_available():
+        return None, (jsonify({"error": "集計APIには numpy が必要です（pip install numpy）"}), 501)
+    tx_table = get_blockchain().get_transaction_table()
+    if tx_table is None:
+        return None, (jsonify({"error": "集計用の表を作成中です。しばらくしてから再度お試しください。"}), 503)
+    return tx_table, None
+
+@bp.route("/stats/volume", methods=["GET"])
+def stats_volume():
+    """
+    送金件数と送金額の合計を返す。since / until（UNIX時刻か ISO 8601 形式、until は含まない）で期間を絞り込み、
+    username を指定するとそのユーザーの送金と入金に分けて返す。
+    interval=<秒> を指定すると、その間隔で区切った区間ごとの集計（buckets）も返す。
+    """
+    try:
+        since = parse_time(request.args.get("since"))
+        until = parse_time(request.args.get("until"))
+        interval = request.args.get("interval")
+        interval = float(interval) if interval is not None else None
+    except ValueError:
+        return jsonify({"error": "since, until はUNIX時刻か ISO 8601 形式、interval は秒数で指定してください"}), 400
+    tx_table, error = get_stats_table()
+    if error: return error
+    try:
+        result = tx_table.volume(since=since, until=until, username=request.args.get("username"), interval=interval)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(result), 200
+
+@bp.route("/stats/top_senders", methods=["GET"])
+def stats_top_senders():
+    """
+    送金額の合計が多い送金元を多い順に返す。since / until で期間を絞り込み、limit（既定 10）で人数を指定する。
+    """
+    try:
+        since = parse_time(request.args.get("since"))
+        until = parse_time(request.args.get("until"))
+        limit = int(request.args.get("limit", 10))
+    except ValueError:
+        return jsonify({"error": "since, until はUNIX時刻か ISO 8601 形式、limit は整数で指定してください"}), 400
+    if not 0 < limit <= MAX_TOP_SENDERS:
+        return jsonify({"error": f"limit は1以上 {MAX_TOP_SENDERS} 以下で指定してください"}), 400
+    tx_table, error = get_stats_table()
+    if error: return error
+    return jsonify({
+        "since": since,
+        "until": until,
+        "senders": tx_table.top_senders(since=since, until=until, limit=limit)
+    }), 200
+
+def is_admin_request() -> bool:
+    """運用者向けAPIの呼び出しを許可するか（ADMIN_TOKEN を参照）"""
+    if ADMIN_TOKEN:
+        return hmac.compare_digest(request.headers.get("X-Admin-Token", "").encode(), ADMIN_TOKEN.encode())
+    return request.remote_addr in ("127.0.0.1", "::1")
+
+@bp.route("/admin/reload", methods=["POST"])
+def reload_chain():
+    """運用者向け: data/ 以下のチェーンとユーザー情報をディスクから読み直す"""
+    if not is_admin_request():
+        return jsonify({"error": "このAPIは運用者のみ利用できます"}), 403
+    blockchain = reload_shared_blockchain()
+    latest_block = blockchain.get_latest_block()
+    return jsonify({
+        "message": "チェーンとユーザー情報を再読み込みしました。",
+        "length": len(blockchain.chain),
+        "latest_block_hash": latest_block.hash
+    }), 200
+
 @bp.route("/users", methods=["GET"])
 def get_user_list():
     """
     登録されている全ユーザーのリスト（ユーザー名、残高、アドレス）を返す。
+    sort=balance を指定すると残高の多い順のページ {"users": [...], "next_cursor": ...} を返し、
+    limit で件数、cursor（前回レスポンスの next_cursor）で続きを指定できる。
     """
+    sort = request.args.get("sort")
+    limit = request.args.get("limit")
+    cursor = request.args.get("cursor")
+    if sort is not None or limit is not None or cursor is not None:
+        if sort != "balance":
+            return jsonify({"error": "sort は balance のみ指定できます（limit, cursor を使う場合も sort=balance が必要です）"}), 400
+        try:
+            limit = int(limit) if limit is not None else None
+            if cursor is not None:
+                balance_part, cursor_username = cursor.split(":", 1)
+                cursor = (int(balance_part), cursor_username)
+        except ValueError:
+            return jsonify({"error": "limit は整数、cursor は '<残高>:<ユーザー名>' 形式で指定してください"}), 400
+        if limit is not None and limit <= 0:
+            return jsonify({"error": "limit は1以上で指定してください"}), 400
+
+        page, has_more = list_users_by_balance(limit=limit, cursor=cursor)
+        users = [
+            {"username": username, "balance": data.get("balance", 0), "address": data.get("address", "N/A")}
+            for username, data in page
+        ]
+        next_cursor = f"{users[-1]['balance']}:{users[-1]['username']}" if users and has_more else None
+        return jsonify({"users": users, "next_cursor": next_cursor}), 200
+
     try:
         all_users_data = load_users()
         
@@ -152,4 +591,24 @@ def get_user_list():
         
         return jsonify(user_list), 200
     except Exception as e:
-        return jsonify({"error": "ユーザーリストの取得に失敗しました。", "details": str(e)}), 500
\ No newline at end of file
+        return jsonify({"error": "ユーザーリストの取得に失敗しました。", "details": str(e)}), 500
+
+@bp.route("/metrics", methods=["GET"])
+def get_metrics():
+    """処理段階・エンドポイントごとの所要時間や拒否されたブロック数などを Prometheus のテキスト形式で返す"""
+    if not metrics.METRICS_ENABLED:
+        return jsonify({"error": "メトリクスは無効になっています（TJC_METRICS=0）"}), 404
+    blockchain = get_blockchain()
+    vk_cache = get_verifying_key_cache_stats()
+    gauges = {
+        "tjc_chain_length": ("チェーンのブロック数", len(blockchain.chain)),
+        "tjc_latest_block_index": ("最新ブロックの番号", blockchain.tip.index),
+        "tjc_users": ("登録ユーザー数", count_users()),
+        "tjc_difficulty": ("PoWの難易度", blockchain.difficulty),
+        "tjc_vk_cache_size": ("公開鍵キャッシュの件数", vk_cache["size"])
+    }
+    counters = {
+        "tjc_vk_cache_hits_total": ("公開鍵キャッシュのヒット数", vk_cache["hits"]),
+        "tjc_vk_cache_misses_total": ("公開鍵キャッシュのミス数", vk_cache["misses"])
+    }
+    return Response(metrics.render(gauges, counters), mimetype="text/plain; version=0.0.4"), 200
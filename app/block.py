@@ -1,16 +1,107 @@
 # app/block.py
 
+import sys
 import time
+from collections.abc import Mapping
 from app.utils import calculate_hash, calculate_merkle_root
+from app.metrics import timed
+
+# ブロックに格納するトランザクションのキー（この順でJSONに書き出される）
+TX_FIELDS = ("from", "to", "amount", "signature", "comment", "txid")
+
+def _pack_hex(value):
+    """小文字の16進文字列を生のバイト列にする。元の文字列に戻せない値はそのまま返す"""
+    if type(value) is not str:
+        return value
+    try:
+        raw = bytes.fromhex(value)
+    except ValueError:
+        return value
+    return raw if raw.hex() == value else value
+
+def _unpack_hex(value):
+    return value.hex() if type(value) is bytes else value
+
+class Transaction(Mapping):
+    """
+    ブロックに格納するトランザクション。
+    署名とtxidは生のバイト列、ユーザー名はインターンした文字列で保持し、
+    辞書と同じように tx['from'] / tx.get('txid') で（16進文字列として）参照できる。
+    """
+    __slots__ = ("sender", "recipient", "amount", "_signature", "comment", "_txid")
+
+    def __init__(self, sender: str, recipient: str, amount: int, signature: str, comment: str, txid: str):
+        self.sender = sys.intern(sender)
+        self.recipient = sys.intern(recipient)
+        self.amount = amount
+        self._signature = _pack_hex(signature)
+        self.comment = comment
+        self._txid = _pack_hex(txid)
+
+    @classmethod
+    def from_dict(cls, tx: dict):
+        """
+        辞書からトランザクションを作る。
+        キーの構成・順序や値の型が標準と異なるもの（旧形式など）は、書き出し結果を変えないよう辞書のまま返す。
+        """
+        if tuple(tx) != TX_FIELDS:
+            return tx
+        if not (type(tx["from"]) is str and type(tx["to"]) is str and type(tx["amount"]) is int
+                and type(tx["signature"]) is str and type(tx["comment"]) is str and type(tx["txid"]) is str):
+            return tx
+        return cls(tx["from"], tx["to"], tx["amount"], tx["signature"], tx["comment"], tx["txid"])
+
+    @property
+    def signature(self) -> str:
+        return _unpack_hex(self._signature)
+
+    @property
+    def txid(self) -> str:
+        return _unpack_hex(self._txid)
+
+    def __getitem__(self, key):
+        if key == "from": return self.sender
+        if key == "to": return self.recipient
+        if key == "amount": return self.amount
+        if key == "signature": return self.signature
+        if key == "comment": return self.comment
+        if key == "txid": return self.txid
+        raise KeyError(key)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __iter__(self):
+        return iter(TX_FIELDS)
+
+    def __len__(self):
+        return len(TX_FIELDS)
+
+    def to_dict(self) -> dict:
+        return {"from": self.sender, "to": self.recipient, "amount": self.amount,
+                "signature": self.signature, "comment": self.comment, "txid": self.txid}
+
+    def __repr__(self):
+        return f"Transaction({self.to_dict()!r})"
+
+def transaction_to_dict(tx) -> dict:
+    """Transaction でも辞書のまま保持しているトランザクションでも、JSONに書き出せる辞書にする"""
+    return tx.to_dict() if isinstance(tx, Transaction) else tx
 
 class Block:
     """
     ブロックの構造を定義するクラス
+    ハッシュ値は32バイトの生のバイト列で保持し、属性としては従来どおり16進文字列を返す。
     """
+    __slots__ = ("index", "timestamp", "transactions", "_previous_hash", "difficulty", "nonce", "_merkle_root", "_hash")
+
     def __init__(self, index, transactions, previous_hash, difficulty, timestamp=None, nonce=0, merkle_root=None, stored_hash=None):
         self.index = index
         self.timestamp = timestamp or time.time()
-        self.transactions = transactions
+        self.transactions = [Transaction.from_dict(tx) if type(tx) is dict else tx for tx in transactions]
         self.previous_hash = previous_hash
         self.difficulty = difficulty
         self.nonce = nonce
@@ -18,6 +109,62 @@ class Block:
         # ファイルから読み込む際は計算済みのハッシュを使い、新規作成時は再計算する
         self.hash = stored_hash if stored_hash is not None else self.calculate_block_hash()
 
+    @classmethod
+    def from_dict(cls, b: dict):
+        """保存先から読み込んだ to_dict() の形式の辞書からブロックを復元する（ハッシュは再計算しない）"""
+        return cls(
+            index=b['index'],
+            transactions=b['transactions'],
+            previous_hash=b['previous_hash'],
+            difficulty=b['difficulty'],
+            timestamp=b['timestamp'],
+            nonce=b['nonce'],
+            merkle_root=b['merkle_root'],
+            stored_hash=b['hash']
+        )
+
+    @property
+    def previous_hash(self) -> str:
+        return _unpack_hex(self._previous_hash)
+
+    @previous_hash.setter
+    def previous_hash(self, value):
+        self._previous_hash = _pack_hex(value)
+
+    @property
+    def merkle_root(self) -> str:
+        return _unpack_hex(self._merkle_root)
+
+    @merkle_root.setter
+    def merkle_root(self, value):
+        self._merkle_root = _pack_hex(value)
+
+    @property
+    def hash(self) -> str:
+        return _unpack_hex(self._hash)
+
+    @hash.setter
+    def hash(self, value):
+        self._hash = _pack_hex(value)
+
+    def to_dict(self, include_transactions: bool = True) -> dict:
+        """
+        保存・APIの応答に使う辞書を返す（キーの順序は従来の block.__dict__ と同じ）。
+        include_transactions=False の場合は transactions を省いたヘッダーのみを返す。
+        """
+        data = {"index": self.index, "timestamp": self.timestamp}
+        if include_transactions:
+            data["transactions"] = [transaction_to_dict(tx) for tx in self.transactions]
+        data.update({
+            "previous_hash": self.previous_hash,
+            "difficulty": self.difficulty,
+            "nonce": self.nonce,
+            "merkle_root": self.merkle_root,
+            "hash": self.hash
+        })
+        return data
+
+    @timed("calculate_block_hash")
     def calculate_block_hash(self) -> str:
         """ブロック自身のハッシュ値を計算する"""
         return calculate_hash(
@@ -37,4 +184,4 @@ class Block:
         while self.hash[:self.difficulty] != target:
             self.nonce += 1
             self.hash = self.calculate_block_hash()
-        print(f"Block Mined! (Nonce: {self.nonce}, Hash: {self.hash})")
\ No newline at end of file
+        print(f"Block Mined! (Nonce: {self.nonce}, Hash: {self.hash})")
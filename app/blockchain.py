@@ -1,103 +1,571 @@
 # app/blockchain.py
 
-import os
-import json
 import time
-from app.block import Block
-from app.user import update_balance, get_user
+import threading
+from collections import namedtuple, OrderedDict, deque
+from app.block import Block, transaction_to_dict
+from app.user import apply_balance_changes, get_user, load_users, refresh_users, reload_users, InsufficientBalanceError
+from app.storage import get_storage
+from app.checkpoint import CHECKPOINT_INTERVAL, write_checkpoint
+from app.metrics import timed, BLOCKS_ADDED, BLOCKS_REJECTED
+from app.utils import calculate_merkle_levels, merkle_branch, replay_key
+from app.bloom import ScalableBloomFilter
+from app.difficulty import (ENV_PARAMS, params_from_dict, history_size, required_difficulty, check_timestamp,
+                            is_valid_timestamp)
+from app.tx_table import TransactionTable, numpy_available
 
 # --- 定数 ---
-BLOCKCHAIN_FILE = os.path.join(os.path.dirname(__file__), '..', 'data', 'blockchain.json')
-DIFFICULTY = 4      # PoWの難易度 (先頭に0が何個並ぶか)
+MERKLE_CACHE_SIZE = 256     # マークルツリーの全レベルを保持しておくブロック数
+BLOCK_CACHE_SIZE = 1024     # 保存先から読み込んだブロックをメモリ上に保持しておく数
+SHARED_POLL_INTERVAL = 0.5  # 保存先を共有している場合、ロングポーリング中に他プロセスの追加を確認する間隔（秒）
+
+# 最新ブロックの不変スナップショット（difficulty は次のブロックに求める難易度）。
+# ブロック追加時に丸ごと差し替えるので、読み手はロック不要
+ChainTip = namedtuple("ChainTip", ["index", "hash", "difficulty"])
+
+class StaleBlockError(Exception):
+    """ブロックの previous_hash が最新ブロックと一致しない（他のブロックが先に追加された）"""
+    def __init__(self, tip: ChainTip):
+        super().__init__("前のブロックのハッシュが一致しません。チェーンが更新されています。")
+        self.tip = tip
+
+class LazyChain:
+    """
+    チェーンのブロックを、参照された時点で保存先から1件ずつ読み込むシーケンス。
+    読み込んだブロックは BLOCK_CACHE_SIZE 件までのLRUキャッシュにだけ保持するので、
+    起動時間とメモリ使用量はチェーンの長さに比例しない。list と同様に len()・添字（負数可）・スライス・for で参照できる。
+    """
+    def __init__(self, store, cache_size: int = BLOCK_CACHE_SIZE):
+        self._store = store
+        self._cache_size = cache_size
+        self._cache = OrderedDict()     # ブロック番号 -> Block
+        self._cache_lock = threading.Lock()
+        self._length = store.count()
+
+    def __len__(self):
+        return self._length
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return [self[i] for i in range(*key.indices(self._length))]
+        length = self._length
+        if key < 0:
+            key += length
+        if not 0 <= key < length:
+            raise IndexError("ブロック番号がチェーンの範囲外です")
+        with self._cache_lock:
+            block = self._cache.get(key)
+            if block is not None:
+                self._cache.move_to_end(key)
+                return block
+        record = self._store.read(key)
+        if record is None:
+            raise IndexError(f"ブロック {key} が保存先にありません")
+        block = Block.from_dict(record)
+        self._remember(block)
+        return block
+
+    def __iter__(self):
+        return self.iter_blocks()
+
+    def iter_blocks(self, start: int = 0, stop: int = None):
+        """start 以上 stop 未満のブロックを順に返す（保存先から連続して読み、キャッシュには入れない）"""
+        stop = self._length if stop is None else min(stop, self._length)
+        for record in self._store.load(start, stop):
+            yield Block.from_dict(record)
+
+    def append(self, block: Block):
+        self.extend([block])
+
+    def extend(self, blocks: list[Block]):
+        """保存先に追加したブロックを末尾に加える（直近のブロックはよく参照されるのでキャッシュしておく）"""
+        for block in blocks:
+            self._remember(block)
+        if blocks:
+            self._length = blocks[-1].index + 1
+
+    def refresh(self) -> bool:
+        """他のプロセスが保存先に追加したブロックを長さに反映する。増えていれば True"""
+        length = self._store.count()
+        if length <= self._length:
+            return False
+        self._length = length
+        return True
+
+    def _remember(self, block: Block):
+        with self._cache_lock:
+            self._cache[block.index] = block
+            self._cache.move_to_end(block.index)
+            while len(self._cache) > self._cache_size:
+                self._cache.popitem(last=False)
 
 class Blockchain:
     def __init__(self):
-        self.chain = self._load_chain()
-        self.difficulty = DIFFICULTY
-        if not self.chain:
-            self._create_genesis_block()
+        # 最新ブロックとの照合〜永続化（コミット）と再読み込みを直列化するためのロック
+        self._lock = threading.RLock()
+        # 最新ブロックが変わったことを待機中のリクエストへ知らせるための条件変数
+        self._tip_changed = threading.Condition()
+        self._storage = get_storage()
+        # ブロック番号 -> マークルツリーの全レベル（包含証明用のLRUキャッシュ）
+        self._merkle_cache = OrderedDict()
+        self._merkle_cache_lock = threading.Lock()
+        # 使用済みの署名（utils.replay_key）のブルームフィルター。作り終えるまでは保存先の索引で確かめる
+        self._seen_keys = ScalableBloomFilter()
+        self._seen_keys_ready = threading.Event()
+        # チェーンの作成時に記録した難易度のパラメータ（difficulty.ChainParams）
+        self.params = ENV_PARAMS
+        # 直近のブロックの (timestamp, difficulty)。次のブロックの難易度とタイムスタンプの検証に使う
+        self._recent = deque()
+        # 集計用の送金の列指向の表（numpy が無ければ None）。作り終えるまでは集計に使わない
+        self._tx_table = None
+        self._tx_table_ready = threading.Event()
+        self._load_state()
+
+    @property
+    def difficulty(self) -> int:
+        """次のブロックに求める難易度"""
+        return self.tip.difficulty
+
+    def reload(self):
+        """
+        ディスク上のアカウントとチェーンを読み直し、メモリ上の状態を置き換える（運用者向け）。
+        ブロックの追加・ユーザーの作成と同じロックと保存先のトランザクションの中で行い、
+        コミット途中の状態を読み込んだり、アカウントとチェーンが別の時点の内容になったりしないようにする。
+        """
+        with self._lock, self._storage.transaction():
+            reload_users()
+            self._storage.blocks.close()
+            self._load_state()
+        self._notify_tip_changed()
+
+    def _load_state(self):
+        """保存先のチェーンを開き直す（ブロックの本体は最新ブロックだけを読み込む）"""
+        with self._merkle_cache_lock:
+            self._merkle_cache.clear()
+        # 複数のプロセスが同時に起動してもジェネシスブロックが1つだけ作られるよう、書き込みとして直列化する
+        with self._storage.transaction():
+            self.chain = LazyChain(self._storage.blocks)
+            if self.chain:
+                self.params = self._load_params()
+            else:
+                # 新しいチェーンは現在の設定で作り、その値を記録する
+                self.params = ENV_PARAMS
+                self._storage.blocks.save_params(ENV_PARAMS._asdict())
+                self._create_genesis_block()
+        self._recent = deque(maxlen=history_size(self.params))
+        for block in self.chain.iter_blocks(max(0, len(self.chain) - self._recent.maxlen)):
+            self._recent.append((block.timestamp, block.difficulty))
+        self._set_tip(self.chain[-1])
+        self._start_seen_keys_build()
+        self._start_tx_table_build()
+
+    def _load_params(self):
+        """
+        保存先に記録した難易度のパラメータを返す。
+        記録が無いのは記録するようになる前に作られたチェーンなので、現在の設定で作られたものとみなして記録する。
+        """
+        stored = self._storage.blocks.load_params()
+        if stored is None:
+            print("警告: チェーンに難易度のパラメータが記録されていないため、現在の設定を記録します。")
+            self._storage.blocks.save_params(ENV_PARAMS._asdict())
+            return ENV_PARAMS
+        params = params_from_dict(stored)
+        if params != ENV_PARAMS:
+            print(f"警告: 難易度の設定（環境変数）がチェーンの作成時と異なるため、作成時の値を使います: {dict(params._asdict())}")
+        return params
+
+    def _set_tip(self, latest_block: Block):
+        """最新ブロックのスナップショットを差し替える（_recent は latest_block まで反映済みであること）"""
+        self.tip = ChainTip(latest_block.index, latest_block.hash,
+                            required_difficulty(latest_block.index + 1, list(self._recent), self.params))
+
+    def _start_seen_keys_build(self):
+        """
+        使用済みの署名のブルームフィルターを作り直す。
+        起動がチェーンの長さに比例しないよう、保存先の索引からの読み込みはバックグラウンドで行う。
+        読み込み中に追加されたブロックの分は add_blocks / sync が同じフィルターに加える。
+        """
+        seen_keys, ready = ScalableBloomFilter(), threading.Event()
+        self._seen_keys, self._seen_keys_ready = seen_keys, ready
+
+        def build():
+            try:
+                for key in self._storage.blocks.replay_keys():
+                    seen_keys.add(key)
+            except Exception as e:
+                # 作れなかった場合は常に保存先の索引で確かめる（遅くなるだけで判定は変わらない）
+                print(f"警告: 使用済みの署名のブルームフィルターを作成できませんでした: {e}")
+                return
+            ready.set()
+        threading.Thread(target=build, name="seen-keys-build", daemon=True).start()
+
+    def _start_tx_table_build(self):
+        """
+        集計用の送金の表を作り直す。起動を遅らせないよう、保存先からの読み込みはバックグラウンドで行う。
+        読み込み中に追加されたブロックは、add_blocks が追記するか、読み込みの続きで反映される。
+        """
+        if not numpy_available():
+            return
+        tx_table, ready, chain = TransactionTable(), threading.Event(), self.chain
+        self._tx_table, self._tx_table_ready = tx_table, ready
+
+        def build():
+            try:
+                tx_table.catch_up(chain)
+            except Exception as e:
+                print(f"警告: 集計用の送金の表を作成できませんでした: {e}")
+                return
+            ready.set()
+        threading.Thread(target=build, name="tx-table-build", daemon=True).start()
 
     def _create_genesis_block(self):
         """最初のブロック（ジェネシスブロック）を生成"""
         # ジェネシスブロックはPoW不要とするか、ここで計算する
-        genesis_block = Block(index=0, transactions=[], previous_hash="0", difficulty=self.difficulty, nonce=0)
+        genesis_block = Block(index=0, transactions=[], previous_hash="0", difficulty=self.params.difficulty, nonce=0)
         # ジェネシスブロックのハッシュを確定させる
         genesis_block.hash = genesis_block.calculate_block_hash()
+        self._append_block(genesis_block)
         self.chain.append(genesis_block)
-        self._save_chain()
 
     def get_latest_block(self) -> Block:
         """チェーンの最新ブロックを返す"""
         return self.chain[-1]
 
-    def add_block(self, new_block: Block) -> bool:
+    def wait_for_tip_change(self, known_hash: str, timeout: float) -> ChainTip:
+        """
+        最新ブロックのハッシュが known_hash から変わるか、timeout 秒が経過するまで待ち、
+        その時点の最新ブロックのスナップショットを返す（ロングポーリング用）。
+        """
+        if not self._storage.shared:
+            with self._tip_changed:
+                self._tip_changed.wait_for(lambda: self.tip.hash != known_hash, timeout)
+            return self.tip
+        # 他のプロセスが追加したブロックは通知されないため、一定間隔で保存先を確認する
+        deadline = time.monotonic() + timeout
+        while self.sync().hash == known_hash:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            with self._tip_changed:
+                self._tip_changed.wait_for(lambda: self.tip.hash != known_hash, min(remaining, SHARED_POLL_INTERVAL))
+        return self.tip
+
+    def sync(self) -> ChainTip:
         """
-        新しいブロックを検証し、チェーンに追加する
+        保存先を他のプロセスと共有している場合、他のプロセスが追加したブロックとアカウントの変更を取り込む。
+        共有していない場合は何もしない。最新ブロックのスナップショットを返す。
+        リクエストごとに呼ばれるので、新しいものがあるかはロックを取らずに確かめ、
+        取り込むものがある場合だけコミットと直列化する（読み取りのリクエストがコミットを待たないように）。
         """
-        latest_block = self.get_latest_block()
+        if not self._storage.shared:
+            return self.tip
+        if self._storage.blocks.count() <= len(self.chain) and not self._storage.users.has_changes():
+            return self.tip
+        with self._lock, self._storage.transaction(write=False):
+            changed = self._sync_locked()
+        if changed:
+            self._notify_tip_changed()
+        return self.tip
 
-        # 1. ブロックの基本情報を検証
-        if new_block.previous_hash != latest_block.hash:
-            print("エラー: 前のブロックのハッシュが一致しません。")
+    def _sync_locked(self) -> bool:
+        """ロック取得済みの状態で保存先から未取得のブロックを読み込む。増えたブロックがあれば True"""
+        if not self._storage.shared:
             return False
-        if new_block.index != latest_block.index + 1:
-            print("エラー: ブロックのインデックスが無効です。")
+        refresh_users()
+        known_length = len(self.chain)
+        if not self.chain.refresh():
             return False
-        
-        # 2. PoW（ハッシュの正当性）を検証
-        target = "0" * self.difficulty
-        if new_block.hash[:self.difficulty] != target:
-            print(f"エラー: PoWが無効です。ハッシュが '{target}' で始まっていません。")
+        for key in self._storage.blocks.replay_keys(from_index=known_length):
+            self._seen_keys.add(key)
+        for block in self.chain.iter_blocks(max(known_length, len(self.chain) - self._recent.maxlen)):
+            self._recent.append((block.timestamp, block.difficulty))
+        self._set_tip(self.chain[-1])
+        return True
+
+    def _notify_tip_changed(self):
+        with self._tip_changed:
+            self._tip_changed.notify_all()
+
+    def add_block(self, new_block: Block) -> bool:
+        """
+        新しいブロックを検証し、チェーンに追加する。
+        PoWとハッシュの検証はロックの外で行い、最新ブロックとの照合から永続化までだけを直列化する。
+        他のブロックが先に追加されていた場合は StaleBlockError を送出する。
+        """
+        return self.add_blocks([new_block])
+
+    def add_blocks(self, new_blocks: list[Block]) -> bool:
+        """
+        最新ブロックに続く連続した複数のブロックを検証し、全て追加するか1つも追加しない。
+        先頭ブロックが最新ブロックに続いていない場合は StaleBlockError を送出する。
+        """
+        if not new_blocks:
             return False
+        for new_block in new_blocks:
+            if not self._validate_block_contents(new_block):
+                return False
+        with self._lock:
+            try:
+                # 保存先を共有している場合は、他のプロセスの書き込みと直列化したうえで最新の状態に追いついてから照合する
+                with self._storage.transaction():
+                    self._sync_locked()
+                    added = self._commit_blocks(new_blocks)
+            except StaleBlockError:
+                raise
+            except Exception:
+                # 永続化に失敗した場合は、メモリ上の状態を保存先の内容に戻してから例外を伝える
+                reload_users()
+                self._load_state()
+                raise
+            if added:
+                self._update_tx_table(new_blocks)
+        if added:
+            BLOCKS_ADDED.inc(amount=len(new_blocks))
+            self._notify_tip_changed()
+        return added
 
-        # 3. ブロック自身のハッシュ値が、その内容から再計算したものと一致するか検証
+    @staticmethod
+    def _reject(reason: str, message: str) -> bool:
+        """ブロックを拒否した理由を表示し、理由別の件数に数える"""
+        print(f"エラー: {message}")
+        BLOCKS_REJECTED.inc(reason)
+        return False
+
+    @timed("validate_block")
+    def _validate_block_contents(self, new_block: Block) -> bool:
+        """チェーンの状態に依存しない検証（PoWとハッシュの正当性）"""
+        # 1. PoW（ハッシュの正当性）をブロック自身の難易度で検証（求める難易度との照合はコミット時に行う）
+        if type(new_block.difficulty) is not int or new_block.difficulty < 0:
+            return self._reject("invalid_difficulty", "ブロックの難易度が無効です。")
+        if not is_valid_timestamp(new_block.timestamp):
+            return self._reject("invalid_timestamp", "ブロックのタイムスタンプは数値である必要があります。")
+        target = "0" * new_block.difficulty
+        if new_block.hash[:new_block.difficulty] != target:
+            return self._reject("invalid_pow", f"PoWが無効です。ハッシュが '{target}' で始まっていません。")
+
+        # 2. ブロック自身のハッシュ値が、その内容から再計算したものと一致するか検証
         if new_block.hash != new_block.calculate_block_hash():
-            print("エラー: ブロックのハッシュ値が破損しています。")
-            return False
+            return self._reject("hash_mismatch", "ブロックのハッシュ値が破損しています。")
+        return True
+
+    @timed("commit_blocks")
+    def _commit_blocks(self, new_blocks: list[Block]) -> bool:
+        """ロック取得済みの状態で最新ブロックと照合し、残高反映・追加・永続化を行う"""
+        tip = self.tip
 
-        # 4. 検証が成功したらチェーンに追加
-        self.chain.append(new_block)
-        self._process_transactions(new_block.transactions)
-        self._save_chain()
+        # 3. 最新ブロックとの連結を検証（compare-and-append）
+        if new_blocks[0].previous_hash != tip.hash:
+            self._reject("stale_tip", "前のブロックのハッシュが一致しません。")
+            raise StaleBlockError(tip)
+        previous = tip
+        recent = list(self._recent)
+        now = time.time()
+        for new_block in new_blocks:
+            if new_block.previous_hash != previous.hash:
+                return self._reject("not_contiguous", "ブロックが連続していません。")
+            if new_block.index != previous.index + 1:
+                return self._reject("invalid_index", "ブロックのインデックスが無効です。")
+            # 難易度は直前までのブロック（同時に追加する前のブロックを含む）の間隔から決まる
+            required = required_difficulty(new_block.index, recent, self.params)
+            if new_block.difficulty != required:
+                return self._reject("wrong_difficulty", f"ブロック {new_block.index} の難易度は {required} である必要があります。")
+            reason = check_timestamp(new_block.timestamp, recent, now, self.params)
+            if reason is not None:
+                return self._reject("invalid_timestamp", f"{reason}（ブロック {new_block.index}）。")
+            recent.append((new_block.timestamp, new_block.difficulty))
+            previous = new_block
+
+        # 4. 既にチェーンに含まれている署名の再送でないことを確認
+        replayed = self.find_replayed([tx for new_block in new_blocks for tx in new_block.transactions])
+        if replayed is not None:
+            return self._reject("replayed_transaction", f"同じ署名の送金が既にチェーンに含まれています（txid: {replayed.get('txid')}）。")
+
+        # 5. 残高の増減を計算（どこかで残高不足になる場合は全ブロックを拒否）
+        try:
+            deltas = self._process_transactions([new_block.transactions for new_block in new_blocks])
+        except InsufficientBalanceError as e:
+            return self._reject("insufficient_balance", str(e))
+
+        # 6. 検証が成功したら保存先に追加（索引も保存先が更新する）。
+        #    ブロックをディスクへ確定させてから残高の変更を記録するので、ブロックの書き込みに失敗した場合は
+        #    残高の記録も残らず、呼び出し側が保存先から読み直せば元の状態に戻る
+        self._append_blocks(new_blocks)
+        if deltas:
+            apply_balance_changes(deltas, require_non_negative=True)
+        self.chain.extend(new_blocks)
+        for new_block in new_blocks:
+            for tx in new_block.transactions:
+                key = replay_key(tx.get('signature'))
+                if key:
+                    self._seen_keys.add(key)
+        for new_block in new_blocks:
+            self._recent.append((new_block.timestamp, new_block.difficulty))
+        latest_block = new_blocks[-1]
+        self._set_tip(latest_block)
+        if latest_block.index // CHECKPOINT_INTERVAL > tip.index // CHECKPOINT_INTERVAL:
+            self.write_checkpoint()
         return True
 
-    def _process_transactions(self, transactions: list):
-        """ブロック内のトランザクションを処理して残高を更新する"""
+    def _update_tx_table(self, new_blocks: list[Block]):
+        """
+        コミット済みのブロックを集計用の送金の表に追記する。
+        集計用の表の失敗でブロックの追加を取り消さないよう、保存先のトランザクションの外で行い、
+        失敗した場合は警告を表示して集計を無効にする（reload で作り直すまで集計APIは 503 を返す）。
+        """
+        tx_table = self._tx_table
+        if tx_table is None:
+            return
+        try:
+            tx_table.extend(new_blocks)
+        except Exception as e:
+            print(f"警告: 集計用の送金の表に追記できませんでした。集計を無効にします: {e}")
+            self._tx_table = None
+
+    @timed("process_transactions")
+    def _process_transactions(self, block_transactions: list[list]) -> dict:
+        """
+        ブロックごとのトランザクションを順に処理し、全ブロック分の {ユーザー名: 増減額} を返す（残高はまだ変更しない）。
+        いずれかのブロックの時点で残高が負になる場合は InsufficientBalanceError を送出する。
+        """
+        deltas = {}
+        for transactions in block_transactions:
+            for tx in transactions:
+                # マイニング報酬（COINBASE）は無いため、送金元・先の更新のみ
+                if tx.get('from') and tx.get('to'):
+                    # エラーチェックはAPI側で済んでいる前提だが、念のため
+                    if get_user(tx['from']) and get_user(tx['to']):
+                        deltas[tx['from']] = deltas.get(tx['from'], 0) - tx['amount']
+                        deltas[tx['to']] = deltas.get(tx['to'], 0) + tx['amount']
+            # 後続ブロックで入金されるとしても、各ブロックの時点で残高が足りている必要がある
+            overdrawn = [username for username, delta in deltas.items() if get_user(username)['balance'] + delta < 0]
+            if overdrawn:
+                raise InsufficientBalanceError(f"ユーザー {', '.join(overdrawn)} の残高が不足しています。")
+        return deltas
+
+    def write_checkpoint(self):
+        """最新ブロック時点の全アカウント（残高と登録情報）をチェックポイントとして書き出す"""
+        with self._lock:
+            write_checkpoint(self.get_latest_block(), load_users())
+
+    # --- 検索 ---
+    def get_block(self, index: int):
+        """ブロック番号からブロックを返す。無ければ None"""
+        if not 0 <= index < len(self.chain):
+            return None
+        return self.chain[index]
+
+    def get_block_by_hash(self, block_hash: str):
+        """ハッシュからブロックを保存先の索引で探して返す。無ければ None"""
+        index = self._storage.blocks.find_block(block_hash)
+        if index is None or index >= len(self.chain):
+            return None
+        block = self.chain[index]
+        return block if block.hash == block_hash else None
+
+    def get_transaction_table(self):
+        """
+        最新ブロックまで反映した集計用の送金の表を返す。
+        numpy が無いか、起動時の作成がまだ終わっていない場合は None。
+        """
+        tx_table = self._tx_table
+        if tx_table is None or not self._tx_table_ready.is_set():
+            return None
+        # 他のプロセスが追加したブロックは add_blocks を通らないので、ここで追記する
+        tx_table.catch_up(self.chain)
+        return tx_table
+
+    def find_replayed(self, transactions: list):
+        """
+        既にチェーンに含まれている署名を使い回したトランザクション（再送）を探し、最初に見つかったものを返す。
+        リストの中で同じ署名が2回使われている場合も再送とみなす。無ければ None。
+        ブルームフィルターに無い署名はディスクを読まずに未使用と判定し、ある場合だけ保存先の索引で確かめる。
+        """
+        keys = set()
         for tx in transactions:
-            # マイニング報酬（COINBASE）は無いため、送金元・先の更新のみ
-            if tx.get('from') and tx.get('to'):
-                sender = get_user(tx['from'])
-                recipient = get_user(tx['to'])
+            key = replay_key(tx.get('signature'))
+            if not key:
+                continue
+            if key in keys:
+                return tx
+            keys.add(key)
+            if (key in self._seen_keys or not self._seen_keys_ready.is_set()) and self._storage.blocks.find_replay(key) is not None:
+                return tx
+        return None
 
-                # エラーチェックはAPI側で済んでいる前提だが、念のため
-                if sender and recipient:
-                    update_balance(tx['from'], sender['balance'] - tx['amount'])
-                    update_balance(tx['to'], recipient['balance'] + tx['amount'])
+    def get_user_transactions(self, username: str, limit: int = None, before: tuple = None):
+        """
+        ユーザーが関係するトランザクションを保存先の索引から新しい順に取り出す。
+        before に (ブロック番号, ブロック内の位置) を渡すと、それより古いものだけを返す。
+        戻り値は ([(ブロック番号, 位置, tx), ...], さらに古いものが残っているか)。
+        """
+        locations, has_more = self._storage.blocks.user_transactions(username, limit=limit, before=before)
+        # 他のプロセスが追加したばかりで、まだこのプロセスのチェーンに反映していないものは除く
+        length = len(self.chain)
+        return [(i, pos, self.chain[i].transactions[pos]) for i, pos in locations if i < length], has_more
+
+    def get_merkle_levels(self, block: Block) -> list[list[str]]:
+        """ブロックのマークルツリーの全レベルを返す（計算結果はブロックごとにキャッシュする）"""
+        with self._merkle_cache_lock:
+            levels = self._merkle_cache.get(block.index)
+            if levels is not None:
+                self._merkle_cache.move_to_end(block.index)
+                return levels
+        levels = calculate_merkle_levels(block.transactions)
+        with self._merkle_cache_lock:
+            self._merkle_cache[block.index] = levels
+            while len(self._merkle_cache) > MERKLE_CACHE_SIZE:
+                self._merkle_cache.popitem(last=False)
+        return levels
+
+    def get_tx_proof(self, txid: str):
+        """
+        トランザクションがチェーンに含まれることの証明（ブロックヘッダーとマークルブランチ）を返す。
+        見つからなければ None。
+        """
+        location = self._storage.blocks.find_transaction(txid)
+        if location is None or location[0] >= len(self.chain):
+            return None
+        block_index, pos = location
+        block = self.chain[block_index]
+        return {
+            "txid": txid,
+            "transaction": transaction_to_dict(block.transactions[pos]),
+            "block_index": block_index,
+            "position": pos,
+            "header": block.to_dict(include_transactions=False),
+            "branch": merkle_branch(self.get_merkle_levels(block), pos),
+            "confirmations": self.tip.index - block_index + 1
+        }
 
     # --- データ永続化メソッド ---
-    def _save_chain(self):
-        chain_data = [block.__dict__ for block in self.chain]
-        self._save_data(BLOCKCHAIN_FILE, chain_data)
-
-    def _load_chain(self) -> list[Block]:
-        chain_data = self._load_data(BLOCKCHAIN_FILE, [])
-        return [Block(
-            index=b['index'],
-            transactions=b['transactions'],
-            previous_hash=b['previous_hash'],
-            difficulty=b['difficulty'],
-            timestamp=b['timestamp'],
-            nonce=b['nonce'],
-            merkle_root=b['merkle_root'],
-            stored_hash=b['hash']
-        ) for b in chain_data]
-
-    def _save_data(self, filepath, data):
-        with open(filepath, 'w') as f:
-            json.dump(data, f, indent=2)
-
-    def _load_data(self, filepath, default):
-        if not os.path.exists(filepath): return default
-        with open(filepath, 'r') as f:
-            try: return json.load(f)
-            except json.JSONDecodeError: return default
\ No newline at end of file
+    def _append_block(self, block: Block):
+        """ブロック1件を保存先の末尾に追加する（チェーン全体は書き直さない）"""
+        self._storage.blocks.append([block.to_dict()])
+
+    @timed("append_block_log")
+    def _append_blocks(self, blocks: list[Block]):
+        """複数ブロックを1回の書き込みで保存先の末尾に追加する"""
+        self._storage.blocks.append([block.to_dict() for block in blocks])
+
+
+# --- プロセス全体で共有するチェーン ---
+_shared_blockchain = None
+_shared_lock = threading.Lock()
+
+def get_shared_blockchain() -> Blockchain:
+    """
+    サーバープロセス全体で共有するBlockchainインスタンスを返す。
+    初回呼び出し時にのみファイルから読み込み、以降はメモリ上の状態を使い回す。
+    """
+    global _shared_blockchain
+    if _shared_blockchain is None:
+        with _shared_lock:
+            if _shared_blockchain is None:
+                _shared_blockchain = Blockchain()
+    return _shared_blockchain
+
+def reload_shared_blockchain() -> Blockchain:
+    """共有インスタンスをディスクの内容で読み直す（外部でファイルを差し替えた場合など）"""
+    blockchain = get_shared_blockchain()
+    blockchain.reload()
+    return blockchain
@@ -0,0 +1,74 @@
+# app/bloom.py
+#
+# ブルームフィルター。「確実に含まれていない」ことをメモリ上だけで判定するために使う。
+# 含まれている可能性があると判定された場合（偽陽性を含む）は、呼び出し側が正確な索引で確かめる。
+
+import math
+import hashlib
+import threading
+
+# --- 定数 ---
+BLOOM_INITIAL_CAPACITY = 100000   # 最初のフィルターに入れる要素数の目安
+BLOOM_ERROR_RATE = 0.001          # 偽陽性率の目標（フィルターを追加しても全体でこの値の2倍以内に収める）
+
+def _hash_pair(key: str) -> tuple[int, int]:
+    """要素から2つの64ビットのハッシュ値を作る（k個の位置は h1 + i * h2 で求める）"""
+    digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+    return int.from_bytes(digest[:8], "little"), int.from_bytes(digest[8:], "little") | 1
+
+class BloomFilter:
+    """容量と偽陽性率を指定して作る、固定サイズのブルームフィルター"""
+    def __init__(self, capacity: int, error_rate: float = BLOOM_ERROR_RATE):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.size = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))     # ビット数
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self._bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def add(self, key: str):
+        self._add_hashed(*_hash_pair(key))
+
+    def __contains__(self, key: str) -> bool:
+        return self._contains_hashed(*_hash_pair(key))
+
+    # ScalableBloomFilter が1回計算したハッシュ値を全てのフィルターで使い回すための内部メソッド
+    def _add_hashed(self, h1: int, h2: int):
+        bits, size = self._bits, self.size
+        for i in range(self.hash_count):
+            pos = (h1 + i * h2) % size
+            bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def _contains_hashed(self, h1: int, h2: int) -> bool:
+        bits, size = self._bits, self.size
+        for i in range(self.hash_count):
+            pos = (h1 + i * h2) % size
+            if not bits[pos >> 3] & (1 << (pos & 7)):
+                return False
+        return True
+
+class ScalableBloomFilter:
+    """
+    要素数が容量を超えるたびに、容量を倍・偽陽性率を半分にしたフィルターを追加していくブルームフィルター。
+    事前に要素数が分からなくても、全体の偽陽性率を BLOOM_ERROR_RATE の2倍以内に保てる。
+    """
+    def __init__(self, initial_capacity: int = BLOOM_INITIAL_CAPACITY, error_rate: float = BLOOM_ERROR_RATE):
+        self._filters = [BloomFilter(initial_capacity, error_rate / 2)]
+        self._lock = threading.Lock()
+
+    def add(self, key: str):
+        hashed = _hash_pair(key)
+        with self._lock:
+            current = self._filters[-1]
+            if current.count >= current.capacity:
+                current = BloomFilter(current.capacity * 2, current.error_rate / 2)
+                self._filters.append(current)
+            current._add_hashed(*hashed)
+
+    def __contains__(self, key: str) -> bool:
+        hashed = _hash_pair(key)
+        return any(f._contains_hashed(*hashed) for f in self._filters)
+
+    def __len__(self):
+        return sum(f.count for f in self._filters)
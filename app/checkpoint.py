@@ -0,0 +1,127 @@
+# app/checkpoint.py
+
+import os
+import sys
+import json
+import argparse
+
+from app.storage import DATA_DIR
+
+# --- 定数 ---
+CHECKPOINT_DIR = os.path.join(DATA_DIR, 'checkpoints')
+CHECKPOINT_INTERVAL = 1000  # このブロック数ごとに残高のチェックポイントを書き出す
+KEEP_CHECKPOINTS = 3        # 残しておくチェックポイントの数
+
+def _checkpoint_path(block_index: int) -> str:
+    return os.path.join(CHECKPOINT_DIR, f"checkpoint_{block_index:010d}.json")
+
+def _list_checkpoints() -> list[str]:
+    """チェックポイントファイルを新しい順に返す"""
+    if not os.path.isdir(CHECKPOINT_DIR):
+        return []
+    names = sorted((n for n in os.listdir(CHECKPOINT_DIR) if n.startswith("checkpoint_") and n.endswith(".json")), reverse=True)
+    return [os.path.join(CHECKPOINT_DIR, n) for n in names]
+
+def write_checkpoint(block, users: dict):
+    """
+    ブロック block の時点の全アカウントを、そのブロックのハッシュと一緒に書き出す。
+    残高（balances）に加えて公開鍵などの登録情報（accounts）も含めるので、users.json が失われても復元できる。
+    """
+    os.makedirs(CHECKPOINT_DIR, exist_ok=True)
+    path = _checkpoint_path(block.index)
+    balances = {username: data["balance"] for username, data in users.items()}
+    accounts = {username: {k: v for k, v in data.items() if k != "balance"} for username, data in users.items()}
+    # 複数のワーカープロセスが同時に書き出しても一時ファイルが衝突しないようにする
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({"block_index": block.index, "block_hash": block.hash, "balances": balances, "accounts": accounts}, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    # 古いチェックポイントを削除
+    for old_path in _list_checkpoints()[KEEP_CHECKPOINTS:]:
+        os.remove(old_path)
+
+def load_latest_checkpoint(chain: list):
+    """
+    チェーンと整合する最新のチェックポイントを返す（ブロックのハッシュが一致するもの）。
+    見つからなければ None。
+    """
+    for path in _list_checkpoints():
+        try:
+            with open(path, "r") as f:
+                checkpoint = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            continue
+        index = checkpoint.get("block_index")
+        if isinstance(index, int) and 0 <= index < len(chain) and chain[index].hash == checkpoint.get("block_hash"):
+            return checkpoint
+    return None
+
+def rebuild_accounts(chain, users: dict) -> dict:
+    """
+    チェーンから全アカウントの残高を再計算し、{ユーザー名: ユーザー情報} で返す。
+    最新の有効なチェックポイントに含まれるアカウントと残高を起点に、それ以降のブロックだけをメモリ上で再生する。
+    users（現在の users.json の内容。失われていれば空）は、チェックポイント以降に作成されたユーザーの
+    初期残高と、登録情報の更新にだけ使う。
+    """
+    checkpoint = load_latest_checkpoint(chain)
+    start = checkpoint["block_index"] + 1 if checkpoint else 1
+
+    accounts = {}
+    if checkpoint:
+        saved_accounts = checkpoint.get("accounts", {})
+        for username, balance in checkpoint["balances"].items():
+            accounts[username] = {**saved_accounts.get(username, {}), "balance": balance}
+    replayed = set(accounts)
+    for username, data in users.items():
+        registration = {k: v for k, v in data.items() if k != "balance"}
+        if username in accounts:
+            accounts[username].update(registration)
+        elif "initial_balance" in data:
+            accounts[username] = {**registration, "balance": data["initial_balance"]}
+            replayed.add(username)
+        else:
+            # チェックポイントにも初期残高の記録もない旧形式のユーザーは再計算できないため、現在の残高を維持する
+            print(f"警告: ユーザー '{username}' は初期残高が記録されていないため、再計算の対象外です。")
+            accounts[username] = dict(data)
+    for username, data in accounts.items():
+        if "public_key" not in data:
+            print(f"警告: ユーザー '{username}' の登録情報（公開鍵）がチェックポイントにもユーザーファイルにもありません。")
+
+    # チェーン（LazyChain）全体をまとめて読み込まないよう、保存先から順に読む
+    unknown = set()
+    for block in chain.iter_blocks(start):
+        for tx in block.transactions:
+            for username, sign in ((tx.get('from'), -1), (tx.get('to'), 1)):
+                if username in replayed:
+                    accounts[username]["balance"] += sign * tx['amount']
+                elif username:
+                    unknown.add(username)
+    if unknown:
+        print(f"警告: 次のユーザーはアカウントが見つからないため、残高を再計算できませんでした: {', '.join(sorted(unknown))}")
+
+    print(f"残高を再計算しました（起点: {'ブロック ' + str(start - 1) if checkpoint else 'ジェネシス'}、"
+          f"再生: {max(len(chain) - start, 0)} ブロック、{len(accounts)} アカウント）")
+    return accounts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="残高チェックポイントの作成とチェーンからの残高再構築")
+    parser.add_argument("command", choices=["create", "rebuild"],
+                        help="create: 現在のアカウントでチェックポイントを作成 / "
+                             "rebuild: チェックポイントとチェーンからアカウントと残高を再構築（users.json が失われていても可）")
+    args = parser.parse_args(argv)
+
+    from app.blockchain import Blockchain
+    from app.user import load_users, save_users
+    blockchain = Blockchain()
+    if args.command == "create":
+        blockchain.write_checkpoint()
+        print(f"ブロック {blockchain.get_latest_block().index} のチェックポイントを作成しました。")
+    else:
+        save_users(rebuild_accounts(blockchain.chain, load_users()))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,93 @@
+# app/difficulty.py
+#
+# 直近のブロックの間隔から、次のブロックに求めるPoWの難易度を決める（リターゲット）。
+# 環境変数 TJC_TARGET_BLOCK_INTERVAL（秒）を指定すると有効になり、RETARGET_WINDOW ブロックごとに
+# 直近 RETARGET_WINDOW 個のブロックの間隔の平均と目標を比べて難易度を見直す。
+# 難易度が1上がると必要な計算量は16倍になるので、log16(目標 / 実測) を四捨五入した段数だけ動かす
+# （実測が目標の1/4未満なら上げ、4倍を超えれば下げる）。
+# 指定しない場合は従来どおり TJC_DIFFICULTY の固定値を使う。
+# 環境変数の値はチェーンを新しく作るときにだけ使い、保存先に記録した作成時の値（ChainParams）で以降の
+# ブロックの追加とチェーン全体の検証を行う（後から設定を変えても既存のチェーンが不正にならないように）。
+
+import os
+import math
+import statistics
+from collections import namedtuple
+
+# --- 定数 ---
+DIFFICULTY = int(os.environ.get("TJC_DIFFICULTY", 4))    # PoWの難易度 (先頭に0が何個並ぶか)。リターゲット有効時は初期値
+TARGET_BLOCK_INTERVAL = float(os.environ.get("TJC_TARGET_BLOCK_INTERVAL", 0))  # 目標のブロック間隔（秒）。0 ならリターゲットしない
+RETARGET_WINDOW = max(2, int(os.environ.get("TJC_RETARGET_WINDOW", 20)))     # このブロック数ごとに、直近のこの数のブロックの間隔から見直す
+MIN_DIFFICULTY = int(os.environ.get("TJC_MIN_DIFFICULTY", 1))
+MAX_DIFFICULTY = int(os.environ.get("TJC_MAX_DIFFICULTY", 8))
+MAX_RETARGET_STEP = 2       # 1回の見直しで動かす難易度の上限
+DIFFICULTY_FACTOR = 16      # 難易度1あたりの計算量の倍率（ハッシュの16進表現の先頭の0の数で判定するため）
+MEDIAN_TIME_SPAN = 11       # タイムスタンプは直近のこの数のブロックの中央値より後であること
+MAX_FUTURE_DRIFT = 120.0    # サーバーの時刻より先のタイムスタンプを許す秒数
+
+# チェーンごとの難易度のパラメータ（チェーンの作成時に保存先へ記録する）
+ChainParams = namedtuple("ChainParams", ["difficulty", "target_block_interval", "retarget_window", "min_difficulty", "max_difficulty"])
+# 環境変数で指定した値。新しくチェーンを作る場合の初期値
+ENV_PARAMS = ChainParams(DIFFICULTY, TARGET_BLOCK_INTERVAL, RETARGET_WINDOW, MIN_DIFFICULTY, MAX_DIFFICULTY)
+
+def params_from_dict(data: dict) -> ChainParams:
+    """保存先に記録した辞書から ChainParams を作る（数値の型を揃える）"""
+    return ChainParams(int(data["difficulty"]), float(data["target_block_interval"]), max(2, int(data["retarget_window"])),
+                       int(data["min_difficulty"]), int(data["max_difficulty"]))
+
+def history_size(params: ChainParams) -> int:
+    """判定に必要な直近のブロック数"""
+    return max(params.retarget_window, MEDIAN_TIME_SPAN)
+
+def retargeting_enabled(params: ChainParams) -> bool:
+    return params.target_block_interval > 0
+
+def _clamp(difficulty: int, params: ChainParams) -> int:
+    return max(params.min_difficulty, min(params.max_difficulty, difficulty))
+
+def required_difficulty(index: int, recent: list[tuple[float, int]], params: ChainParams) -> int:
+    """
+    ブロック番号 index のブロックに求める難易度を返す。
+    recent は直前までのブロックの (timestamp, difficulty) を古い順に並べたもの（最後がブロック index - 1）で、
+    history_size(params) 件あれば足りる。見直しのタイミング以外は直前のブロックと同じ難易度になる。
+    """
+    if not retargeting_enabled(params):
+        return params.difficulty
+    current = _clamp(recent[-1][1] if recent else params.difficulty, params)
+    window_size = params.retarget_window
+    if index % window_size != 0 or len(recent) < window_size:
+        return current
+    window = recent[-window_size:]
+    observed = (window[-1][0] - window[0][0]) / (window_size - 1)
+    if observed <= 0:
+        steps = MAX_RETARGET_STEP
+    else:
+        steps = round(math.log(params.target_block_interval / observed, DIFFICULTY_FACTOR))
+    return _clamp(current + max(-MAX_RETARGET_STEP, min(MAX_RETARGET_STEP, steps)), params)
+
+def next_retarget_index(index: int, params: ChainParams):
+    """ブロック番号 index より後で、難易度が変わりうる最初のブロック番号（リターゲットしない場合は None）"""
+    if not retargeting_enabled(params):
+        return None
+    return (index // params.retarget_window + 1) * params.retarget_window
+
+def is_valid_timestamp(timestamp) -> bool:
+    """タイムスタンプが有限の数値（bool を除く int / float）かを返す"""
+    return type(timestamp) in (int, float) and math.isfinite(timestamp)
+
+def check_timestamp(timestamp, recent: list[tuple[float, int]], now: float, params: ChainParams):
+    """
+    ブロックのタイムスタンプを検証する。数値であることは常に、
+    リターゲットが有効な場合は間隔をごまかして難易度を下げられないよう、直近のブロックとサーバーの時刻との前後も確認する。
+    問題があればその理由を、なければ None を返す。
+    """
+    if not is_valid_timestamp(timestamp):
+        return "タイムスタンプは数値で指定してください"
+    if not retargeting_enabled(params):
+        return None
+    if timestamp > now + MAX_FUTURE_DRIFT:
+        return "タイムスタンプがサーバーの時刻より先です"
+    past = [ts for ts, _ in recent[-MEDIAN_TIME_SPAN:]]
+    if past and timestamp <= statistics.median(past):
+        return "タイムスタンプが直近のブロックより前です"
+    return None
@@ -0,0 +1,124 @@
+# app/metrics.py
+#
+# 処理段階ごとの所要時間・件数などの計測値を集め、Prometheus のテキスト形式で書き出す。
+# 環境変数 TJC_METRICS=0 で無効にすると、@timed は元の関数をそのまま返し、
+# observe / inc は何もしないので、計測のためのコストはほぼかからない。
+
+import os
+import time
+import bisect
+import functools
+import threading
+
+# --- 定数 ---
+METRICS_ENABLED = os.environ.get("TJC_METRICS", "1") != "0"
+# レイテンシのヒストグラムのバケット境界（秒）
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_lock = threading.Lock()
+
+class Histogram:
+    """ラベル値ごとに、バケット別の件数・合計・件数を保持するヒストグラム"""
+    def __init__(self, name: str, help_text: str, label: str, buckets: tuple = LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label = label
+        self.buckets = buckets
+        self._series = {}   # ラベル値 -> [バケットごとの件数..., +Infの件数, 合計]
+
+    def observe(self, label_value: str, value: float):
+        if not METRICS_ENABLED:
+            return
+        pos = bisect.bisect_left(self.buckets, value)
+        with _lock:
+            series = self._series.get(label_value)
+            if series is None:
+                series = self._series[label_value] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[pos] += 1
+            series[-1] += value
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with _lock:
+            snapshot = {k: list(v) for k, v in self._series.items()}
+        for label_value, series in sorted(snapshot.items()):
+            label = f'{self.label}="{_escape(label_value)}"'
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{label},le="{bound}"}} {cumulative}')
+            cumulative += series[len(self.buckets)]
+            lines.append(f'{self.name}_bucket{{{label},le="+Inf"}} {cumulative}')
+            lines.append(f"{self.name}_sum{{{label}}} {series[-1]}")
+            lines.append(f"{self.name}_count{{{label}}} {cumulative}")
+        return lines
+
+class Counter:
+    """ラベルの組ごとに増え続ける件数"""
+    def __init__(self, name: str, help_text: str, labels: tuple = ()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self._values = {}   # ラベル値のタプル -> 件数
+
+    def inc(self, *label_values, amount: int = 1):
+        if not METRICS_ENABLED:
+            return
+        with _lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with _lock:
+            snapshot = dict(self._values)
+        for label_values, value in sorted(snapshot.items()):
+            lines.append(f"{self.name}{_format_labels(self.labels, label_values)} {value}")
+        return lines
+
+
+# --- 計測項目 ---
+STAGE_DURATION = Histogram("tjc_stage_duration_seconds", "ブロック追加の各処理段階の所要時間", "stage")
+REQUEST_DURATION = Histogram("tjc_http_request_duration_seconds", "APIエンドポイントごとの処理時間", "endpoint")
+REQUESTS = Counter("tjc_http_requests_total", "APIエンドポイント・ステータスコードごとのリクエスト数", ("endpoint", "status"))
+BLOCKS_ADDED = Counter("tjc_blocks_added_total", "チェーンに追加されたブロック数")
+BLOCKS_REJECTED = Counter("tjc_blocks_rejected_total", "拒否されたブロック数（理由別）", ("reason",))
+
+_METRICS = [STAGE_DURATION, REQUEST_DURATION, REQUESTS, BLOCKS_ADDED, BLOCKS_REJECTED]
+
+def timed(stage: str):
+    """関数の所要時間を STAGE_DURATION に stage として記録するデコレーター"""
+    def decorator(func):
+        if not METRICS_ENABLED:
+            return func
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                STAGE_DURATION.observe(stage, time.perf_counter() - started)
+        return wrapper
+    return decorator
+
+def render(gauges: dict = None, counters: dict = None) -> str:
+    """
+    全ての計測値を Prometheus のテキスト形式で返す。
+    gauges には {名前: (説明, 値)} の形で、呼び出し時点の値（チェーン長など）を渡す。
+    counters も同じ形で、他のモジュールが数えている増え続ける件数を渡す（名前は _total で終えること）。
+    """
+    lines = []
+    for metric in _METRICS:
+        lines.extend(metric.render())
+    for name, (help_text, value) in (gauges or {}).items():
+        lines.extend([f"# HELP {name} {help_text}", f"# TYPE {name} gauge", f"{name} {value}"])
+    for name, (help_text, value) in (counters or {}).items():
+        lines.extend([f"# HELP {name} {help_text}", f"# TYPE {name} counter", f"{name} {value}"])
+    return "\n".join(lines) + "\n"
+
+def _format_labels(names: tuple, values: tuple) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{n}="{_escape(str(v))}"' for n, v in zip(names, values)) + "}"
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
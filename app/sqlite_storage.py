@@ -0,0 +1,473 @@
+# app/sqlite_storage.py
+#
+# SQLite（WALモード）の保存先。複数のワーカープロセスが同じデータディレクトリを共有できる。
+# 使う場合は環境変数 TJC_STORAGE=sqlite を指定する。既存のJSONファイルからの取り込み:
+#   python -m app.sqlite_storage import
+# ファイルの保存先（FileBlockStore）が使うブロックログの索引（BlockLogIndex）もここで定義する。
+
+import os
+import sys
+import json
+import sqlite3
+import argparse
+import threading
+import contextlib
+
+from app.utils import replay_key
+from app.storage import DATA_DIR, Storage, UserStore, BlockStore, FileUserStore, FileBlockStore
+
+# --- 定数 ---
+SQLITE_FILE = os.path.join(DATA_DIR, 'tjc.sqlite3')
+BUSY_TIMEOUT = 30.0     # 他のプロセスが書き込み中の場合に待つ最大秒数
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO meta (key, value) VALUES ('user_seq', 0);
+
+CREATE TABLE IF NOT EXISTS users (
+    username TEXT PRIMARY KEY,
+    balance INTEGER NOT NULL,
+    data TEXT NOT NULL,         -- 残高以外も含むユーザー情報（JSON）
+    seq INTEGER NOT NULL        -- 最後に変更したときの user_seq（他プロセスの変更の検出用）
+);
+CREATE INDEX IF NOT EXISTS users_seq ON users (seq);
+
+CREATE TABLE IF NOT EXISTS blocks (
+    idx INTEGER PRIMARY KEY,
+    hash TEXT NOT NULL UNIQUE,
+    previous_hash TEXT NOT NULL,
+    timestamp REAL NOT NULL,
+    record TEXT NOT NULL        -- to_dict() の JSON（読み込み時にそのまま復元する）
+);
+
+CREATE TABLE IF NOT EXISTS transactions (
+    block_idx INTEGER NOT NULL,
+    pos INTEGER NOT NULL,
+    txid TEXT,
+    sender TEXT,
+    recipient TEXT,
+    amount INTEGER,
+    PRIMARY KEY (block_idx, pos)
+);
+CREATE INDEX IF NOT EXISTS transactions_txid ON transactions (txid);
+-- ユーザー別の履歴を新しい順に読めるよう、ブロック番号と位置まで含める
+DROP INDEX IF EXISTS transactions_sender;
+DROP INDEX IF EXISTS transactions_recipient;
+CREATE INDEX IF NOT EXISTS transactions_sender_pos ON transactions (sender, block_idx, pos);
+CREATE INDEX IF NOT EXISTS transactions_recipient_pos ON transactions (recipient, block_idx, pos);
+
+CREATE TABLE IF NOT EXISTS replay_keys (
+    key TEXT PRIMARY KEY,       -- utils.replay_key（同じキーが複数ある場合は最初のもの）
+    block_idx INTEGER NOT NULL,
+    pos INTEGER NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS replay_keys_block ON replay_keys (block_idx);
+
+CREATE TABLE IF NOT EXISTS chain_params (
+    name TEXT PRIMARY KEY,      -- difficulty.ChainParams のフィールド名（チェーンの作成時の値）
+    value REAL NOT NULL
+);
+"""
+SCHEMA_VERSION = 1      # replay_keys を追加した版。これより古いデータベースは開くときに作り直す・補完する
+
+# ブロックログ（blockchain.jsonl）の索引。ログから作り直せるので、ログと食い違った場合は作り直す
+BLOCK_LOG_INDEX_SCHEMA = """
+CREATE TABLE IF NOT EXISTS blocks (
+    idx INTEGER PRIMARY KEY,
+    hash TEXT NOT NULL,
+    offset INTEGER NOT NULL,    -- ブロックログ内の位置（バイト）
+    length INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS blocks_hash ON blocks (hash);
+
+CREATE TABLE IF NOT EXISTS txids (
+    txid TEXT PRIMARY KEY,      -- 同じ txid が複数ある場合は最初のもの
+    block_idx INTEGER NOT NULL,
+    pos INTEGER NOT NULL
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS user_txs (
+    username TEXT NOT NULL,
+    block_idx INTEGER NOT NULL,
+    pos INTEGER NOT NULL,
+    PRIMARY KEY (username, block_idx, pos)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS replay_keys (
+    key TEXT PRIMARY KEY,
+    block_idx INTEGER NOT NULL,
+    pos INTEGER NOT NULL
+) WITHOUT ROWID;
+"""
+
+class SqliteDatabase:
+    """スレッドごとに接続を持ち、入れ子にできるトランザクションを提供する"""
+    def __init__(self, path: str = SQLITE_FILE, schema: str = SCHEMA):
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        conn = self.connection()
+        conn.executescript(schema)
+
+    def connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # isolation_level=None: トランザクションは transaction() で明示的に開始する
+            conn = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @contextlib.contextmanager
+    def transaction(self, write: bool = True):
+        """
+        write=True の場合は BEGIN IMMEDIATE で書き込みロックを取る（他プロセスのコミットと直列化される）。
+        既にトランザクション中なら外側のトランザクションに含める。
+        """
+        conn = self.connection()
+        if conn.in_transaction:
+            yield conn
+            return
+        conn.execute("BEGIN IMMEDIATE" if write else "BEGIN")
+        self._local.on_commit = []
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            self._local.on_commit = []
+            raise
+        conn.execute("COMMIT")
+        callbacks, self._local.on_commit = self._local.on_commit, []
+        for callback in callbacks:
+            callback()
+
+    def on_commit(self, callback):
+        """実行中のトランザクションがコミットされた後に callback を呼ぶ（ロールバックされた場合は呼ばない）"""
+        self._local.on_commit.append(callback)
+
+    @property
+    def version(self) -> int:
+        return self.connection().execute("PRAGMA user_version").fetchone()[0]
+
+    @version.setter
+    def version(self, value: int):
+        self.connection().execute(f"PRAGMA user_version = {int(value)}")
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        # トランザクション中（Blockchain.reload など）は閉じずに、そのまま同じ接続で読み直す
+        if conn is not None and not conn.in_transaction:
+            conn.close()
+            self._local.conn = None
+
+class SqliteUserStore(UserStore):
+    shared = True
+
+    def __init__(self, db: SqliteDatabase):
+        self.db = db
+        self._seen_seq = 0
+
+    def load(self) -> dict:
+        with self.db.transaction(write=False) as conn:
+            self._seen_seq = conn.execute("SELECT value FROM meta WHERE key = 'user_seq'").fetchone()[0]
+            rows = conn.execute("SELECT username, balance, data FROM users").fetchall()
+        return {username: {**json.loads(data), "balance": balance} for username, balance, data in rows}
+
+    def load_changes(self) -> dict:
+        conn = self.db.connection()
+        rows = conn.execute("SELECT username, balance, data, seq FROM users WHERE seq > ? ORDER BY seq",
+                            (self._seen_seq,)).fetchall()
+        if rows:
+            self._seen_seq = rows[-1][3]
+        return {username: {**json.loads(data), "balance": balance} for username, balance, data, _ in rows}
+
+    def has_changes(self) -> bool:
+        row = self.db.connection().execute("SELECT value FROM meta WHERE key = 'user_seq'").fetchone()
+        return row[0] > self._seen_seq
+
+    def _next_seq(self, conn) -> int:
+        conn.execute("UPDATE meta SET value = value + 1 WHERE key = 'user_seq'")
+        seq = conn.execute("SELECT value FROM meta WHERE key = 'user_seq'").fetchone()[0]
+        self.db.on_commit(lambda: self._mark_own_change(seq))
+        return seq
+
+    def _mark_own_change(self, seq: int):
+        """
+        自分の変更がコミットされたとき、それまでの変更を取り込み済みなら自分の変更も取り込み済みとする
+        （メモリ上には反映済みなので、has_changes が自分の変更で True にならないように）。
+        """
+        if self._seen_seq == seq - 1:
+            self._seen_seq = seq
+
+    def record_create(self, username: str, user: dict, users: dict):
+        with self.db.transaction() as conn:
+            try:
+                conn.execute("INSERT INTO users (username, balance, data, seq) VALUES (?, ?, ?, ?)",
+                             (username, user["balance"], json.dumps(user), self._next_seq(conn)))
+            except sqlite3.IntegrityError:
+                raise ValueError(f"ユーザー名 '{username}' は既に登録されています。")
+
+    def record_balances(self, balances: dict, users: dict):
+        if not balances:
+            return
+        with self.db.transaction() as conn:
+            seq = self._next_seq(conn)
+            conn.executemany("UPDATE users SET balance = ?, seq = ? WHERE username = ?",
+                             [(balance, seq, username) for username, balance in balances.items()])
+
+    def replace_all(self, users: dict):
+        with self.db.transaction() as conn:
+            seq = self._next_seq(conn)
+            conn.execute("DELETE FROM users")
+            conn.executemany("INSERT INTO users (username, balance, data, seq) VALUES (?, ?, ?, ?)",
+                             [(username, user.get("balance", 0), json.dumps(user), seq) for username, user in users.items()])
+
+    def close(self):
+        self.db.close()
+
+def _replay_rows(records: list[dict]) -> list[tuple]:
+    """ブロックの辞書の列から replay_keys に入れる (キー, ブロック番号, 位置) を作る（署名の無いものは除く）"""
+    return [(key, r["index"], pos)
+            for r in records for pos, tx in enumerate(r["transactions"])
+            for key in (replay_key(tx.get("signature")),) if key]
+
+def _user_transactions(conn, selects: list[str], params: tuple, limit: int = None, before: tuple = None):
+    """
+    ユーザーのトランザクションの (ブロック番号, 位置) を返す SELECT 文（複数なら UNION でまとめる）を
+    新しい順に limit 件まで読む。1件多く読んで、さらに古いものが残っているかを判定する。
+    """
+    condition, condition_params = ("", ()) if before is None else (" AND (block_idx, pos) < (?, ?)", tuple(before))
+    query = " UNION ".join(select + condition for select in selects) + " ORDER BY block_idx DESC, pos DESC"
+    params = sum(((param,) + condition_params for param in params), ())
+    if limit is not None:
+        query += " LIMIT ?"
+        params += (limit + 1,)
+    rows = [tuple(row) for row in conn.execute(query, params)]
+    if limit is not None and len(rows) > limit:
+        return rows[:limit], True
+    return rows, False
+
+class SqliteBlockStore(BlockStore):
+    shared = True
+
+    def __init__(self, db: SqliteDatabase):
+        self.db = db
+        if self.db.version < SCHEMA_VERSION:
+            self._upgrade()
+
+    def _upgrade(self):
+        """replay_keys が無かった版のデータベースに、保存済みのブロックから再送検出用のキーを補完する"""
+        with self.db.transaction() as conn:
+            if self.db.version >= SCHEMA_VERSION:
+                return
+            batch = []
+            for record in self.load():
+                batch.append(record)
+                if len(batch) >= 1000:
+                    conn.executemany("INSERT OR IGNORE INTO replay_keys (key, block_idx, pos) VALUES (?, ?, ?)", _replay_rows(batch))
+                    batch = []
+            conn.executemany("INSERT OR IGNORE INTO replay_keys (key, block_idx, pos) VALUES (?, ?, ?)", _replay_rows(batch))
+            self.db.version = SCHEMA_VERSION
+
+    def count(self) -> int:
+        return self.db.connection().execute("SELECT COALESCE(MAX(idx) + 1, 0) FROM blocks").fetchone()[0]
+
+    def read(self, index: int):
+        row = self.db.connection().execute("SELECT record FROM blocks WHERE idx = ?", (index,)).fetchone()
+        return json.loads(row[0]) if row is not None else None
+
+    def load(self, from_index: int = 0, to_index: int = None):
+        if to_index is None:
+            rows = self.db.connection().execute("SELECT record FROM blocks WHERE idx >= ? ORDER BY idx", (from_index,))
+        else:
+            rows = self.db.connection().execute("SELECT record FROM blocks WHERE idx >= ? AND idx < ? ORDER BY idx",
+                                                (from_index, to_index))
+        for (record,) in rows:
+            yield json.loads(record)
+
+    def append(self, records: list[dict]):
+        with self.db.transaction() as conn:
+            conn.executemany("INSERT INTO blocks (idx, hash, previous_hash, timestamp, record) VALUES (?, ?, ?, ?, ?)",
+                             [(r["index"], r["hash"], r["previous_hash"], r["timestamp"], json.dumps(r, separators=(",", ":")))
+                              for r in records])
+            conn.executemany("INSERT INTO transactions (block_idx, pos, txid, sender, recipient, amount) VALUES (?, ?, ?, ?, ?, ?)",
+                             [(r["index"], pos, tx.get("txid"), tx.get("from"), tx.get("to"), tx.get("amount"))
+                              for r in records for pos, tx in enumerate(r["transactions"])])
+            conn.executemany("INSERT OR IGNORE INTO replay_keys (key, block_idx, pos) VALUES (?, ?, ?)", _replay_rows(records))
+
+    def find_block(self, block_hash: str):
+        row = self.db.connection().execute("SELECT idx FROM blocks WHERE hash = ?", (block_hash,)).fetchone()
+        return row[0] if row is not None else None
+
+    def find_transaction(self, txid: str):
+        row = self.db.connection().execute(
+            "SELECT block_idx, pos FROM transactions WHERE txid = ? ORDER BY block_idx, pos LIMIT 1", (txid,)).fetchone()
+        return tuple(row) if row is not None else None
+
+    def user_transactions(self, username: str, limit: int = None, before: tuple = None):
+        # 送金元・送金先それぞれの索引から読み、自分宛ての送金は UNION で1件にまとめる
+        return _user_transactions(self.db.connection(),
+                                  ["SELECT block_idx, pos FROM transactions WHERE sender = ?",
+                                   "SELECT block_idx, pos FROM transactions WHERE recipient = ?"],
+                                  (username, username), limit, before)
+
+    def find_replay(self, key: str):
+        row = self.db.connection().execute("SELECT block_idx, pos FROM replay_keys WHERE key = ?", (key,)).fetchone()
+        return tuple(row) if row is not None else None
+
+    def replay_keys(self, from_index: int = 0):
+        for (key,) in self.db.connection().execute("SELECT key FROM replay_keys WHERE block_idx >= ?", (from_index,)):
+            yield key
+
+    def load_params(self):
+        rows = self.db.connection().execute("SELECT name, value FROM chain_params").fetchall()
+        return dict(rows) if rows else None
+
+    def save_params(self, params: dict):
+        with self.db.transaction() as conn:
+            conn.execute("DELETE FROM chain_params")
+            conn.executemany("INSERT INTO chain_params (name, value) VALUES (?, ?)", list(params.items()))
+
+    def close(self):
+        self.db.close()
+
+class BlockLogIndex:
+    """
+    ファイルの保存先のブロックログに対する索引。
+    ブロック番号・ハッシュからログ内の位置を、txid・ユーザー名からトランザクションの位置を引く。
+    """
+    def __init__(self, path: str):
+        self.db = SqliteDatabase(path, BLOCK_LOG_INDEX_SCHEMA)
+        if self.db.version < SCHEMA_VERSION:
+            # 古い版の索引は作り直す（FileBlockStore がブロックログの先頭から索引を作る）
+            self.clear()
+            self.db.version = SCHEMA_VERSION
+
+    def count(self) -> int:
+        return self.db.connection().execute("SELECT COALESCE(MAX(idx) + 1, 0) FROM blocks").fetchone()[0]
+
+    def last(self):
+        """最後に索引に反映したブロックの (ブロック番号, ハッシュ, 位置, バイト数)。空なら None"""
+        row = self.db.connection().execute("SELECT idx, hash, offset, length FROM blocks ORDER BY idx DESC LIMIT 1").fetchone()
+        return tuple(row) if row is not None else None
+
+    def position(self, index: int):
+        """ブロック番号 index のログ内の (位置, バイト数)。無ければ None"""
+        row = self.db.connection().execute("SELECT offset, length FROM blocks WHERE idx = ?", (index,)).fetchone()
+        return tuple(row) if row is not None else None
+
+    def add(self, entries: list[tuple[dict, int, int]]):
+        """(ブロックの辞書, ログ内の位置, バイト数) の列を索引に追加する"""
+        if not entries:
+            return
+        with self.db.transaction() as conn:
+            conn.executemany("INSERT OR REPLACE INTO blocks (idx, hash, offset, length) VALUES (?, ?, ?, ?)",
+                             [(r["index"], r["hash"], offset, length) for r, offset, length in entries])
+            conn.executemany("INSERT OR IGNORE INTO txids (txid, block_idx, pos) VALUES (?, ?, ?)",
+                             [(tx.get("txid"), r["index"], pos)
+                              for r, _, _ in entries for pos, tx in enumerate(r["transactions"]) if tx.get("txid")])
+            conn.executemany("INSERT OR IGNORE INTO user_txs (username, block_idx, pos) VALUES (?, ?, ?)",
+                             [(username, r["index"], pos)
+                              for r, _, _ in entries for pos, tx in enumerate(r["transactions"])
+                              for username in {tx.get("from"), tx.get("to")} if username])
+            conn.executemany("INSERT OR IGNORE INTO replay_keys (key, block_idx, pos) VALUES (?, ?, ?)",
+                             _replay_rows([r for r, _, _ in entries]))
+
+    def remove_from_offset(self, offset: int):
+        """ブロックログの offset バイト目以降に書かれたブロックを索引から取り除く（ログを切り詰めた場合）"""
+        with self.db.transaction() as conn:
+            first = conn.execute("SELECT MIN(idx) FROM blocks WHERE offset >= ?", (offset,)).fetchone()[0]
+            if first is None:
+                return
+            conn.execute("DELETE FROM blocks WHERE idx >= ?", (first,))
+            conn.execute("DELETE FROM txids WHERE block_idx >= ?", (first,))
+            conn.execute("DELETE FROM user_txs WHERE block_idx >= ?", (first,))
+            conn.execute("DELETE FROM replay_keys WHERE block_idx >= ?", (first,))
+
+    def clear(self):
+        with self.db.transaction() as conn:
+            conn.execute("DELETE FROM blocks")
+            conn.execute("DELETE FROM txids")
+            conn.execute("DELETE FROM user_txs")
+            conn.execute("DELETE FROM replay_keys")
+
+    def find_block(self, block_hash: str):
+        row = self.db.connection().execute("SELECT MIN(idx) FROM blocks WHERE hash = ?", (block_hash,)).fetchone()
+        return row[0]
+
+    def find_transaction(self, txid: str):
+        row = self.db.connection().execute("SELECT block_idx, pos FROM txids WHERE txid = ?", (txid,)).fetchone()
+        return tuple(row) if row is not None else None
+
+    def user_transactions(self, username: str, limit: int = None, before: tuple = None):
+        return _user_transactions(self.db.connection(), ["SELECT block_idx, pos FROM user_txs WHERE username = ?"],
+                                  (username,), limit, before)
+
+    def find_replay(self, key: str):
+        row = self.db.connection().execute("SELECT block_idx, pos FROM replay_keys WHERE key = ?", (key,)).fetchone()
+        return tuple(row) if row is not None else None
+
+    def replay_keys(self, from_index: int = 0):
+        # ファイルの保存先は1プロセス専用なので、呼ばれるのは起動時の全件読み込みだけ
+        for (key,) in self.db.connection().execute("SELECT key FROM replay_keys WHERE block_idx >= ?", (from_index,)):
+            yield key
+
+    def close(self):
+        self.db.close()
+
+class SqliteStorage(Storage):
+    """ユーザーとブロックを同じデータベースに保存し、ブロックの追加と残高の反映を1つのトランザクションで確定させる"""
+    def __init__(self, path: str = SQLITE_FILE):
+        self.db = SqliteDatabase(path)
+        super().__init__(SqliteUserStore(self.db), SqliteBlockStore(self.db))
+
+    def transaction(self, write: bool = True):
+        return self.db.transaction(write=write)
+
+
+def import_files(storage: SqliteStorage) -> tuple[int, int]:
+    """data/ 以下のJSONファイル（ブロックログ・users.json とジャーナル）の内容をSQLiteに取り込む"""
+    users = FileUserStore().load()
+    blocks = FileBlockStore()
+    with storage.transaction():
+        conn = storage.db.connection()
+        if conn.execute("SELECT COUNT(*) FROM blocks").fetchone()[0] or conn.execute("SELECT COUNT(*) FROM users").fetchone()[0]:
+            raise ValueError(f"{storage.db.path} には既にデータがあります。")
+        storage.users.replace_all(users)
+        block_count = 0
+        batch = []
+        for record in blocks.load():
+            batch.append(record)
+            if len(batch) >= 1000:
+                storage.blocks.append(batch)
+                block_count += len(batch)
+                batch = []
+        storage.blocks.append(batch)
+        block_count += len(batch)
+        params = blocks.load_params()
+        if params is not None:
+            storage.blocks.save_params(params)
+    return len(users), block_count
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="SQLiteの保存先の管理")
+    parser.add_argument("command", choices=["import"],
+                        help="import: data/ 以下のJSONファイルの内容をSQLiteに取り込む")
+    args = parser.parse_args(argv)
+
+    if args.command == "import":
+        try:
+            user_count, block_count = import_files(SqliteStorage())
+        except ValueError as e:
+            print(f"エラー: {e}")
+            return 1
+        print(f"{user_count} ユーザーと {block_count} ブロックを {SQLITE_FILE} に取り込みました。")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
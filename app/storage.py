@@ -0,0 +1,600 @@
+# app/storage.py
+
+import os
+import json
+import time
+import atexit
+import threading
+import contextlib
+
+# --- 定数 ---
+# データファイルの置き場所（ベンチマークなどで別の場所を使う場合は環境変数 TJC_DATA_DIR で指定）
+DATA_DIR = os.environ.get("TJC_DATA_DIR", os.path.join(os.path.dirname(__file__), '..', 'data'))
+FSYNC_BATCH = 16        # このレコード数が溜まったら fsync する
+FSYNC_INTERVAL = 1.0    # 最後の fsync からこの秒数が経過したら fsync する
+# 保存先の種類。"file"（JSON Lines、1プロセス専用）または "sqlite"（複数のワーカープロセスで共有可能）
+STORAGE_BACKEND = os.environ.get("TJC_STORAGE", "file")
+
+# "file" の保存先で使うファイル
+# 旧形式（チェーン全体を1つのJSON配列として保存）。初回起動時にブロックログへ移行する
+BLOCKCHAIN_FILE = os.path.join(DATA_DIR, 'blockchain.json')
+# 1ブロック1行の追記専用ログ
+BLOCK_LOG_FILE = os.path.join(DATA_DIR, 'blockchain.jsonl')
+# ブロック番号・ハッシュ・トランザクションからブロックログ内の位置を引く索引（ログから作り直せる）
+BLOCK_INDEX_FILE = os.path.join(DATA_DIR, 'blockchain.index.sqlite3')
+USERS_FILE = os.path.join(DATA_DIR, 'users.json')
+# スナップショット以降の変更を追記するジャーナル
+USERS_JOURNAL_FILE = os.path.join(DATA_DIR, 'users.journal.jsonl')
+SNAPSHOT_INTERVAL = 1000    # ジャーナルがこの件数に達したらスナップショットを取り直す
+
+class AppendOnlyLog:
+    """
+    1行1レコード（JSON Lines）の追記専用ログ。
+    追記ごとに flush してOSへは即座に渡し、fsync はまとめて行う（グループコミット）。
+    プロセスが落ちてもデータは残り、電源断の場合に失われるのは未 fsync の末尾レコードのみ。
+    """
+    def __init__(self, path: str, fsync_batch: int = FSYNC_BATCH, fsync_interval: float = FSYNC_INTERVAL):
+        self.path = path
+        self.fsync_batch = fsync_batch
+        self.fsync_interval = fsync_interval
+        self._lock = threading.Lock()
+        self._file = None
+        self._pending = 0
+        self._last_sync = time.monotonic()
+        self._timer = None
+        # fsync の直前に呼ぶ関数（このログのレコードが参照する別のログを先にディスクへ確定させる場合に設定する）
+        self.before_sync = None
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        atexit.register(self.close)
+
+    def exists(self) -> bool:
+        return os.path.exists(self.path)
+
+    # --- 書き込み ---
+    def append(self, record: dict):
+        """レコードを1件追記する"""
+        self.append_many([record])
+
+    def append_many(self, records: list[dict]) -> list[tuple[int, int]]:
+        """複数レコードを1回の write でまとめて追記し、各レコードの (ファイル内の位置, バイト数) を返す"""
+        encoded = [_encode_record(r) for r in records]
+        data = b"".join(encoded)
+        with self._lock:
+            if self._file is None:
+                self._file = open(self.path, "ab")
+            offset = self._file.tell()
+            try:
+                self._file.write(data)
+                self._file.flush()
+            except BaseException:
+                # 一部だけ書き込まれたレコードを残さない（完全な行が残ると次の起動で読み込まれてしまう）
+                self._file.close()
+                self._file = None
+                os.truncate(self.path, offset)
+                raise
+            self._pending += len(records)
+            if self._pending >= self.fsync_batch or time.monotonic() - self._last_sync >= self.fsync_interval:
+                self._sync_locked()
+            elif self._timer is None:
+                # 後続の追記が来なくても一定時間内にディスクへ確定させる
+                self._timer = threading.Timer(self.fsync_interval, self.sync)
+                self._timer.daemon = True
+                self._timer.start()
+        positions = []
+        for line in encoded:
+            positions.append((offset, len(line)))
+            offset += len(line)
+        return positions
+
+    def sync(self):
+        """未確定のレコードを fsync する"""
+        with self._lock:
+            self._sync_locked()
+
+    def _sync_locked(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self._file is not None and self._pending:
+            if self.before_sync is not None:
+                self.before_sync()
+            os.fsync(self._file.fileno())
+        self._pending = 0
+        self._last_sync = time.monotonic()
+
+    def close(self):
+        """fsync してファイルを閉じる（再読み込みやファイル差し替えの前に呼ぶ）"""
+        with self._lock:
+            self._sync_locked()
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def truncate(self, size: int):
+        """ログを size バイトに切り詰める（トランザクションの取り消し用）"""
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            if self.size() > size:
+                os.truncate(self.path, size)
+            self._pending = 0
+
+    def rewrite(self, records):
+        """ログ全体を一時ファイルに書き出してから原子的に置き換える（移行・圧縮用）"""
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            for record in records:
+                f.write(_encode_record(record))
+            f.flush()
+            os.fsync(f.fileno())
+        self.close()
+        os.replace(tmp_path, self.path)
+
+    # --- 読み込み ---
+    def read_records(self):
+        """
+        レコードを先頭から1件ずつ返すジェネレータ。
+        書き込み途中でクラッシュして末尾のレコードが壊れている場合は、その位置でファイルを切り詰める。
+        """
+        for _, _, record in self.scan():
+            yield record
+
+    def read_at(self, offset: int, length: int) -> dict:
+        """append_many が返した位置のレコードを1件読み込む"""
+        with open(self.path, "rb") as f:
+            f.seek(offset)
+            record = _decode_record(f.read(length))
+        if record is None:
+            raise ValueError(f"ログファイル '{self.path}' の {offset} バイト目のレコードを読み込めません。")
+        return record
+
+    def size(self) -> int:
+        return os.path.getsize(self.path) if self.exists() else 0
+
+    def scan(self, from_offset: int = 0, end_offset: int = None):
+        """
+        from_offset 以降のレコードを (位置, バイト数, レコード) で1件ずつ返すジェネレータ。
+        end_offset を渡すとその位置の手前で止める（追記中のレコードを読みに行かない）。
+        末尾の壊れたレコードは read_records と同じく切り詰める。
+        """
+        if not self.exists():
+            return
+        good_offset = from_offset
+        torn = False
+        with open(self.path, "rb") as f:
+            f.seek(from_offset)
+            for line in f:
+                if end_offset is not None and good_offset >= end_offset:
+                    break
+                record = _decode_record(line)
+                if record is None:
+                    if f.read(1):
+                        raise ValueError(f"ログファイル '{self.path}' の {good_offset} バイト目以降が破損しています。")
+                    torn = True
+                    break
+                yield good_offset, len(line), record
+                good_offset += len(line)
+        if torn:
+            print(f"警告: '{self.path}' の末尾の不完全なレコードを切り詰めます (offset={good_offset})。")
+            with self._lock:
+                if self._file is not None:
+                    self._file.close()
+                    self._file = None
+                os.truncate(self.path, good_offset)
+
+
+def _encode_record(record: dict) -> bytes:
+    return json.dumps(record, separators=(",", ":")).encode() + b"\n"
+
+def _decode_record(line: bytes):
+    """1行分をデコードする。改行で終わっていない・JSONとして壊れている場合は None"""
+    if not line.endswith(b"\n"):
+        return None
+    try:
+        return json.loads(line)
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        return None
+
+
+# --- 保存先のインターフェース ---
+# メモリ上の状態（チェーン・アカウント）は app/blockchain.py と app/user.py が持ち、
+# ここでは変更の永続化と、起動時・他プロセスの変更の読み込みだけを扱う。
+
+class UserStore:
+    """アカウント状態の保存先"""
+    # 他のプロセスと同じデータを共有しているか（True なら load_changes で他プロセスの変更を取り込む）
+    shared = False
+
+    def load(self) -> dict:
+        """全ユーザーを {ユーザー名: ユーザー情報} で返す"""
+        raise NotImplementedError
+
+    def record_create(self, username: str, user: dict, users: dict):
+        """ユーザーの作成を記録する。users はメモリ上の全ユーザー（スナップショットを取る保存先で使う）"""
+        raise NotImplementedError
+
+    def record_balances(self, balances: dict, users: dict):
+        """{ユーザー名: 新しい残高} を記録する"""
+        raise NotImplementedError
+
+    def replace_all(self, users: dict):
+        """全ユーザーをまとめて置き換える"""
+        raise NotImplementedError
+
+    def snapshot(self, users: dict):
+        """現在の状態を書き出し、起動時の読み込みを速くする（必要な保存先のみ）"""
+
+    def flush(self, users: dict):
+        """終了時に呼ばれる。未確定の変更があれば確定させる"""
+
+    def load_changes(self) -> dict:
+        """前回の呼び出し以降に（他のプロセスが）作成・変更したユーザーを返す"""
+        return {}
+
+    def has_changes(self) -> bool:
+        """load_changes で取り込むべき変更があるか（安く確かめられる方法で）"""
+        return False
+
+    def close(self):
+        """再読み込みの前に呼ばれる"""
+
+class BlockStore:
+    """
+    ブロックの保存先。ブロックは to_dict() の形式の辞書で受け渡す。
+    ブロック番号・ハッシュ・トランザクションからの検索は保存先の索引で行い、チェーン全体をメモリに載せない。
+    """
+    shared = False
+
+    def count(self) -> int:
+        """保存されているブロック数"""
+        raise NotImplementedError
+
+    def read(self, index: int):
+        """ブロック番号 index のブロックを返す（無ければ None）"""
+        raise NotImplementedError
+
+    def load(self, from_index: int = 0, to_index: int = None):
+        """from_index 以上 to_index 未満（省略時は末尾まで）のブロックを先頭から順に返す"""
+        raise NotImplementedError
+
+    def append(self, records: list[dict]):
+        """ブロックを末尾に追加し、索引にも反映する"""
+        raise NotImplementedError
+
+    def find_block(self, block_hash: str):
+        """ハッシュからブロック番号を返す（無ければ None）"""
+        raise NotImplementedError
+
+    def find_transaction(self, txid: str):
+        """txid から (ブロック番号, ブロック内の位置) を返す。同じ txid が複数ある場合は最初のもの"""
+        raise NotImplementedError
+
+    def user_transactions(self, username: str, limit: int = None, before: tuple = None):
+        """
+        ユーザーが送金元・送金先のトランザクションの (ブロック番号, 位置) を新しい順に返す。
+        before を渡すとそれより古いものだけを返す。戻り値は ([(ブロック番号, 位置), ...], さらに古いものが残っているか)。
+        """
+        raise NotImplementedError
+
+    def find_replay(self, key: str):
+        """再送検出用のキー（utils.replay_key）を最初に使ったトランザクションの (ブロック番号, 位置) を返す（無ければ None）"""
+        raise NotImplementedError
+
+    def replay_keys(self, from_index: int = 0):
+        """from_index 以降のブロックに含まれるトランザクションの再送検出用のキーを返す"""
+        raise NotImplementedError
+
+    def load_params(self):
+        """チェーンの作成時に記録した難易度のパラメータ（difficulty.ChainParams の辞書）を返す（無ければ None）"""
+        raise NotImplementedError
+
+    def save_params(self, params: dict):
+        """難易度のパラメータを記録する（チェーンの作成時に1度だけ呼ばれる）"""
+        raise NotImplementedError
+
+    def close(self):
+        """再読み込みの前に呼ばれる"""
+
+class Storage:
+    """ブロックとアカウントの保存先の組"""
+    def __init__(self, users: UserStore, blocks: BlockStore):
+        self.users = users
+        self.blocks = blocks
+
+    @property
+    def shared(self) -> bool:
+        return self.users.shared or self.blocks.shared
+
+    def transaction(self, write: bool = True):
+        """
+        この中で行った書き込みを1つのトランザクションとして確定させる。
+        write=True の場合は他の書き込みと直列化され、途中で例外が発生した場合は中の書き込みを取り消す。
+        基底クラスでは何もしない（SqliteStorage と FileStorage が実装する）。
+        """
+        return contextlib.nullcontext()
+
+
+# --- ファイル（JSON Lines）の保存先 ---
+class FileUserStore(UserStore):
+    """users.json（スナップショット）と、それ以降の変更を追記するジャーナルにアカウント状態を保存する"""
+    def __init__(self, snapshot_path: str = USERS_FILE, journal_path: str = USERS_JOURNAL_FILE,
+                 snapshot_interval: int = SNAPSHOT_INTERVAL):
+        self.snapshot_path = snapshot_path
+        self.snapshot_interval = snapshot_interval
+        self._journal = AppendOnlyLog(journal_path)
+        self._journal_entries = 0
+        self._snapshots = 0     # スナップショットを取った回数（取り消せる範囲の判定用）
+        self._sync_first = None # ジャーナル・スナップショットを fsync する前に呼ぶ関数（sync_after で設定する）
+
+    def load(self) -> dict:
+        users = self._read_snapshot()
+        entries = 0
+        for record in self._journal.read_records():
+            self._apply_journal_record(users, record)
+            entries += 1
+        self._journal_entries = entries
+        return users
+
+    def _read_snapshot(self) -> dict:
+        if not os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path, "w") as f:
+                json.dump({}, f)
+            return {}
+        with open(self.snapshot_path, "r") as f:
+            try:
+                return json.load(f)
+            except json.JSONDecodeError:
+                return {}
+
+    @staticmethod
+    def _apply_journal_record(users: dict, record: dict):
+        """ジャーナルの1レコードを適用する（値は差分ではなく絶対値なので、二重適用しても結果は同じ）"""
+        if record["op"] == "create":
+            users[record["username"]] = record["user"]
+        elif record["op"] == "balances":
+            for username, balance in record["balances"].items():
+                if username in users:
+                    users[username]["balance"] = balance
+
+    def record_create(self, username: str, user: dict, users: dict):
+        self._write_journal({"op": "create", "username": username, "user": dict(user)}, users)
+
+    def record_balances(self, balances: dict, users: dict):
+        self._write_journal({"op": "balances", "balances": balances}, users)
+
+    def _write_journal(self, record: dict, users: dict):
+        """ジャーナルに追記し、必要ならスナップショットを取る"""
+        self._journal.append(record)
+        self._journal_entries += 1
+        if self._journal_entries >= self.snapshot_interval:
+            self.snapshot(users)
+
+    def replace_all(self, users: dict):
+        self.snapshot(users)
+
+    def snapshot(self, users: dict):
+        """users.json を原子的に書き直し、ジャーナルを空にする"""
+        if self._sync_first is not None:
+            self._sync_first()
+        tmp_path = self.snapshot_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(users, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.snapshot_path)
+        self._journal.rewrite([])
+        self._journal_entries = 0
+        self._snapshots += 1
+
+    def flush(self, users: dict):
+        if self._journal_entries:
+            self.snapshot(users)
+
+    def close(self):
+        self._journal.close()
+
+    def sync_after(self, callback):
+        """ジャーナルとスナップショットを fsync する前に callback を呼ぶ（FileStorage がブロックログの fsync を設定する）"""
+        self._sync_first = callback
+        self._journal.before_sync = callback
+
+    def savepoint(self):
+        return self._snapshots, self._journal.size(), self._journal_entries
+
+    def rollback(self, savepoint):
+        """savepoint() 以降にジャーナルへ追記した変更を取り消す"""
+        snapshots, size, entries = savepoint
+        if snapshots != self._snapshots:
+            # 途中でスナップショットを取った場合、users.json に反映済みの変更は取り消せない
+            print("警告: トランザクション中にスナップショットを取ったため、アカウントの変更を取り消せません。")
+            return
+        self._journal.truncate(size)
+        self._journal_entries = entries
+
+class FileBlockStore(BlockStore):
+    """
+    1ブロック1行の追記専用ログにブロックを保存する。
+    ブロック番号・ハッシュ・トランザクションからログ内の位置を引く索引を別ファイル（SQLite）に持ち、
+    起動時は前回索引に反映した位置以降のログだけを読む。
+    """
+    def __init__(self, path: str = BLOCK_LOG_FILE, legacy_path: str = BLOCKCHAIN_FILE, index_path: str = BLOCK_INDEX_FILE):
+        from app.sqlite_storage import BlockLogIndex
+        self._log = AppendOnlyLog(path)
+        # 難易度のパラメータはブロックログと同じ場所の blockchain.params.json に記録する
+        self._params_path = os.path.splitext(path)[0] + ".params.json"
+        self._migrate_legacy_chain(legacy_path)
+        self._index = BlockLogIndex(index_path)
+        self._index_lock = threading.Lock()
+        self._index_checked = False
+
+    def _checked_index(self):
+        """索引がログの末尾まで反映されていることを（close 後の初回だけ）確認して返す"""
+        if not self._index_checked:
+            with self._index_lock:
+                if not self._index_checked:
+                    self._catch_up_index()
+                    self._index_checked = True
+        return self._index
+
+    def _catch_up_index(self):
+        """索引の最後のブロックがログと一致していれば続きだけを、一致しなければ最初から索引を作る"""
+        last = self._index.last()
+        start_offset = 0
+        if last is not None:
+            index, block_hash, offset, length = last
+            try:
+                valid = offset + length <= self._log.size() and self._log.read_at(offset, length)["hash"] == block_hash
+            except ValueError:
+                valid = False
+            if valid:
+                start_offset = offset + length
+            else:
+                print("警告: ブロックの索引がブロックログと一致しないため、作り直します。")
+                self._index.clear()
+        batch = []
+        for offset, length, record in self._log.scan(start_offset):
+            batch.append((record, offset, length))
+            if len(batch) >= 1000:
+                self._index.add(batch)
+                batch = []
+        self._index.add(batch)
+
+    def count(self) -> int:
+        return self._checked_index().count()
+
+    def read(self, index: int):
+        position = self._checked_index().position(index)
+        return self._log.read_at(*position) if position is not None else None
+
+    def load(self, from_index: int = 0, to_index: int = None):
+        index = self._checked_index()
+        to_index = index.count() if to_index is None else min(to_index, index.count())
+        if from_index >= to_index:
+            return
+        start, _ = index.position(from_index)
+        last_offset, last_length = index.position(to_index - 1)
+        for _, _, record in self._log.scan(start, last_offset + last_length):
+            yield record
+
+    def append(self, records: list[dict]):
+        index = self._checked_index()
+        positions = self._log.append_many(records)
+        index.add([(record, offset, length) for record, (offset, length) in zip(records, positions)])
+
+    def sync(self):
+        """ブロックログの未確定の追記を fsync する"""
+        self._log.sync()
+
+    def find_block(self, block_hash: str):
+        return self._checked_index().find_block(block_hash)
+
+    def find_transaction(self, txid: str):
+        return self._checked_index().find_transaction(txid)
+
+    def user_transactions(self, username: str, limit: int = None, before: tuple = None):
+        return self._checked_index().user_transactions(username, limit, before)
+
+    def find_replay(self, key: str):
+        return self._checked_index().find_replay(key)
+
+    def replay_keys(self, from_index: int = 0):
+        return self._checked_index().replay_keys(from_index)
+
+    def load_params(self):
+        if not os.path.exists(self._params_path):
+            return None
+        with open(self._params_path, "r") as f:
+            return json.load(f)
+
+    def save_params(self, params: dict):
+        tmp_path = self._params_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(params, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self._params_path)
+
+    def close(self):
+        self._log.close()
+        self._index.close()
+        self._index_checked = False
+
+    def savepoint(self):
+        return self._log.size()
+
+    def rollback(self, savepoint):
+        """savepoint() 以降に追加したブロックをログと索引から取り除く"""
+        self._log.truncate(savepoint)
+        if self._index_checked:
+            self._index.remove_from_offset(savepoint)
+
+    def _migrate_legacy_chain(self, legacy_path: str):
+        """旧形式の blockchain.json が残っていれば、一度だけブロックログへ移行する"""
+        if self._log.exists() or not os.path.exists(legacy_path):
+            return
+        with open(legacy_path, 'r') as f:
+            try: chain_data = json.load(f)
+            except json.JSONDecodeError: chain_data = []
+        self._log.rewrite(chain_data)
+        os.replace(legacy_path, legacy_path + ".migrated")
+        print(f"{len(chain_data)} ブロックを {legacy_path} からブロックログへ移行しました。")
+
+
+class FileStorage(Storage):
+    """
+    ファイルの保存先。書き込みのトランザクションはプロセス内で直列化し、
+    途中で例外が発生した場合はブロックログとアカウントのジャーナルを開始時点の長さに切り詰めて取り消す。
+    """
+    def __init__(self, users: FileUserStore, blocks: FileBlockStore):
+        super().__init__(users, blocks)
+        # 残高のジャーナルを fsync する前にブロックログを fsync する。どちらもグループコミットのまま、
+        # ディスクに確定した残高の変更には、その元になったブロックが必ず先に確定しているようにする
+        users.sync_after(blocks.sync)
+        self._write_lock = threading.RLock()
+        self._local = threading.local()
+
+    @contextlib.contextmanager
+    def transaction(self, write: bool = True):
+        if not write:
+            yield
+            return
+        with self._write_lock:
+            if getattr(self._local, "depth", 0):
+                # 既にトランザクション中なら外側のトランザクションに含める
+                self._local.depth += 1
+                try:
+                    yield
+                finally:
+                    self._local.depth -= 1
+                return
+            savepoint = (self.users.savepoint(), self.blocks.savepoint())
+            self._local.depth = 1
+            try:
+                yield
+            except BaseException:
+                self.blocks.rollback(savepoint[1])
+                self.users.rollback(savepoint[0])
+                raise
+            finally:
+                self._local.depth = 0
+
+
+# --- プロセス全体で共有する保存先 ---
+_storage = None
+_storage_lock = threading.Lock()
+
+def get_storage() -> Storage:
+    """STORAGE_BACKEND（環境変数 TJC_STORAGE）で選んだ保存先を返す"""
+    global _storage
+    if _storage is None:
+        with _storage_lock:
+            if _storage is None:
+                if STORAGE_BACKEND == "sqlite":
+                    from app.sqlite_storage import SqliteStorage
+                    _storage = SqliteStorage()
+                elif STORAGE_BACKEND == "file":
+                    _storage = FileStorage(FileUserStore(), FileBlockStore())
+                else:
+                    raise ValueError(f"不明な保存先です: TJC_STORAGE={STORAGE_BACKEND}（file または sqlite）")
+    return _storage
@@ -0,0 +1,207 @@
+# app/tx_table.py
+#
+# 集計用に、チェーン上の全ての送金を列ごとの NumPy 配列（送金元・送金先のユーザーID、金額、ブロック番号、タイムスタンプ）で保持する表。
+# 期間や送金元ごとの集計を、ブロックの transactions の dict を走査せずにベクトル演算で行える。
+# numpy は任意の依存で、インストールされていない場合は集計APIが使えないだけで、他の機能には影響しない。
+
+import threading
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# --- 定数 ---
+TX_TABLE_INITIAL_CAPACITY = 4096    # 最初に確保する行数（足りなくなるたびに倍にする）
+TX_TABLE_BUILD_BATCH = 1000         # 表を作る際に、保存先から一度に読み込むブロック数
+MAX_STATS_BUCKETS = 1000            # 期間ごとの集計で返せる区間数の上限
+
+# 列名 -> 型
+COLUMNS = {
+    "sender": "int32",          # 送金元のユーザーID
+    "recipient": "int32",       # 送金先のユーザーID
+    "amount": "float64",        # 金額（旧形式の小数の金額も扱えるよう float64）
+    "block_index": "int64",
+    "timestamp": "float64"      # ブロックのタイムスタンプ
+}
+
+def numpy_available() -> bool:
+    return np is not None
+
+def _number(value):
+    """集計結果を JSON で返せる数値にする（整数になる金額は int で返す）"""
+    value = float(value)
+    return int(value) if value.is_integer() else value
+
+class TransactionTable:
+    """
+    送金を1行とする列指向の表。ブロック番号の順に追記していき、block_count までのブロックを反映済みとする。
+    追記は extend() で行い、別のスレッドからの集計は追記と並行して行える
+    （集計は開始時点の行数までの配列のビューだけを参照し、配列を拡張する場合は新しい配列に置き換えるため）。
+    """
+    def __init__(self, capacity: int = TX_TABLE_INITIAL_CAPACITY):
+        if np is None:
+            raise RuntimeError("TransactionTable には numpy が必要です")
+        self._lock = threading.Lock()
+        self._columns = {name: np.empty(capacity, dtype=dtype) for name, dtype in COLUMNS.items()}
+        self._size = 0
+        self._user_ids = {}     # ユーザー名 -> ユーザーID
+        self._usernames = []    # ユーザーID -> ユーザー名
+        self.block_count = 0    # 反映済みのブロック数（次に反映するブロック番号）
+
+    def __len__(self):
+        return self._size
+
+    def _user_id(self, username: str) -> int:
+        user_id = self._user_ids.get(username)
+        if user_id is None:
+            user_id = self._user_ids[username] = len(self._usernames)
+            self._usernames.append(username)
+        return user_id
+
+    def _reserve(self, rows: int):
+        """ロック取得済みの状態で、rows 行を追記できるよう配列を拡張する"""
+        capacity = len(self._columns["amount"])
+        if self._size + rows <= capacity:
+            return
+        while capacity < self._size + rows:
+            capacity *= 2
+        for name, column in self._columns.items():
+            grown = np.empty(capacity, dtype=column.dtype)
+            grown[:self._size] = column[:self._size]
+            self._columns[name] = grown
+
+    def extend(self, blocks: list) -> bool:
+        """
+        ブロック番号 block_count から連続するブロックの送金を追記する。
+        先頭のブロックが block_count に続いていない場合は（既に反映済みか、間が抜けているので）何もせず False を返す。
+        """
+        if not blocks:
+            return False
+        with self._lock:
+            if blocks[0].index != self.block_count:
+                return False
+            rows = [
+                (self._user_id(tx['from']), self._user_id(tx['to']), tx['amount'], block.index, block.timestamp)
+                for block in blocks for tx in block.transactions
+                if tx.get('from') and tx.get('to')
+            ]
+            if rows:
+                self._reserve(len(rows))
+                start, stop = self._size, self._size + len(rows)
+                for name, values in zip(COLUMNS, zip(*rows)):
+                    self._columns[name][start:stop] = values
+                self._size = stop
+            self.block_count = blocks[-1].index + 1
+        return True
+
+    def catch_up(self, chain):
+        """チェーン（LazyChain）のうち、まだ反映していないブロックを保存先から読み込んで追記する"""
+        while True:
+            start = self.block_count
+            stop = min(start + TX_TABLE_BUILD_BATCH, len(chain))
+            if start >= stop:
+                return
+            # 読み込んでいる間に add_blocks が同じブロックを追記していた場合は extend が無視する
+            self.extend(list(chain.iter_blocks(start, stop)))
+
+    def _snapshot(self):
+        """
+        現在の行数までの各列のビューを返す（以降の追記の影響を受けない）。
+        ユーザーIDとユーザー名の対応は追加しかされないので、ロックを取らずに参照してよい。
+        """
+        with self._lock:
+            size = self._size
+            return {name: column[:size] for name, column in self._columns.items()}
+
+    @staticmethod
+    def _time_mask(columns: dict, since: float = None, until: float = None):
+        """タイムスタンプが since 以上 until 未満の行を表す真偽値の配列（条件が無ければ None）"""
+        mask = None
+        if since is not None:
+            mask = columns["timestamp"] >= since
+        if until is not None:
+            before = columns["timestamp"] < until
+            mask = before if mask is None else mask & before
+        return mask
+
+    def volume(self, since: float = None, until: float = None, username: str = None, interval: float = None) -> dict:
+        """
+        期間内の送金件数と送金額の合計を返す。
+        username を指定するとそのユーザーの送金（sent）と入金（received）に分けて返す。
+        interval（秒）を指定すると、since（省略時は期間内で最も古い送金）から interval ごとの区間に分けた集計も返す。
+        区間が MAX_STATS_BUCKETS を超える場合は ValueError を送出する。
+        """
+        columns = self._snapshot()
+        mask = self._time_mask(columns, since, until)
+        # 期間で絞り込むのは使う列だけにする
+        names = ["amount"]
+        if username is not None:
+            names += ["sender", "recipient"]
+        if interval is not None:
+            names.append("timestamp")
+        columns = {name: columns[name] if mask is None else columns[name][mask] for name in names}
+
+        result = {"since": since, "until": until}
+        amount = columns["amount"]
+        if username is None:
+            result.update({"transfers": int(len(amount)), "volume": _number(amount.sum())})
+            selected = None
+        else:
+            user_id = self._user_ids.get(username, -1)
+            sent = columns["sender"] == user_id
+            received = columns["recipient"] == user_id
+            result.update({
+                "username": username,
+                "sent": {"transfers": int(sent.sum()), "volume": _number(amount[sent].sum())},
+                "received": {"transfers": int(received.sum()), "volume": _number(amount[received].sum())}
+            })
+            selected = sent | received
+
+        if interval is not None:
+            timestamps = columns["timestamp"]
+            if selected is not None:
+                timestamps, amount = timestamps[selected], amount[selected]
+            result["interval"] = interval
+            result["buckets"] = self._buckets(timestamps, amount, interval, since, until)
+        return result
+
+    @staticmethod
+    def _buckets(timestamps, amount, interval: float, since: float = None, until: float = None) -> list[dict]:
+        if interval <= 0:
+            raise ValueError("interval は正の数で指定してください")
+        if not len(timestamps):
+            return []
+        origin = since if since is not None else float(timestamps.min()) // interval * interval
+        end = until if until is not None else float(timestamps.max()) + interval
+        bucket_count = int(np.ceil((end - origin) / interval))
+        if bucket_count > MAX_STATS_BUCKETS:
+            raise ValueError(f"区間の数が多すぎます（上限 {MAX_STATS_BUCKETS}）。interval を大きくするか期間を狭めてください")
+        positions = ((timestamps - origin) // interval).astype(np.int64)
+        counts = np.bincount(positions, minlength=bucket_count)
+        volumes = np.bincount(positions, weights=amount, minlength=bucket_count)
+        return [
+            {"start": origin + i * interval, "transfers": int(counts[i]), "volume": _number(volumes[i])}
+            for i in range(bucket_count)
+        ]
+
+    def top_senders(self, since: float = None, until: float = None, limit: int = 10) -> list[dict]:
+        """期間内の送金額の合計が多い送金元を、多い順に最大 limit 人返す"""
+        columns = self._snapshot()
+        mask = self._time_mask(columns, since, until)
+        senders, amount = columns["sender"], columns["amount"]
+        if mask is not None:
+            senders, amount = senders[mask], amount[mask]
+        if not len(senders):
+            return []
+        totals = np.bincount(senders, weights=amount)
+        counts = np.bincount(senders)
+        active = np.flatnonzero(counts)
+        if len(active) > limit:
+            # 上位 limit 人だけを部分ソートで選んでから並べる
+            active = active[np.argpartition(-totals[active], limit - 1)[:limit]]
+        order = active[np.lexsort((active, -totals[active]))]
+        return [
+            {"username": self._usernames[user_id], "volume": _number(totals[user_id]), "transfers": int(counts[user_id])}
+            for user_id in order
+        ]
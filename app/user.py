@@ -1,50 +1,135 @@
 # app/user.py
 
-import json
-import os
-
-# USERS_FILEのパス設定を修正
-USERS_FILE = os.path.join(os.path.dirname(__file__), '..', 'data', 'users.json')
+import atexit
+import bisect
+import threading
+
+from app.storage import get_storage
+from app.metrics import timed
+
+# --- メモリ上のアカウント状態 ---
+# 残高は常にメモリ上で参照・更新し、変更は保存先（app/storage.py）へ記録する
+_users = None
+# 残高の多い順（同額ならユーザー名順）に並べた (-残高, ユーザー名) のリスト。残高の変更時に差分だけ更新する
+_balance_index = []
+_lock = threading.RLock()
+
+class InsufficientBalanceError(ValueError):
+    """残高変更を反映すると残高が負になる"""
+
+def _store():
+    return get_storage().users
+
+def _ensure_loaded() -> dict:
+    """初回アクセス時に保存先からアカウント状態を復元する"""
+    global _users
+    if _users is not None:
+        return _users
+    with _lock:
+        if _users is None:
+            users = _store().load()
+            _rebuild_balance_index(users)
+            _users = users
+    return _users
+
+def _rebuild_balance_index(users: dict):
+    global _balance_index
+    _balance_index = sorted((-data.get("balance", 0), username) for username, data in users.items())
+
+def _set_balance(users: dict, username: str, balance: int):
+    """ロック取得済みの状態で残高を変更し、残高順の索引を更新する"""
+    old_key = (-users[username].get("balance", 0), username)
+    pos = bisect.bisect_left(_balance_index, old_key)
+    if pos < len(_balance_index) and _balance_index[pos] == old_key:
+        del _balance_index[pos]
+    bisect.insort(_balance_index, (-balance, username))
+    users[username]["balance"] = balance
+
+def refresh_users():
+    """
+    保存先を他のプロセスと共有している場合、他のプロセスが作成・変更したユーザーをメモリ上に取り込む。
+    共有していない場合は何もしない。
+    """
+    store = _store()
+    if not store.shared:
+        return
+    users = _ensure_loaded()
+    with _lock:
+        for username, user in store.load_changes().items():
+            if username in users:
+                _set_balance(users, username, user["balance"])
+                users[username].update(user)
+            else:
+                users[username] = user
+                bisect.insort(_balance_index, (-user.get("balance", 0), username))
 
 # ユーザーデータの読み込み・保存
+@timed("load_users")
 def load_users():
-    if not os.path.exists(USERS_FILE):
-        with open(USERS_FILE, "w") as f:
-            json.dump({}, f)
-        return {}
-    with open(USERS_FILE, "r") as f:
-        try:
-            return json.load(f)
-        except json.JSONDecodeError:
-            return {}
+    """全ユーザーのコピーを返す（ディスクは読まない）"""
+    users = _ensure_loaded()
+    with _lock:
+        return {username: dict(data) for username, data in users.items()}
+
+def count_users() -> int:
+    """登録ユーザー数を返す（コピーは作らない）"""
+    return len(_ensure_loaded())
 
 def save_users(users):
-    with open(USERS_FILE, "w") as f:
-        json.dump(users, f, indent=2)
+    """全ユーザーをまとめて置き換える"""
+    global _users
+    from app.wallet import invalidate_verifying_key
+    with _lock:
+        _users = {username: dict(data) for username, data in users.items()}
+        _rebuild_balance_index(_users)
+        _store().replace_all(_users)
+    invalidate_verifying_key()
+
+def reload_users():
+    """メモリ上の状態を破棄し、次回アクセス時にディスクから読み直す"""
+    global _users
+    from app.wallet import invalidate_verifying_key
+    with _lock:
+        _store().close()
+        _users = None
+    invalidate_verifying_key()
+    _ensure_loaded()
 
 # ユーザー登録
 def create_user(username: str, public_key_hex: str, initial_balance: int):
-    users = load_users()
-
-    if username in users:
-        raise ValueError(f"ユーザー名 '{username}' は既に登録されています。")
+    users = _ensure_loaded()
 
-    from app.wallet import pubkey_to_address
+    from app.wallet import pubkey_to_address, invalidate_verifying_key
     address = pubkey_to_address(public_key_hex)
-
-    users[username] = {
-        "address": address,
-        "public_key": public_key_hex,
-        "balance": initial_balance
-    }
-
-    save_users(users)
-    return {"username": username, **users[username]}
+    invalidate_verifying_key(public_key_hex)
+
+    # 保存先のロック → メモリ上の状態のロックの順で取る（ブロックの追加と同じ順序）
+    with get_storage().transaction(), _lock:
+        # 他のプロセスが同じユーザー名で作成していないかも確認する
+        refresh_users()
+        if username in users:
+            raise ValueError(f"ユーザー名 '{username}' は既に登録されています。")
+
+        users[username] = {
+            "address": address,
+            "public_key": public_key_hex,
+            "balance": initial_balance,
+            # チェーンからの残高再構築（app/checkpoint.py）の起点として使う
+            "initial_balance": initial_balance
+        }
+        try:
+            _store().record_create(username, users[username], users)
+        except Exception:
+            del users[username]
+            raise
+        bisect.insort(_balance_index, (-initial_balance, username))
+        return {"username": username, **users[username]}
 
 # ユーザー取得
 def get_user(username: str):
-    users = load_users()
-    return users.get(username)
+    users = _ensure_loaded()
+    user = users.get(username)
+    return dict(user) if user is not None else None
 
 # 残高確認
 def get_balance(username: str):
@@ -53,16 +138,52 @@ def get_balance(username: str):
         raise ValueError(f"ユーザー '{username}' は存在しません。")
     return user["balance"]
 
-# 残高更新
-def update_balance(username, new_balance):
-    users = load_users()
-    if username not in users:
-        # 新しいユーザー（例：送金先が未登録）の場合は作成する
-        print(f"警告: 残高更新対象のユーザー '{username}' が存在しなかったため、作成はされません。")
-        # 本来はエラーだが、ここでは何もしない
-        return
-    users[username]["balance"] = new_balance
-    save_users(users)
+def apply_balance_changes(deltas: dict, require_non_negative: bool = False) -> dict:
+    """
+    {ユーザー名: 増減額} をまとめて適用する。
+    1件でも存在しないユーザーが含まれていれば何も変更せずに ValueError を送出する。
+    require_non_negative=True の場合、残高が負になるユーザーがいれば何も変更せずに InsufficientBalanceError を送出する。
+    ジャーナルへは1レコードとして書くため、ブロック単位で全て反映されるか全く反映されないかのどちらかになる。
+    """
+    users = _ensure_loaded()
+    with _lock:
+        missing = [username for username in deltas if username not in users]
+        if missing:
+            raise ValueError(f"ユーザー {', '.join(missing)} は存在しません。")
+        new_balances = {username: users[username]["balance"] + delta for username, delta in deltas.items()}
+        if require_non_negative:
+            overdrawn = [username for username, balance in new_balances.items() if balance < 0]
+            if overdrawn:
+                raise InsufficientBalanceError(f"ユーザー {', '.join(overdrawn)} の残高が不足しています。")
+        for username, balance in new_balances.items():
+            _set_balance(users, username, balance)
+        _store().record_balances(new_balances, users)
+        return new_balances
+
+def get_balances(usernames: list[str]) -> dict:
+    """複数ユーザーの残高を {ユーザー名: 残高} でまとめて返す（存在しないユーザーは含めない）"""
+    users = _ensure_loaded()
+    with _lock:
+        return {username: users[username]["balance"] for username in usernames if username in users}
+
+def list_users_by_balance(limit: int = None, cursor: tuple = None):
+    """
+    残高の多い順（同額ならユーザー名順）にユーザーを返す。
+    cursor に前のページの最後のユーザーの (残高, ユーザー名) を渡すと、その次から返す。
+    戻り値は ([(ユーザー名, ユーザー情報のコピー), ...], さらに続きがあるか)。
+    """
+    users = _ensure_loaded()
+    with _lock:
+        start = bisect.bisect_right(_balance_index, (-cursor[0], cursor[1])) if cursor is not None else 0
+        end = min(len(_balance_index), start + limit) if limit is not None else len(_balance_index)
+        page = [(username, dict(users[username])) for _, username in _balance_index[start:end]]
+        return page, end < len(_balance_index)
+
+@atexit.register
+def _snapshot_on_exit():
+    with _lock:
+        if _users is not None:
+            _store().flush(_users)
 
 
 # テストコード
@@ -12,13 +12,14 @@ def calculate_hash(*args) -> str:
     string_data = "".join(map(str, args))
     return hashlib.sha256(string_data.encode()).hexdigest()
 
-def calculate_merkle_root(transactions: list[dict]) -> str:
+def calculate_merkle_levels(transactions: list[dict]) -> list[list[str]]:
     """
-    トランザクションリストからマークルルートを計算する。
-    トランザクション辞書内の 'txid' をハッシュとして利用する。
+    マークルツリーの全レベルを葉（txid）から順に返す。最後のレベルはルートのみ。
+    要素数が奇数のレベルは最後の要素を複製して偶数にした状態で保持する。
+    トランザクションが無い場合は空のリストを返す。
     """
     if not transactions:
-        return "0" * 64
+        return []
 
     # 各トランザクションのtxidをリストアップ
     tx_hashes = [tx['txid'] for tx in transactions]
@@ -28,6 +29,7 @@ def calculate_merkle_root(transactions: list[dict]) -> str:
         tx_hashes.append(tx_hashes[-1])
 
     # 2つのハッシュを結合して新しいハッシュを計算するプロセスを、ルートが1つになるまで繰り返す
+    levels = [tx_hashes]
     while len(tx_hashes) > 1:
         new_hashes = []
         for i in range(0, len(tx_hashes), 2):
@@ -37,5 +39,51 @@ def calculate_merkle_root(transactions: list[dict]) -> str:
         # レベルが上がった後も、要素数が奇数なら最後の要素を複製
         if len(tx_hashes) % 2 != 0 and len(tx_hashes) > 1:
             tx_hashes.append(tx_hashes[-1])
-            
-    return tx_hashes[0]
\ No newline at end of file
+        levels.append(tx_hashes)
+    return levels
+
+def calculate_merkle_root(transactions: list[dict]) -> str:
+    """
+    トランザクションリストからマークルルートを計算する。
+    トランザクション辞書内の 'txid' をハッシュとして利用する。
+    """
+    levels = calculate_merkle_levels(transactions)
+    if not levels:
+        return "0" * 64
+    return levels[-1][0]
+
+def merkle_branch(levels: list[list[str]], position: int) -> list[dict]:
+    """
+    position 番目のトランザクションからルートまでの兄弟ノードを、葉に近い順に返す。
+    各要素の side は兄弟ノードが左右どちらにあるか（"left" / "right"）。
+    """
+    branch = []
+    for level in levels[:-1]:
+        sibling = position ^ 1
+        branch.append({"hash": level[sibling], "side": "left" if sibling < position else "right"})
+        position //= 2
+    return branch
+
+def verify_merkle_branch(txid: str, branch: list[dict], merkle_root: str) -> bool:
+    """txid と兄弟ノードの列からルートを計算し直し、merkle_root と一致するかを確認する"""
+    current = txid
+    for node in branch:
+        combined_hash = node["hash"] + current if node["side"] == "left" else current + node["hash"]
+        current = hashlib.sha256(combined_hash.encode()).hexdigest()
+    return current == merkle_root
+
+def replay_key(signature) -> str:
+    """
+    同じ署名付き送金の再送を検出するためのキー（署名の r 成分を小文字の16進にしたもの）。
+    txid はコメントを変えるだけで、署名全体は s を n - s に置き換えるだけで別の値になるが、
+    r は署名ごとの乱数で決まるため、同じ署名を使い回す限り変えられない。
+    大文字や空白を混ぜた表記で別のキーにならないよう、16進をデコードしたバイト列から作る。
+    """
+    signature = str(signature or "")
+    try:
+        raw = bytes.fromhex(signature)
+    except ValueError:
+        # 16進でない署名は検証を通らないが、キーは空白と大文字小文字の違いを除いた文字列から作る
+        signature = "".join(signature.split()).lower()
+        return signature[:len(signature) // 2]
+    return raw[:len(raw) // 2].hex()
\ No newline at end of file
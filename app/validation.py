@@ -0,0 +1,153 @@
+# app/validation.py
+
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from app.utils import calculate_hash, calculate_merkle_root
+from app.difficulty import ChainParams, history_size, required_difficulty, check_timestamp
+
+# --- 定数 ---
+CHUNK_SIZE = 500    # 1つのワーカーにまとめて渡すブロック数
+
+# ワーカープロセスごとに保持する {ユーザー名: 公開鍵}
+_public_keys = {}
+
+def _init_worker(public_keys: dict):
+    global _public_keys
+    _public_keys = public_keys
+
+def _check_block(b: dict, required: int):
+    """
+    ブロック1件を単独で検証し、問題があればその理由を、なければ None を返す。
+    required はこのブロックに求められる難易度で、ブロック自身が申告する難易度ではなくこちらでPoWを確認する。
+    （前のブロックとの連結はここでは見ない）
+    """
+    block_hash = calculate_hash(b['index'], b['timestamp'], b['merkle_root'], b['previous_hash'], b['nonce'], b['difficulty'])
+    if block_hash != b['hash']:
+        return "ブロックのハッシュ値が内容と一致しません"
+    if b['index'] > 0:
+        if b['difficulty'] != required:
+            return f"難易度が {b['difficulty']} になっています（{required} である必要があります）"
+        if not b['hash'].startswith("0" * required):
+            return f"PoWが無効です（難易度 {required}）"
+    if calculate_merkle_root(b['transactions']) != b['merkle_root']:
+        return "マークルルートがトランザクションと一致しません"
+
+    for pos, tx in enumerate(b['transactions']):
+        payload = {"from": tx.get("from"), "to": tx.get("to"), "amount": tx.get("amount"),
+                   "signature": tx.get("signature"), "comment": tx.get("comment", "")}
+        if hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest() != tx.get("txid"):
+            return f"トランザクション {pos} の txid が内容と一致しません"
+        public_key = _public_keys.get(tx.get("from"))
+        if public_key is None:
+            return f"トランザクション {pos} の送金元 '{tx.get('from')}' が存在しません"
+        message = f"send:{tx['from']}->{tx['to']}:{tx['amount']}"
+        from app.wallet import get_verifying_key
+        try:
+            raw_hex = public_key[2:] if public_key.startswith("04") else public_key
+            get_verifying_key(raw_hex).verify(bytes.fromhex(tx['signature']), message.encode('utf-8'))
+        except Exception:
+            return f"トランザクション {pos} の署名が無効です"
+    return None
+
+def _check_chunk(items: list[tuple[dict, int]]):
+    """(ブロック, 求められる難易度) のチャンク内で最初に見つかった不正ブロックを (index, 理由) で返す。問題がなければ None"""
+    for b, required in items:
+        reason = _check_block(b, required)
+        if reason is not None:
+            return b['index'], reason
+    return None
+
+def _required_difficulties(blocks: list[dict], params: ChainParams) -> list[int]:
+    """
+    各ブロックに求められる難易度を、ブロックの追加時（Blockchain._commit_blocks）と同じ
+    required_difficulty で直前までのブロックから計算する（タイムスタンプと難易度だけを使うので逐次でも軽い）。
+    """
+    recent = deque(maxlen=history_size(params))
+    required = []
+    for b in blocks:
+        required.append(required_difficulty(b['index'], list(recent), params))
+        recent.append((b['timestamp'], b['difficulty']))
+    return required
+
+def _check_linkage(blocks: list[dict], params: ChainParams):
+    """先頭から順に、インデックスの連番と previous_hash の連結、タイムスタンプ（リターゲット有効時）を確認する"""
+    previous = None
+    recent = deque(maxlen=history_size(params))
+    now = time.time()
+    for i, b in enumerate(blocks):
+        if b['index'] != i:
+            return i, f"ブロックのインデックスが連番になっていません（{b['index']}）"
+        expected_previous = "0" if previous is None else previous['hash']
+        if b['previous_hash'] != expected_previous:
+            return i, "previous_hash が前のブロックのハッシュと一致しません"
+        if i > 0:
+            reason = check_timestamp(b['timestamp'], list(recent), now, params)
+            if reason is not None:
+                return i, reason
+        recent.append((b['timestamp'], b['difficulty']))
+        previous = b
+    return None
+
+def validate_chain(chain: list, public_keys: dict, params: ChainParams, workers: int = None, chunk_size: int = CHUNK_SIZE) -> dict:
+    """
+    チェーン全体を再検証する。難易度は params（チェーンの作成時に記録したパラメータ）から計算し直したもので確認する。
+    ハッシュの再計算・PoW・マークルルート・署名はチャンク単位でプロセスプールに分散し、
+    最後に連結を逐次確認して、最初に見つかった不正ブロックを報告する。
+    """
+    started = time.monotonic()
+    workers = workers or os.cpu_count() or 1
+    blocks = [block.to_dict() for block in chain]
+    items = list(zip(blocks, _required_difficulties(blocks, params)))
+    chunks = [items[i:i + chunk_size] for i in range(0, len(items), chunk_size)]
+
+    if workers == 1 or len(chunks) <= 1:
+        _init_worker(public_keys)
+        results = [_check_chunk(chunk) for chunk in chunks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(public_keys,)) as executor:
+            results = list(executor.map(_check_chunk, chunks))
+
+    failures = [r for r in results if r is not None]
+    linkage_failure = _check_linkage(blocks, params)
+    if linkage_failure is not None:
+        failures.append(linkage_failure)
+    first_invalid = min(failures) if failures else None
+
+    return {
+        "valid": first_invalid is None,
+        "first_invalid_index": first_invalid[0] if first_invalid else None,
+        "reason": first_invalid[1] if first_invalid else None,
+        "blocks": len(blocks),
+        "workers": workers,
+        "elapsed": time.monotonic() - started
+    }
+
+def validate_blockchain(blockchain, workers: int = None) -> dict:
+    """Blockchainインスタンスと登録済みユーザーの公開鍵を使ってチェーンを検証する"""
+    from app.user import load_users
+    public_keys = {username: data.get("public_key") for username, data in load_users().items()}
+    return validate_chain(blockchain.chain, public_keys, blockchain.params, workers=workers)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="ブロックチェーン全体を再検証する")
+    parser.add_argument("--workers", type=int, default=None, help="検証に使うプロセス数（省略時はCPUコア数）")
+    args = parser.parse_args(argv)
+
+    from app.blockchain import Blockchain
+    result = validate_blockchain(Blockchain(), workers=args.workers)
+    if result["valid"]:
+        print(f"OK: {result['blocks']} ブロックを検証しました（{result['elapsed']:.2f} 秒, {result['workers']} プロセス）")
+        return 0
+    print(f"NG: ブロック {result['first_invalid_index']} が不正です: {result['reason']}")
+    return 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,7 +1,20 @@
 # app/wallet.py
 
 import hashlib
+import threading
+from collections import OrderedDict
 from ecdsa import SigningKey, VerifyingKey, SECP256k1, BadSignatureError
+from ecdsa.ellipticcurve import PointJacobi
+from app.metrics import timed
+
+# --- 定数 ---
+VK_CACHE_SIZE = 1024    # 解析済み VerifyingKey を保持する最大件数
+SIGNATURE_SIZE = 64     # 署名（r と s を32バイトずつ連結したもの）のバイト数
+
+# 公開鍵(hex, 先頭の04を除く) -> 事前計算済み VerifyingKey のLRUキャッシュ
+_vk_cache = OrderedDict()
+_vk_cache_lock = threading.Lock()
+_vk_cache_stats = {"hits": 0, "misses": 0}
 
 # --- 鍵ペアの生成 ---
 def generate_keypair():
@@ -18,7 +31,69 @@ def sign_message(private_key_hex, message: str) -> str:
     signature = sk.sign(message.encode('utf-8'))
     return signature.hex()
 
+# --- 公開鍵の解析（キャッシュ付き） ---
+def get_verifying_key(raw_public_key_hex: str) -> VerifyingKey:
+    """
+    公開鍵（先頭の04を除いた64バイトのhex）から VerifyingKey を返す。
+    曲線上の点の検証と、点の乗算テーブルの事前計算は初回だけ行い、以降はキャッシュを使う。
+    """
+    with _vk_cache_lock:
+        vk = _vk_cache.get(raw_public_key_hex)
+        if vk is not None:
+            _vk_cache.move_to_end(raw_public_key_hex)
+            _vk_cache_stats["hits"] += 1
+            return vk
+        _vk_cache_stats["misses"] += 1
+
+    vk = _precomputed_key(VerifyingKey.from_string(bytes.fromhex(raw_public_key_hex), curve=SECP256k1))
+
+    with _vk_cache_lock:
+        _vk_cache[raw_public_key_hex] = vk
+        _vk_cache.move_to_end(raw_public_key_hex)
+        while len(_vk_cache) > VK_CACHE_SIZE:
+            _vk_cache.popitem(last=False)
+    return vk
+
+def _precomputed_key(vk: VerifyingKey) -> VerifyingKey:
+    """
+    点の乗算テーブルを事前計算した VerifyingKey を返す。
+    from_string で作った点は位数を持たず precompute() が失敗するので、位数を指定して点を作り直す。
+    それでも事前計算できない場合は、元の（事前計算なしの）VerifyingKey を返す。
+    """
+    point = vk.pubkey.point
+    try:
+        point = PointJacobi(SECP256k1.curve, point.x(), point.y(), 1, SECP256k1.order, generator=True)
+        precomputed = VerifyingKey.from_public_point(point, curve=SECP256k1)
+        precomputed.precompute()
+        return precomputed
+    except Exception as e:
+        print(f"警告: 公開鍵の事前計算に失敗しました（事前計算なしで検証します）: {e}")
+        return vk
+
+def invalidate_verifying_key(public_key_hex: str = None):
+    """ユーザーの作成・変更時に呼ぶ。public_key_hex を省略するとキャッシュ全体を破棄する"""
+    with _vk_cache_lock:
+        if public_key_hex is None:
+            _vk_cache.clear()
+            return
+        raw_hex = public_key_hex[2:] if public_key_hex.startswith("04") else public_key_hex
+        _vk_cache.pop(raw_hex, None)
+        _vk_cache.pop(public_key_hex, None)
+
+def get_verifying_key_cache_stats() -> dict:
+    """キャッシュのヒット数・ミス数・現在の件数を返す"""
+    with _vk_cache_lock:
+        return {**_vk_cache_stats, "size": len(_vk_cache), "max_size": VK_CACHE_SIZE}
+
 # --- 署名を検証 ---
+def is_canonical_signature(signature_hex) -> bool:
+    """
+    署名が SIGNATURE_SIZE バイトを小文字の16進で表した文字列（sign_message の出力と同じ形式）かを返す。
+    同じ署名の別表記（大文字・空白入り）で txid を変えた再送を受け付けないよう、API はこれ以外を拒否する。
+    """
+    return (type(signature_hex) is str and len(signature_hex) == SIGNATURE_SIZE * 2
+            and all(c in "0123456789abcdef" for c in signature_hex))
+
 def verify_signature(public_key_hex, message: str, signature_hex: str) -> bool:
     try:
         # ✅ 先頭の「04」を除いて VerifyingKey を生成
@@ -26,7 +101,7 @@ def verify_signature(public_key_hex, message: str, signature_hex: str) -> bool:
         if key_bytes[0] != 0x04:
             print("Invalid prefix byte for uncompressed key")
             return False
-        vk = VerifyingKey.from_string(key_bytes[1:], curve=SECP256k1)
+        vk = get_verifying_key(key_bytes[1:].hex())
 
         return vk.verify(bytes.fromhex(signature_hex), message.encode('utf-8'))
     except Exception as e:
@@ -42,14 +117,15 @@ def pubkey_to_address(public_key_hex: str) -> str:
     ripemd.update(sha)
     return ripemd.hexdigest()  # これが「アドレス」（公開鍵ハッシュ）
 
+@timed("verify_user_signature")
 def verify_user_signature(public_key_hex: str, message: str, signature_hex: str) -> bool:
     try:
         # 公開鍵はプレフィックス付き（例: 04xxxxxx...）を想定
         if public_key_hex.startswith("04"):
             public_key_hex = public_key_hex[2:]  # 先頭"04"を除去
 
-        # 公開鍵からVerifyingKeyを生成（uncompressed keyを前提）
-        vk = VerifyingKey.from_string(bytes.fromhex(public_key_hex), curve=SECP256k1)
+        # 公開鍵からVerifyingKeyを取得（uncompressed keyを前提、解析結果はキャッシュされる）
+        vk = get_verifying_key(public_key_hex)
         
         # 検証
         return vk.verify(bytes.fromhex(signature_hex), message.encode('utf-8'))
@@ -72,4 +148,8 @@ if __name__ == "__main__":
     msg = "send 10 TJC to Alice"
     sig = sign_message(priv, msg)
     print("Signature:", sig)
-    print("Verified :", verify_signature(pub, msg, sig))
\ No newline at end of file
+    verified = verify_signature(pub, msg, sig)
+    print("Verified :", verified)
+    assert verified, "署名の検証に失敗しました"
+    assert verify_user_signature(pub, msg, sig), "署名の検証に失敗しました（キャッシュ済みの公開鍵）"
+    assert not verify_user_signature(pub, msg + "0", sig), "改ざんしたメッセージの署名が検証を通りました"
\ No newline at end of file
@@ -0,0 +1,291 @@
+# benchmarks/api_bench.py
+#
+# APIサーバーの負荷試験・ベンチマーク。
+# 一時ディレクトリに N 人のユーザーと M 個のブロックを本物の Blockchain / Block / wallet のコードで作成し、
+# 低い難易度で各エンドポイントに並行してリクエストを送り、スループットとレイテンシ（p50/p95/p99）を計測する。
+#
+# 実行例（プロジェクトのルートディレクトリで）:
+#   python -m benchmarks.api_bench --users 200 --blocks 100,1000,5000 --requests 500 --concurrency 8 --output bench.json
+#   TJC_DIFFICULTY=1 python run.py 等で起動したサーバーを計測する場合:
+#   python -m benchmarks.api_bench --base-url http://127.0.0.1:5000
+#   難易度のリターゲットを有効にして、負荷に応じて難易度がどう動くかを見る場合:
+#   python -m benchmarks.api_bench --target-interval 0.05 --blocks 200,1000
+
+import os
+import sys
+import json
+import math
+import time
+import random
+import hashlib
+import argparse
+import platform
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# --- 定数 ---
+DEFAULT_DIFFICULTY = 1
+ENDPOINTS = ["info", "balance", "users", "transactions", "send"]
+MAX_SEED_FAILURES = 10  # ブロックの作成中にこの回数続けて拒否されたら中止する
+
+def percentile(sorted_values: list, p: float) -> float:
+    """最近接順位法によるパーセンタイル"""
+    if not sorted_values:
+        return 0.0
+    k = max(0, min(len(sorted_values) - 1, math.ceil(p / 100 * len(sorted_values)) - 1))
+    return sorted_values[k]
+
+def summarize(samples: list[tuple[float, int]], wall_time: float) -> dict:
+    """(レイテンシ秒, ステータスコード) のリストを集計する"""
+    latencies = sorted(latency for latency, _ in samples)
+    status_counts = {}
+    for _, status in samples:
+        status_counts[str(status)] = status_counts.get(str(status), 0) + 1
+    return {
+        "requests": len(samples),
+        "status": status_counts,
+        "throughput_rps": len(samples) / wall_time if wall_time > 0 else 0.0,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "max_ms": (latencies[-1] * 1000) if latencies else 0.0
+    }
+
+
+class Seeder:
+    """
+    ユーザーとブロックを作成する。鍵生成・署名・採掘は本物の wallet / Block のコードで行い、
+    登録とブロックの追加はAPI（/create_user, /send）経由で本物の Blockchain に対して行う。
+    """
+    def __init__(self, transport, rng: random.Random):
+        self.transport = transport
+        self.rng = rng
+        self.keys = {}  # ユーザー名 -> (秘密鍵, 公開鍵)
+        # 起動済みのサーバーに繰り返し実行してもユーザー名が重複しないようにする
+        self.prefix = f"bench_{int(time.time())}_"
+
+    def seed_users(self, count: int, initial_balance: int):
+        from app.wallet import generate_keypair
+        for i in range(len(self.keys), len(self.keys) + count):
+            username = f"{self.prefix}{i:06d}"
+            priv, pub = generate_keypair()
+            status, body = self.transport.post("/create_user", {
+                "username": username, "public_key": pub, "initial_balance": initial_balance
+            })
+            if status != 201:
+                raise RuntimeError(f"ユーザー作成に失敗しました: {status} {body}")
+            self.keys[username] = (priv, pub)
+
+    def make_transaction(self, from_user: str, to_user: str, amount: int) -> dict:
+        from app.wallet import sign_message
+        signature = sign_message(self.keys[from_user][0], f"send:{from_user}->{to_user}:{amount}")
+        payload = {"from": from_user, "to": to_user, "amount": amount, "signature": signature, "comment": "bench"}
+        return {**payload, "txid": hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()}
+
+    def chain_length(self) -> int:
+        _, info = self.transport.get("/info")
+        return info["latest_block_index"] + 1
+
+    def seed_blocks(self, target_length: int):
+        """
+        チェーン長が target_length になるまで1送金1ブロックで追加する。
+        拒否された場合はサーバーの応答を表示して続け、MAX_SEED_FAILURES 回続けて拒否されたら中止する。
+        """
+        usernames = sorted(self.keys)
+        failures = 0
+        while True:
+            _, info = self.transport.get("/info")
+            if info["latest_block_index"] + 1 >= target_length:
+                return
+            from_user, to_user = self.rng.sample(usernames, 2)
+            status, body = self.transport.post("/send", build_send_payload(self, info, from_user, to_user))
+            if status in (201, 409):
+                failures = 0
+                continue
+            failures += 1
+            error = body.get("error", body) if isinstance(body, dict) else body
+            print(f"警告: ブロックの追加が拒否されました（{failures}/{MAX_SEED_FAILURES}）: {status} {error}")
+            if failures >= MAX_SEED_FAILURES:
+                raise RuntimeError(f"ブロックの追加が {failures} 回続けて拒否されたため中止します。最後の応答: {status} {error}")
+
+
+def mine(block):
+    """ベンチマーク用の単純なPoW（低難易度前提）"""
+    target = "0" * block.difficulty
+    while not block.hash.startswith(target):
+        block.nonce += 1
+        block.hash = block.calculate_block_hash()
+
+
+class TestClientTransport:
+    """Flask のテストクライアント経由でリクエストを送る（スレッドごとにクライアントを持つ）"""
+    def __init__(self, app):
+        self.app = app
+        self._local = threading.local()
+
+    def _client(self):
+        if not hasattr(self._local, "client"):
+            self._local.client = self.app.test_client()
+        return self._local.client
+
+    def get(self, path: str, params: dict = None):
+        response = self._client().get("/api" + path, query_string=params)
+        return response.status_code, _test_response_body(response)
+
+    def post(self, path: str, payload: dict):
+        response = self._client().post("/api" + path, json=payload)
+        return response.status_code, _test_response_body(response)
+
+def _test_response_body(response):
+    """JSONならその内容、そうでなければ本文の文字列（エラーページなど）を返す"""
+    body = response.get_json(silent=True)
+    return body if body is not None else response.get_data(as_text=True)
+
+
+class HttpTransport:
+    """起動済みのサーバーに HTTP でリクエストを送る（keep-alive の Session をスレッドごとに持つ）"""
+    def __init__(self, base_url: str):
+        import requests
+        self.base_url = base_url.rstrip("/") + "/api"
+        self._requests = requests
+        self._local = threading.local()
+
+    def _session(self):
+        if not hasattr(self._local, "session"):
+            self._local.session = self._requests.Session()
+        return self._local.session
+
+    def get(self, path: str, params: dict = None):
+        response = self._session().get(self.base_url + path, params=params)
+        return response.status_code, _http_response_body(response)
+
+    def post(self, path: str, payload: dict):
+        response = self._session().post(self.base_url + path, json=payload)
+        return response.status_code, _http_response_body(response)
+
+def _http_response_body(response):
+    """JSONならその内容、そうでなければ本文の文字列（エラーページなど）を返す"""
+    try:
+        return response.json()
+    except ValueError:
+        return response.text
+
+
+def run_endpoint(endpoint: str, transport, seeder: Seeder, requests_count: int, concurrency: int) -> dict:
+    """1つのエンドポイントに requests_count 件のリクエストを concurrency 並列で送る"""
+    usernames = sorted(seeder.keys)
+
+    def one_request(i: int):
+        rng = random.Random(i)
+        if endpoint == "info":
+            started = time.perf_counter()
+            status, _ = transport.get("/info")
+        elif endpoint == "balance":
+            started = time.perf_counter()
+            status, _ = transport.get("/balance", {"username": rng.choice(usernames)})
+        elif endpoint == "users":
+            started = time.perf_counter()
+            status, _ = transport.get("/users")
+        elif endpoint == "transactions":
+            started = time.perf_counter()
+            status, _ = transport.get("/transactions", {"username": rng.choice(usernames)})
+        else:
+            # 送金はクライアント側の署名・採掘を除いたサーバーの処理時間だけを計測する
+            from_user, to_user = rng.sample(usernames, 2)
+            _, info = transport.get("/info")
+            payload = build_send_payload(seeder, info, from_user, to_user)
+            started = time.perf_counter()
+            status, _ = transport.post("/send", payload)
+        return time.perf_counter() - started, status
+
+    wall_started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        samples = list(executor.map(one_request, range(requests_count)))
+    return summarize(samples, time.perf_counter() - wall_started)
+
+def build_send_payload(seeder: Seeder, info: dict, from_user: str, to_user: str) -> dict:
+    """/api/send に送るリクエストを、info の最新ブロックの上で採掘して作る"""
+    from app.block import Block
+    tx = seeder.make_transaction(from_user, to_user, 1)
+    block = Block(index=info["latest_block_index"] + 1, transactions=[tx], previous_hash=info["latest_block_hash"],
+                  difficulty=info["difficulty"], timestamp=time.time())
+    mine(block)
+    return {
+        "from_username": from_user, "to_username": to_user, "amount": 1,
+        "signature": tx["signature"], "comment": tx["comment"],
+        "nonce": block.nonce, "timestamp": block.timestamp, "difficulty": block.difficulty,
+        "previous_hash": block.previous_hash, "index": block.index
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="APIサーバーのベンチマーク")
+    parser.add_argument("--users", type=int, default=100, help="作成するユーザー数")
+    parser.add_argument("--blocks", default="100,1000", help="計測するチェーン長（カンマ区切りで複数指定すると順に伸ばしながら計測）")
+    parser.add_argument("--requests", type=int, default=200, help="エンドポイントごとのリクエスト数")
+    parser.add_argument("--concurrency", type=int, default=8, help="同時リクエスト数")
+    parser.add_argument("--endpoints", default=",".join(ENDPOINTS), help="計測するエンドポイント（カンマ区切り）")
+    parser.add_argument("--difficulty", type=int, default=DEFAULT_DIFFICULTY, help="PoWの難易度（低いほど速い）。リターゲット有効時は初期値")
+    parser.add_argument("--target-interval", type=float, default=0.0,
+                        help="目標のブロック間隔（秒）。指定するとサーバーの難易度のリターゲットを有効にする（TJC_TARGET_BLOCK_INTERVAL）")
+    parser.add_argument("--seed", type=int, default=0, help="乱数シード（再現性のため）")
+    parser.add_argument("--data-dir", default=None, help="テストクライアント使用時のデータディレクトリ（省略時は一時ディレクトリ）")
+    parser.add_argument("--base-url", default=None, help="起動済みサーバーのURL（省略時は Flask のテストクライアント）")
+    parser.add_argument("--output", default=None, help="結果をJSONで書き出すファイル")
+    args = parser.parse_args(argv)
+
+    # app モジュールを読み込む前にデータの置き場所と難易度を決める
+    data_dir = args.data_dir or tempfile.mkdtemp(prefix="tjc_bench_")
+    os.environ["TJC_DATA_DIR"] = data_dir
+    os.environ["TJC_DIFFICULTY"] = str(args.difficulty)
+    if args.target_interval > 0:
+        os.environ["TJC_TARGET_BLOCK_INTERVAL"] = str(args.target_interval)
+
+    if args.base_url:
+        # サーバー側も同じ難易度（TJC_DIFFICULTY, TJC_TARGET_BLOCK_INTERVAL）で起動しておくこと
+        transport = HttpTransport(args.base_url)
+    else:
+        from api import create_app
+        transport = TestClientTransport(create_app())
+    rng = random.Random(args.seed)
+    seeder = Seeder(transport, rng)
+    endpoints = [e for e in args.endpoints.split(",") if e]
+    chain_lengths = sorted(int(n) for n in args.blocks.split(","))
+
+    if not args.base_url:
+        print(f"データディレクトリ: {data_dir}")
+    print(f"{args.users} ユーザーを作成しています...")
+    seeder.seed_users(args.users, initial_balance=10 ** 9)
+
+    results = []
+    for chain_length in chain_lengths:
+        print(f"チェーン長 {chain_length} まで作成しています...")
+        seeder.seed_blocks(chain_length)
+        row = {"chain_length": seeder.chain_length(), "users": len(seeder.keys), "endpoints": {}}
+        for endpoint in endpoints:
+            summary = run_endpoint(endpoint, transport, seeder, args.requests, args.concurrency)
+            row["endpoints"][endpoint] = summary
+            print(f"  {endpoint:<13} {summary['throughput_rps']:>9.1f} req/s  "
+                  f"p50 {summary['p50_ms']:>8.2f} ms  p95 {summary['p95_ms']:>8.2f} ms  p99 {summary['p99_ms']:>8.2f} ms  "
+                  f"status {summary['status']}")
+        # 計測の送金で伸びた後の、次のブロックに求められる難易度（リターゲット有効時に負荷でどう動いたか）
+        _, info = transport.get("/info")
+        row["difficulty"] = info["difficulty"]
+        print(f"  次のブロックの難易度: {info['difficulty']}")
+        results.append(row)
+
+    report = {
+        "config": {k: v for k, v in vars(args).items() if k != "output"},
+        "environment": {"python": platform.python_version(), "platform": platform.platform(), "cpu_count": os.cpu_count()},
+        "started_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "results": results
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"結果を {args.output} に書き出しました。")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,220 @@
+# api_client.py
+
+import asyncio
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# --- 定数 ---
+API_BASE_URL = "http://127.0.0.1:5000/api"
+DEFAULT_TIMEOUT = (5, 30)   # (接続, 読み込み) のタイムアウト（秒）
+DEFAULT_RETRIES = 3         # 接続失敗・5xx 応答時の再試行回数（GET のみ）
+DEFAULT_POOL_SIZE = 16      # 接続プールに保持する keep-alive 接続の数
+DEFAULT_CONCURRENCY = 16    # AsyncWalletClient で同時に実行するリクエスト数
+BALANCE_LOOKUP_CHUNK = 1000 # /balances に一度に問い合わせるユーザー数（サーバーの上限に合わせる）
+
+class _SessionHolder:
+    """スレッドローカルに置くセッションの入れ物（スレッドの終了を weakref.finalize で検知するため）"""
+    __slots__ = ("session", "__weakref__")
+
+    def __init__(self, session: requests.Session):
+        self.session = session
+
+class WalletClient:
+    """
+    APIサーバーとの通信をまとめたクライアント。
+    requests.Session の接続プールを使い回すので、リクエストごとにTCP接続を張り直さない。
+    requests.Session はスレッドセーフではないため、セッションはスレッドごとに作る
+    （同じクライアントを複数のスレッドから使ってよい）。スレッドが終了するとそのセッションも閉じる。
+    各メソッドは応答のJSONを返し、失敗時は requests の例外を送出する。
+    """
+    def __init__(self, base_url: str = API_BASE_URL, timeout=DEFAULT_TIMEOUT,
+                 retries: int = DEFAULT_RETRIES, pool_size: int = DEFAULT_POOL_SIZE):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.retries = retries
+        self.pool_size = pool_size
+        self._local = threading.local()
+        self._sessions = set()  # close() で閉じるため、使用中のスレッドが残っているセッションを保持する
+        self._sessions_lock = threading.Lock()
+
+    @property
+    def session(self) -> requests.Session:
+        """呼び出したスレッド用のセッション（初回に作成し、スレッドの終了時に閉じる）"""
+        holder = getattr(self._local, "holder", None)
+        if holder is None:
+            session = requests.Session()
+            # 送金などの POST は二重送信を避けるため再試行しない
+            retry = Retry(total=self.retries, backoff_factor=0.2, status_forcelist=(502, 503, 504),
+                          allowed_methods=frozenset(["GET"]))
+            adapter = HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size, max_retries=retry)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            holder = self._local.holder = _SessionHolder(session)
+            with self._sessions_lock:
+                self._sessions.add(session)
+            # スレッドが終了してスレッドローカルの値が破棄されたら、セッション（と接続プール）を閉じる
+            weakref.finalize(holder, self._release_session, session)
+        return holder.session
+
+    def _release_session(self, session: requests.Session):
+        with self._sessions_lock:
+            self._sessions.discard(session)
+        session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        with self._sessions_lock:
+            sessions, self._sessions = self._sessions, set()
+        for session in sessions:
+            session.close()
+
+    # --- 低レベルの送受信 ---
+    def get(self, path: str, params: dict = None, timeout=None) -> requests.Response:
+        return self.session.get(self.base_url + path, params=params, timeout=timeout or self.timeout)
+
+    def post(self, path: str, json: dict = None, timeout=None) -> requests.Response:
+        return self.session.post(self.base_url + path, json=json, timeout=timeout or self.timeout)
+
+    def _get_json(self, path: str, params: dict = None):
+        response = self.get(path, params=params)
+        response.raise_for_status()
+        return response.json()
+
+    # --- API ---
+    def get_info(self) -> dict:
+        return self._get_json("/info")
+
+    def get_balance(self, username: str) -> dict:
+        return self._get_json("/balance", {"username": username})
+
+    def get_transaction_history(self, username: str, limit: int = None, before: str = None):
+        params = {"username": username}
+        if limit is not None: params["limit"] = limit
+        if before is not None: params["before"] = before
+        return self._get_json("/transactions", params)
+
+    def get_tx_proof(self, txid: str) -> dict:
+        return self._get_json("/tx_proof", {"txid": txid})
+
+    def get_block(self, block_hash: str = None, index: int = None) -> dict:
+        """ハッシュかブロック番号でブロックを1件取得する {"block": ..., "confirmations": ...}"""
+        if block_hash is not None:
+            return self._get_json(f"/block/{block_hash}")
+        return self._get_json("/block", {"index": index})
+
+    def get_all_users(self) -> list:
+        return self._get_json("/users")
+
+    def get_users_by_balance(self, limit: int = None, cursor: str = None) -> dict:
+        """残高の多い順のページ {"users": [...], "next_cursor": ...} を返す"""
+        params = {"sort": "balance"}
+        if limit is not None: params["limit"] = limit
+        if cursor is not None: params["cursor"] = cursor
+        return self._get_json("/users", params)
+
+    def get_balances(self, usernames: list[str]) -> dict:
+        """{"balances": {ユーザー名: 残高}, "missing": [...]} を返す"""
+        return self._get_json("/balances", {"usernames": ",".join(usernames)})
+
+    def create_user(self, username: str, public_key: str, initial_balance: int) -> dict:
+        response = self.post("/create_user", json={
+            "username": username, "public_key": public_key, "initial_balance": initial_balance
+        })
+        response.raise_for_status()
+        return response.json()
+
+
+class AsyncWalletClient:
+    """
+    WalletClient の asyncio 版。一括処理（多数のユーザーの残高確認・履歴取得・ユーザー作成）を
+    同時に DEFAULT_CONCURRENCY 件まで並行して実行する。
+    非同期I/Oではなく、同期の WalletClient をスレッドプール上で呼び出すラッパーで、
+    各ワーカースレッドは WalletClient が作るスレッドごとのセッション（と接続）を使い回す。
+    """
+    def __init__(self, client: WalletClient = None, concurrency: int = DEFAULT_CONCURRENCY):
+        # スレッドごとのセッションなので、1セッションあたりの接続は少なくてよい
+        self.client = client or WalletClient(pool_size=1)
+        self.concurrency = concurrency
+        self._executor = ThreadPoolExecutor(max_workers=concurrency)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+        self.client.close()
+
+    async def _call(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, func, *args)
+
+    async def _gather(self, func, args_list: list, return_exceptions: bool = True):
+        """args_list の各要素で func を並行実行する。失敗した要素は例外オブジェクトとして返す"""
+        return await asyncio.gather(*(self._call(func, *args) for args in args_list),
+                                    return_exceptions=return_exceptions)
+
+    async def get_balance(self, username: str) -> dict:
+        return await self._call(self.client.get_balance, username)
+
+    async def get_balances(self, usernames: list[str]) -> dict:
+        """
+        {ユーザー名: 残高の応答 or 例外} を返す。
+        /balances で BALANCE_LOOKUP_CHUNK 人ずつまとめて問い合わせ、チャンク同士は並行して実行する。
+        """
+        chunks = [usernames[i:i + BALANCE_LOOKUP_CHUNK] for i in range(0, len(usernames), BALANCE_LOOKUP_CHUNK)]
+        responses = await self._gather(self.client.get_balances, [(chunk,) for chunk in chunks])
+        results = {}
+        for chunk, response in zip(chunks, responses):
+            for username in chunk:
+                if isinstance(response, Exception):
+                    results[username] = response
+                elif username in response["balances"]:
+                    results[username] = {"username": username, "balance": response["balances"][username]}
+                else:
+                    results[username] = ValueError(f"ユーザー '{username}' が見つかりません")
+        return results
+
+    async def get_transaction_history(self, username: str, limit: int = None, before: str = None):
+        return await self._call(self.client.get_transaction_history, username, limit, before)
+
+    async def get_histories(self, usernames: list[str], limit: int = None) -> dict:
+        """{ユーザー名: 取引履歴 or 例外} を返す"""
+        results = await self._gather(self.client.get_transaction_history, [(u, limit, None) for u in usernames])
+        return dict(zip(usernames, results))
+
+    async def create_users(self, users: list[tuple[str, str, int]]) -> list:
+        """(ユーザー名, 公開鍵, 初期残高) のリストからユーザーを並行して作成する"""
+        return await self._gather(self.client.create_user, users)
+
+
+# --- 既定のクライアント ---
+_default_client = None
+_default_client_lock = threading.Lock()
+
+def get_client() -> WalletClient:
+    """モジュール単位の関数が共有する既定のクライアントを返す"""
+    global _default_client
+    if _default_client is None:
+        with _default_client_lock:
+            if _default_client is None:
+                _default_client = WalletClient()
+    return _default_client
+
+def set_client(client: WalletClient):
+    """既定のクライアントを差し替える（接続先やタイムアウトを変更したい場合）"""
+    global _default_client
+    with _default_client_lock:
+        _default_client = client
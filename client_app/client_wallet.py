@@ -3,12 +3,16 @@
 import os
 import json
 import hashlib
-import time
+import queue
+import threading
 import requests
+import pow_solver
+from api_client import get_client
 from ecdsa import SigningKey, VerifyingKey, SECP256k1, BadSignatureError
 
 # --- 定数 ---
-API_BASE_URL = "http://127.0.0.1:5000/api"
+TIP_POLL_TIMEOUT = 25   # 最新ブロック変更のロングポーリング1回あたりの待ち時間（秒）
+MAX_CONFLICT_RETRIES = 5    # 送信時に 409（チェーン更新済み）が返った場合の再計算の上限回数
 
 # --- サーバー側のロジックと合わせるためのヘルパー関数 ---
 def calculate_hash(*args) -> str:
@@ -38,6 +42,35 @@ def calculate_merkle_root(transactions: list[dict]) -> str:
             tx_hashes.append(tx_hashes[-1])
     return tx_hashes[0]
 
+def verify_merkle_branch(txid: str, branch: list[dict], merkle_root: str) -> bool:
+    """
+    txid と兄弟ノードの列からマークルルートを計算し直し、merkle_root と一致するかを確認する。
+    サーバーの utils.py と同じロジック。
+    """
+    current = txid
+    for node in branch:
+        combined_hash = node["hash"] + current if node["side"] == "left" else current + node["hash"]
+        current = hashlib.sha256(combined_hash.encode()).hexdigest()
+    return current == merkle_root
+
+def verify_tx_proof(proof: dict, txid: str = None) -> bool:
+    """
+    /api/tx_proof の応答を検証する。
+    ヘッダーのハッシュが内容から再計算したものと一致し、難易度を満たしていて、
+    txid からマークルブランチをたどった結果がヘッダーのマークルルートと一致すれば True。
+    """
+    header = proof["header"]
+    txid = txid or proof["txid"]
+    if proof["transaction"].get("txid") != txid:
+        return False
+    block_hash = calculate_hash(header["index"], header["timestamp"], header["merkle_root"],
+                                header["previous_hash"], header["nonce"], header["difficulty"])
+    if block_hash != header["hash"]:
+        return False
+    if header["index"] > 0 and not block_hash.startswith("0" * header["difficulty"]):
+        return False
+    return verify_merkle_branch(txid, proof["branch"], header["merkle_root"])
+
 def pubkey_to_address(public_key_hex: str) -> str:
     """公開鍵からアドレスを生成。サーバーの wallet.py と同じロジック。"""
     sha = hashlib.sha256(bytes.fromhex(public_key_hex)).digest()
@@ -84,36 +117,82 @@ def sign_message(private_key_hex: str, message: str) -> str:
     return sk.sign(message.encode('utf-8')).hex()
 
 # --- PoW計算（マイニング） ---
-def solve_pow(difficulty: int, index: int, previous_hash: str, transactions: list) -> tuple[int, float]:
-    """条件を満たす nonce と timestamp を見つけるまで計算する。"""
+def solve_pow(difficulty: int, index: int, previous_hash: str, transactions: list, workers: int = None, cancel_event=None):
+    """
+    条件を満たす nonce と timestamp を見つけるまで計算し、(nonce, timestamp) を返す。
+    workers 個のプロセスで nonce 空間を分担する（省略時はCPUコア数）。
+    cancel_event がセットされて中断した場合は None を返す。
+    """
     print(f"Difficulty: {difficulty}")
-    target = '0' * difficulty
-    nonce = 0
     merkle_root = calculate_merkle_root(transactions)
+    # ハッシュの計算順序はサーバー側(Block.calculate_block_hash)と完全に一致させている
+    result = pow_solver.solve(difficulty, index, previous_hash, merkle_root, workers=workers, cancel_event=cancel_event)
+    if result is None:
+        return None
+    return result["nonce"], result["timestamp"]
 
+class TipWatcher(threading.Thread):
+    """
+    /info のロングポーリングで最新ブロックの変更を監視するスレッド。
+    known_hash から変わったら new_info に最新情報を入れて changed をセットする。
+    """
+    def __init__(self, known_hash: str):
+        super().__init__(daemon=True)
+        self.known_hash = known_hash
+        self.changed = threading.Event()
+        self.new_info = None
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.is_set():
+            try:
+                response = get_client().get("/info", params={
+                    "wait_for_change": self.known_hash, "timeout": TIP_POLL_TIMEOUT
+                }, timeout=TIP_POLL_TIMEOUT + 10)
+                response.raise_for_status()
+                info = response.json()
+            except requests.exceptions.RequestException:
+                # 監視に失敗してもマイニング自体は続ける（送信時にサーバー側で検証される）
+                self._stopped.wait(1.0)
+                continue
+            if info["latest_block_hash"] != self.known_hash:
+                self.new_info = info
+                self.changed.set()
+                return
+
+    def stop(self):
+        self._stopped.set()
+
+def mine_on_latest_tip(info: dict, transactions: list, workers: int = None):
+    """
+    info の最新ブロックの上にブロックを採掘する。
+    採掘中に他の送金で最新ブロックが変わったら、その時点で計算を打ち切って新しい最新ブロックでやり直す。
+    戻り値は (採掘に使った info, nonce, timestamp)。
+    """
     while True:
-        timestamp = time.time()
-        # サーバー側(Block.calculate_block_hash)と引数の順序を完全に一致させる
-        block_hash = calculate_hash(index, timestamp, merkle_root, previous_hash, nonce, difficulty)
-        
-        if nonce % 200000 == 0: # 計算中の進捗を表示
-            print(f"  ...計算中 (Nonce: {nonce}, Hash: {block_hash[:10]}...)")
-
-        if block_hash.startswith(target):
-            print(f"発見！ Hash: {block_hash}")
-            return nonce, timestamp
-        
-        nonce += 1
+        watcher = TipWatcher(info["latest_block_hash"])
+        watcher.start()
+        try:
+            solved = solve_pow(
+                difficulty=info['difficulty'],
+                index=info['latest_block_index'] + 1,
+                previous_hash=info['latest_block_hash'],
+                transactions=transactions,
+                workers=workers,
+                cancel_event=watcher.changed
+            )
+        finally:
+            watcher.stop()
+        if solved is not None:
+            return (info, *solved)
+        print("チェーンが更新されたため、新しい最新ブロックで計算をやり直します...")
+        info = watcher.new_info
 
 # --- API連携 ---
 def create_user_on_server(username: str, initial_balance: int = 1000):
     try:
         public_key = generate_user_keys(username)
-        response = requests.post(f"{API_BASE_URL}/create_user", json={
-            "username": username, "public_key": public_key, "initial_balance": initial_balance
-        })
-        response.raise_for_status()
-        return response.json()
+        return get_client().create_user(username, public_key, initial_balance)
     except requests.exceptions.RequestException as e:
         # エラーレスポンスがJSON形式の場合、その内容を表示する
         error_details = str(e)
@@ -124,42 +203,47 @@ def create_user_on_server(username: str, initial_balance: int = 1000):
                 error_details = e.response.text
         return {"error": f"{e}", "details": error_details}
 
-def send_transaction(from_user: str, to_user: str, amount: int, comment: str = ""):
+def make_transaction(from_user: str, to_user: str, amount: int, comment: str = "") -> dict:
+    """送金元の秘密鍵で署名し、サーバーと同じ方法で txid を計算したトランザクションを作る"""
+    private_key, _ = load_user_keys(from_user)
+    message = f"send:{from_user}->{to_user}:{amount}"
+    signature = sign_message(private_key, message)
+    tx_payload_for_id = {"from": from_user, "to": to_user, "amount": amount, "signature": signature, "comment": comment}
+    txid = hashlib.sha256(json.dumps(tx_payload_for_id, sort_keys=True).encode()).hexdigest()
+    return {**tx_payload_for_id, "txid": txid}
+
+def send_transaction(from_user: str, to_user: str, amount: int, comment: str = "", workers: int = None):
     try:
         # 1. PoW計算に必要な情報をサーバーから取得
         print("サーバーからPoW情報を取得しています...")
-        info_res = requests.get(f"{API_BASE_URL}/info")
+        info_res = get_client().get("/info")
         info_res.raise_for_status()
         info = info_res.json()
 
-        # 2. 署名を作成
-        private_key, _ = load_user_keys(from_user)
-        message = f"send:{from_user}->{to_user}:{amount}"
-        signature = sign_message(private_key, message)
-        
-        # 3. トランザクションを作成
-        tx_payload_for_id = {"from": from_user, "to": to_user, "amount": amount, "signature": signature, "comment": comment}
-        txid = hashlib.sha256(json.dumps(tx_payload_for_id, sort_keys=True).encode()).hexdigest()
-        transaction = {**tx_payload_for_id, "txid": txid}
-
-        # 4. PoW計算（マイニング）を実行
-        print("送金承認のため、マイニングを開始します...")
-        nonce, timestamp = solve_pow(
-            difficulty=info['difficulty'],
-            index=info['latest_block_index'] + 1,
-            previous_hash=info['latest_block_hash'],
-            transactions=[transaction]
-        )
-        print(f"マイニング成功！ (Nonce: {nonce})")
-
-        # 5. 計算結果を含めてサーバーに送信
-        response = requests.post(f"{API_BASE_URL}/send", json={
-            "from_username": from_user, "to_username": to_user, "amount": amount,
-            "signature": signature, "comment": comment,
-            "nonce": nonce, "timestamp": timestamp
-        })
-        response.raise_for_status()
-        return response.json()
+        # 2. 署名を作成し、3. トランザクションを作成
+        transaction = make_transaction(from_user, to_user, amount, comment)
+        signature = transaction["signature"]
+
+        for attempt in range(MAX_CONFLICT_RETRIES + 1):
+            # 4. PoW計算（マイニング）を実行
+            print("送金承認のため、マイニングを開始します...")
+            info, nonce, timestamp = mine_on_latest_tip(info, [transaction], workers=workers)
+            print(f"マイニング成功！ (Nonce: {nonce})")
+
+            # 5. 計算結果を含めてサーバーに送信（どのブロックの上で計算したかも伝える）
+            response = get_client().post("/send", json={
+                "from_username": from_user, "to_username": to_user, "amount": amount,
+                "signature": signature, "comment": comment,
+                "nonce": nonce, "timestamp": timestamp, "difficulty": info["difficulty"],
+                "previous_hash": info["latest_block_hash"], "index": info["latest_block_index"] + 1
+            })
+            if response.status_code == 409 and attempt < MAX_CONFLICT_RETRIES:
+                # 他の送金が先にチェーンに追加された。応答に含まれる最新ブロックで計算し直す
+                print("他のブロックが先に追加されたため、最新ブロックで再計算します...")
+                info = response.json()
+                continue
+            response.raise_for_status()
+            return response.json()
     
     except FileNotFoundError as e:
         return {"error": str(e)}
@@ -172,29 +256,226 @@ def send_transaction(from_user: str, to_user: str, amount: int, comment: str = "
                 error_details = e.response.text
         return {"error": f"{e}", "details": error_details}
 
-def get_transaction_history(username: str):
+def transfer_payload(tx: dict) -> dict:
+    """トランザクションをサーバーの transfers 形式に変換する"""
+    return {"from_username": tx["from"], "to_username": tx["to"], "amount": tx["amount"],
+            "signature": tx["signature"], "comment": tx["comment"]}
+
+def send_batch(transfers: list[dict], workers: int = None):
+    """
+    複数の送金を1つのブロックにまとめ、1回のPoWで送信する。
+    transfers は {"from": ..., "to": ..., "amount": ..., "comment": ...} のリスト（送金元は複数でもよい）。
+    """
     try:
-        response = requests.get(f"{API_BASE_URL}/transactions", params={"username": username})
-        response.raise_for_status()
-        return response.json()
+        transactions = [
+            make_transaction(t["from"], t["to"], t["amount"], t.get("comment", "")) for t in transfers
+        ]
+        payload_transfers = [transfer_payload(tx) for tx in transactions]
+
+        print("サーバーからPoW情報を取得しています...")
+        info_res = get_client().get("/info")
+        info_res.raise_for_status()
+        info = info_res.json()
+
+        for attempt in range(MAX_CONFLICT_RETRIES + 1):
+            print(f"{len(transactions)} 件の送金をまとめたブロックのマイニングを開始します...")
+            info, nonce, timestamp = mine_on_latest_tip(info, transactions, workers=workers)
+            response = get_client().post("/send_batch", json={
+                "transfers": payload_transfers,
+                "nonce": nonce, "timestamp": timestamp, "difficulty": info["difficulty"],
+                "previous_hash": info["latest_block_hash"], "index": info["latest_block_index"] + 1
+            })
+            if response.status_code == 409 and attempt < MAX_CONFLICT_RETRIES:
+                print("他のブロックが先に追加されたため、最新ブロックで再計算します...")
+                info = response.json()
+                continue
+            response.raise_for_status()
+            return response.json()
+
+    except FileNotFoundError as e:
+        return {"error": str(e)}
+    except requests.exceptions.RequestException as e:
+        error_details = str(e)
+        if e.response is not None:
+            try:
+                error_details = e.response.json()
+            except json.JSONDecodeError:
+                error_details = e.response.text
+        return {"error": f"{e}", "details": error_details}
+
+def send_pipelined(transfers: list[dict], per_block: int = 1, workers: int = None):
+    """
+    多数の送金を per_block 件ずつのブロックに分け、パイプライン方式で送信する。
+    ブロックN+1 は自分で採掘したブロックNのハッシュの上に手元で先行して採掘し、
+    採掘済みのブロックは別スレッドが /send_chain でまとめて送信する（送信の往復を待たずに次の採掘に進む）。
+    他の送金にチェーンを先取りされた場合（409）は、未確定のブロックだけを最新ブロックの上で採掘し直す。
+    """
+    try:
+        transactions = [make_transaction(t["from"], t["to"], t["amount"], t.get("comment", "")) for t in transfers]
+        pending = [transactions[i:i + per_block] for i in range(0, len(transactions), per_block)]
+
+        info_res = get_client().get("/info")
+        info_res.raise_for_status()
+        info = info_res.json()
+
+        block_hashes = []
+        conflicts = 0
+        while pending:
+            confirmed, hashes, conflict_info, error = _run_pipeline(info, pending, workers)
+            block_hashes.extend(hashes)
+            pending = pending[confirmed:]
+            if error is not None:
+                return {**error, "confirmed_blocks": len(block_hashes), "block_hashes": block_hashes}
+            if not pending:
+                break
+            if conflict_info is None and confirmed > 0:
+                # 難易度が変わりうるブロックの手前まで確定した。最新の難易度を取得して続ける
+                info_res = get_client().get("/info")
+                info_res.raise_for_status()
+                info = info_res.json()
+                continue
+            if conflict_info is None or conflicts == MAX_CONFLICT_RETRIES:
+                return {"error": "一部のブロックを送信できませんでした。", "confirmed_blocks": len(block_hashes), "block_hashes": block_hashes}
+            conflicts += 1
+            print("他のブロックが先に追加されたため、未確定のブロックを最新ブロックの上で採掘し直します...")
+            info = conflict_info
+
+        return {
+            "message": f"送金成功！{len(transactions)} 件の送金を {len(block_hashes)} 個のブロックで追加しました。",
+            "confirmed_blocks": len(block_hashes),
+            "block_hashes": block_hashes
+        }
+
+    except FileNotFoundError as e:
+        return {"error": str(e)}
+    except requests.exceptions.RequestException as e:
+        return {"error": str(e)}
+
+def _run_pipeline(info: dict, groups: list[list], workers: int = None):
+    """
+    info の最新ブロックの上に groups を順に採掘しながら送信する。
+    戻り値は (確定したブロック数, 確定したブロックのハッシュ, 409 応答の最新情報 or None, エラー応答 or None)。
+    """
+    mined = queue.Queue()
+    abort = threading.Event()
+    state = {"confirmed": 0, "hashes": [], "conflict": None, "error": None}
+
+    def sender():
+        finished = False
+        while not finished:
+            item = mined.get()
+            if item is None:
+                return
+            run = [item]
+            # 送信待ちの間に採掘が終わっているブロックはまとめて送る
+            while True:
+                try:
+                    item = mined.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    finished = True
+                    break
+                run.append(item)
+            try:
+                response = get_client().post("/send_chain", json={
+                    "blocks": [{"transfers": b["transfers"], "nonce": b["nonce"], "timestamp": b["timestamp"]} for b in run],
+                    "previous_hash": run[0]["previous_hash"], "index": run[0]["index"], "difficulty": info["difficulty"]
+                })
+            except requests.exceptions.RequestException as e:
+                state["error"] = {"error": str(e)}
+                abort.set()
+                return
+            if response.status_code == 201:
+                state["confirmed"] += len(run)
+                state["hashes"].extend(response.json()["block_hashes"])
+                print(f"  {len(run)} 個のブロックが確定しました（累計 {state['confirmed']}）")
+                continue
+            if response.status_code == 409:
+                state["conflict"] = response.json()
+            else:
+                try:
+                    state["error"] = response.json()
+                except json.JSONDecodeError:
+                    state["error"] = {"error": response.text}
+            abort.set()
+            return
+
+    sender_thread = threading.Thread(target=sender, daemon=True)
+    sender_thread.start()
+
+    previous_hash = info["latest_block_hash"]
+    index = info["latest_block_index"] + 1
+    for group in groups:
+        if abort.is_set():
+            break
+        # 難易度が変わりうるブロックは、それより前のブロックが確定してから最新の情報で採掘する
+        if info.get("next_retarget_index") is not None and index >= info["next_retarget_index"]:
+            break
+        result = pow_solver.solve(info["difficulty"], index, previous_hash, calculate_merkle_root(group),
+                                  workers=workers, cancel_event=abort, verbose=False)
+        if result is None:
+            break
+        mined.put({
+            "transfers": [transfer_payload(tx) for tx in group],
+            "nonce": result["nonce"], "timestamp": result["timestamp"],
+            "previous_hash": previous_hash, "index": index
+        })
+        # 次のブロックは今採掘したブロックの上に積む
+        previous_hash = result["hash"]
+        index += 1
+    mined.put(None)
+    sender_thread.join()
+    return state["confirmed"], state["hashes"], state["conflict"], state["error"]
+
+def get_transaction_history(username: str, limit: int = None, before: str = None):
+    """
+    取引履歴を取得する。limit / before（前回の next_cursor）を指定すると
+    新しい順のページ {"transactions": [...], "next_cursor": ...} が返る。
+    """
+    try:
+        return get_client().get_transaction_history(username, limit=limit, before=before)
+    except requests.exceptions.RequestException as e:
+        return {"error": str(e.response.json()) if e.response else str(e)}
+
+def confirm_transaction(txid: str):
+    """
+    サーバーから包含証明を取得し、送金がチェーンに含まれていることを手元で確認する。
+    確認できれば証明（ブロック番号・承認数を含む）を、できなければ {"error": ...} を返す。
+    """
+    try:
+        proof = get_client().get_tx_proof(txid)
     except requests.exceptions.RequestException as e:
         return {"error": str(e.response.json()) if e.response else str(e)}
+    if not verify_tx_proof(proof, txid):
+        return {"error": "包含証明の検証に失敗しました。"}
+    return proof
 
 def get_balance(username: str):
     try:
-        response = requests.get(f"{API_BASE_URL}/balance", params={"username": username})
-        response.raise_for_status()
-        return response.json()
+        return get_client().get_balance(username)
     except requests.exceptions.RequestException as e:
         return {"error": str(e.response.json()) if e.response else str(e)}
     
 
+def get_top_users(limit: int = 100, cursor: str = None):
+    """残高の多い順にユーザーを limit 人取得する（並び替えはサーバー側で済んでいる）"""
+    try:
+        return get_client().get_users_by_balance(limit=limit, cursor=cursor)
+    except requests.exceptions.RequestException as e:
+        return {"error": str(e.response.json()) if e.response else str(e)}
+
+def get_balances(usernames: list[str]):
+    """複数ユーザーの残高を1回のリクエストでまとめて取得する"""
+    try:
+        return get_client().get_balances(usernames)
+    except requests.exceptions.RequestException as e:
+        return {"error": str(e.response.json()) if e.response else str(e)}
+
 def get_all_users():
     """サーバーから全ユーザーのリストを取得する"""
     try:
-        response = requests.get(f"{API_BASE_URL}/users")
-        response.raise_for_status()  # 200番台以外のステータスコードなら例外を発生
-        return response.json()
+        return get_client().get_all_users()
     except requests.exceptions.RequestException as e:
         error_details = str(e)
         if e.response is not None:
@@ -0,0 +1,239 @@
+# light_client.py
+#
+# ブロックヘッダーだけを手元に保存し、前回同期した位置以降の差分だけをサーバーから取得する軽量クライアント。
+# 取得したヘッダーはハッシュの再計算・PoW・前のブロックとの連結を手元で検証してから保存する。
+# PoWはヘッダーが申告する難易度ではなく、手元のヘッダーからサーバーと同じ規則で計算し直した難易度で確認する。
+# 難易度の規則のパラメータはチェーンの作成時にサーバーが記録したもので、初回の同期時に /api/info から取得して
+# ヘッダーの隣（headers.params.json）に保存する（手元の環境変数には依存しない）。
+
+import os
+import json
+import math
+from collections import deque
+import requests
+from client_wallet import calculate_hash, verify_tx_proof
+from api_client import get_client
+
+# --- 定数 ---
+HEADERS_FILE = os.path.join(os.path.dirname(__file__), "headers.jsonl")
+HEADER_FIELDS = ("index", "timestamp", "merkle_root", "previous_hash", "nonce", "difficulty", "hash")
+SYNC_BATCH = 1000   # 1回のリクエストで取得するヘッダー数
+
+# 難易度の規則（サーバーの app/difficulty.py と同じ）
+MAX_RETARGET_STEP = 2
+DIFFICULTY_FACTOR = 16
+
+def parse_params(data) -> dict:
+    """/api/info の chain_params を検証して数値の型を揃えた辞書にする。不正なら ValueError を送出する"""
+    try:
+        params = {
+            "difficulty": int(data["difficulty"]),
+            "target_block_interval": float(data["target_block_interval"]),
+            "retarget_window": max(2, int(data["retarget_window"])),
+            "min_difficulty": int(data["min_difficulty"]),
+            "max_difficulty": int(data["max_difficulty"]),
+        }
+    except (TypeError, KeyError, ValueError):
+        raise ValueError("サーバーから難易度のパラメータ（chain_params）を取得できませんでした")
+    if not math.isfinite(params["target_block_interval"]):
+        raise ValueError("サーバーの難易度のパラメータが不正です")
+    return params
+
+def _clamp(difficulty: int, params: dict) -> int:
+    return max(params["min_difficulty"], min(params["max_difficulty"], difficulty))
+
+def required_difficulty(index: int, recent: list[tuple[float, int]], params: dict) -> int:
+    """
+    ブロック番号 index のヘッダーに求める難易度を、直前までのヘッダーの (timestamp, difficulty) から計算する。
+    params はサーバーが記録した難易度のパラメータ（parse_params の戻り値）。サーバーの app/difficulty.py と同じロジック。
+    """
+    if params["target_block_interval"] <= 0:
+        return params["difficulty"]
+    current = _clamp(recent[-1][1] if recent else params["difficulty"], params)
+    window_size = params["retarget_window"]
+    if index % window_size != 0 or len(recent) < window_size:
+        return current
+    window = recent[-window_size:]
+    observed = (window[-1][0] - window[0][0]) / (window_size - 1)
+    if observed <= 0:
+        steps = MAX_RETARGET_STEP
+    else:
+        steps = round(math.log(params["target_block_interval"] / observed, DIFFICULTY_FACTOR))
+    return _clamp(current + max(-MAX_RETARGET_STEP, min(MAX_RETARGET_STEP, steps)), params)
+
+def verify_header(header: dict, previous: dict = None, required: int = None, params: dict = None):
+    """
+    ヘッダー1件を検証し、問題があればその理由を、なければ None を返す。
+    previous を渡すと、インデックスの連番と previous_hash の連結も確認する。
+    required はこのヘッダーに求められる難易度で、省略時は params を使い required_difficulty で previous だけから計算する
+    （見直しのタイミングでは直前の retarget_window 件が必要なので、続けて検証する場合は呼び出し側で計算して渡す）。
+    """
+    block_hash = calculate_hash(header["index"], header["timestamp"], header["merkle_root"],
+                                header["previous_hash"], header["nonce"], header["difficulty"])
+    if block_hash != header["hash"]:
+        return "ブロックのハッシュ値が内容と一致しません"
+    if header["index"] > 0:
+        if required is None:
+            if params is None:
+                raise ValueError("required か params のどちらかを指定してください")
+            recent = [(previous["timestamp"], previous["difficulty"])] if previous is not None else []
+            required = required_difficulty(header["index"], recent, params)
+        if header["difficulty"] != required:
+            return f"難易度が {header['difficulty']} になっています（{required} である必要があります）"
+        if not block_hash.startswith("0" * required):
+            return f"PoWが無効です（難易度 {required}）"
+    if previous is None:
+        if header["index"] != 0 or header["previous_hash"] != "0":
+            return "ジェネシスブロックではありません"
+    else:
+        if header["index"] != previous["index"] + 1:
+            return "ブロックのインデックスが連番になっていません"
+        if header["previous_hash"] != previous["hash"]:
+            return "previous_hash が前のブロックのハッシュと一致しません"
+    return None
+
+class HeaderStore:
+    """
+    検証済みのブロックヘッダーを1行1ヘッダーのファイルに追記して保存する。
+    2回目以降の起動ではファイルを読み込み、sync() で増えた分だけを取得する。
+    難易度のパラメータはヘッダーと同じ名前の .params.json に保存し、ヘッダーと一緒に破棄する。
+    """
+    def __init__(self, path: str = HEADERS_FILE):
+        self.path = path
+        self.params_path = os.path.splitext(path)[0] + ".params.json"
+        self.params = self._load_params()
+        self.headers = self._load() if self.params is not None else []
+
+    @property
+    def tip(self):
+        """手元で検証済みの最新ヘッダー（まだ無ければ None）"""
+        return self.headers[-1] if self.headers else None
+
+    def _load_params(self):
+        if not os.path.exists(self.params_path):
+            return None
+        try:
+            with open(self.params_path, "r") as f:
+                return parse_params(json.load(f))
+        except (json.JSONDecodeError, UnicodeDecodeError, ValueError):
+            # パラメータが読めなければ、それで検証したヘッダーも信用できないので最初から同期し直す
+            print(f"警告: '{self.params_path}' を読み込めません。ヘッダーを最初から同期し直します。")
+            return None
+
+    def _save_params(self, params: dict):
+        tmp_path = self.params_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(params, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.params_path)
+
+    def _fetch_params(self, client) -> dict:
+        response = client.get("/info")
+        response.raise_for_status()
+        return parse_params(response.json().get("chain_params"))
+
+    def _load(self) -> list[dict]:
+        if not os.path.exists(self.path):
+            return []
+        headers = []
+        good_offset = 0
+        with open(self.path, "rb") as f:
+            for line in f:
+                try:
+                    header = json.loads(line)
+                except (json.JSONDecodeError, UnicodeDecodeError):
+                    header = None
+                if not line.endswith(b"\n") or header is None:
+                    # 書き込み途中で終了した末尾の行は捨てる（次の同期で取得し直す）
+                    print(f"警告: '{self.path}' の末尾の不完全なヘッダーを切り詰めます。")
+                    os.truncate(self.path, good_offset)
+                    break
+                headers.append(header)
+                good_offset += len(line)
+        return headers
+
+    def _append(self, headers: list[dict]):
+        with open(self.path, "a") as f:
+            for header in headers:
+                f.write(json.dumps(header, separators=(",", ":")) + "\n")
+
+    def reset(self):
+        """保存済みのヘッダーと難易度のパラメータを全て破棄する"""
+        self.headers = []
+        self.params = None
+        for path in (self.path, self.params_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def sync(self, client=None) -> int:
+        """
+        手元の最新ヘッダーの次から、サーバーの最新ブロックまでのヘッダーを取得・検証して保存する。
+        追加したヘッダー数を返す。検証に失敗した場合は ValueError を送出する（それまでの分は保存される）。
+        """
+        client = client or get_client()
+        added = 0
+        while True:
+            if self.params is None:
+                # 初回（または破棄した後）はサーバーが記録した難易度のパラメータから取得する
+                if os.path.exists(self.path):
+                    os.remove(self.path)
+                self.headers = []
+                self.params = self._fetch_params(client)
+                self._save_params(self.params)
+            from_index = len(self.headers)
+            response = client.get("/chain", params={"from_index": from_index, "limit": SYNC_BATCH, "headers_only": 1})
+            response.raise_for_status()
+            data = response.json()
+            batch = [{k: block[k] for k in HEADER_FIELDS} for block in data["chain"]]
+            if not batch:
+                if data["chain_length"] < from_index:
+                    # サーバーのチェーンが手元より短い（差し替えられた）場合は最初から取り直す
+                    print("警告: サーバーのチェーンが手元のヘッダーより短くなっています。最初から同期し直します。")
+                    self.reset()
+                    continue
+                return added
+
+            previous = self.tip
+            if previous is not None and batch[0]["previous_hash"] != previous["hash"]:
+                print("警告: サーバーのチェーンが手元のヘッダーと分岐しています。最初から同期し直します。")
+                self.reset()
+                continue
+            verified = []
+            window_size = self.params["retarget_window"]
+            recent = deque(((h["timestamp"], h["difficulty"]) for h in self.headers[-window_size:]), maxlen=window_size)
+            for header in batch:
+                reason = verify_header(header, previous, required_difficulty(header["index"], list(recent), self.params))
+                if reason is not None:
+                    self._append(verified)
+                    self.headers.extend(verified)
+                    raise ValueError(f"ブロック {header['index']} のヘッダーが不正です: {reason}")
+                verified.append(header)
+                recent.append((header["timestamp"], header["difficulty"]))
+                previous = header
+            self._append(verified)
+            self.headers.extend(verified)
+            added += len(verified)
+
+    def get_header(self, index: int):
+        return self.headers[index] if 0 <= index < len(self.headers) else None
+
+    def verify_proof(self, proof: dict, txid: str = None) -> bool:
+        """
+        /api/tx_proof の包含証明を検証し、そのブロックが手元で検証済みのチェーンに含まれていることも確認する。
+        """
+        header = self.get_header(proof["header"]["index"])
+        if header is None or header["hash"] != proof["header"]["hash"]:
+            return False
+        return verify_tx_proof(proof, txid)
+
+
+def sync_headers(store: HeaderStore = None) -> dict:
+    """ヘッダーを同期し、結果を {"added", "tip_index", "tip_hash"} か {"error"} で返す"""
+    store = store or HeaderStore()
+    try:
+        added = store.sync()
+    except (requests.exceptions.RequestException, ValueError) as e:
+        return {"error": str(e)}
+    tip = store.tip
+    return {"added": added, "tip_index": tip["index"], "tip_hash": tip["hash"]}
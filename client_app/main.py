@@ -1,16 +1,28 @@
 # main.py
 
 import json
-# get_all_users をインポートリストに追加
+# get_top_users をインポートリストに追加
 from client_wallet import (
     create_user_on_server,
     send_transaction,
     get_transaction_history,
     get_balance,
-    get_all_users
+    get_top_users
 )
+from light_client import HeaderStore, sync_headers
+
+USER_LIST_PAGE_SIZE = 100   # ユーザー一覧で1度に表示する人数
+
+def print_sync_result(result: dict):
+    if "error" in result:
+        print("ヘッダーの同期に失敗しました:", result["error"])
+    else:
+        print(f"ヘッダーを同期しました（新規 {result['added']} 件、最新ブロック {result['tip_index']}: {result['tip_hash'][:16]}...）")
 
 def main():
+    # 前回までに検証済みのヘッダーを読み込み、増えた分だけを取得する
+    header_store = HeaderStore()
+    print_sync_result(sync_headers(header_store))
     while True:
         print("\n=== 窓口アプリ ===")
         print("1. ユーザー作成")
@@ -19,6 +31,7 @@ def main():
         print("4. 残高を確認する")
         # 新しいメニュー項目を追加
         print("5. ユーザー一覧を見る")
+        print("6. ブロックヘッダーを同期する")
         print("0. 終了")
         choice = input("選択: ")
 
@@ -86,28 +99,38 @@ def main():
         # ▼▼▼ この下のブロックを新しく追加 ▼▼▼
         elif choice == "5":
             print("\nユーザー一覧を取得しています...")
-            users = get_all_users()
+            # 残高順の並び替えはサーバー側で行い、上位から1ページずつ取得する
+            result = get_top_users(limit=USER_LIST_PAGE_SIZE)
             
-            if isinstance(users, dict) and "error" in users:
+            if "error" in result:
                 print("エラー: ユーザー一覧の取得に失敗しました。")
-                print(f"詳細: {users.get('details', 'N/A')}")
-            elif not users:
+                print(f"詳細: {result['error']}")
+            elif not result["users"]:
                 print("現在、登録されているユーザーはいません。")
             else:
-                # 残高の多い順に並び替え
-                sorted_users = sorted(users, key=lambda u: u.get('balance', 0), reverse=True)
-                
                 print("\n" + "--- ユーザー一覧 (残高順) ---".center(52))
                 # 表形式で表示
                 print(f"{'No.':>3} | {'ユーザー名':<15} | {'残高':>12} | {'アドレス'}")
                 print("-" * 54)
-                for i, user in enumerate(sorted_users, 1):
-                    username = user.get('username', 'N/A')
-                    balance = user.get('balance', 0)
-                    address = user.get('address', 'N/A')
-                    print(f"{i:>3} | {username:<15} | {balance:>10} TJC | {address[:20]}...")
+                rank = 0
+                while True:
+                    for user in result["users"]:
+                        rank += 1
+                        username = user.get('username', 'N/A')
+                        balance = user.get('balance', 0)
+                        address = user.get('address', 'N/A')
+                        print(f"{rank:>3} | {username:<15} | {balance:>10} TJC | {address[:20]}...")
+                    if not result.get("next_cursor") or input("続きを表示しますか？ (y/N): ").lower() != "y":
+                        break
+                    result = get_top_users(limit=USER_LIST_PAGE_SIZE, cursor=result["next_cursor"])
+                    if "error" in result:
+                        print("エラー:", result["error"])
+                        break
                 print("-" * 54)
         
+        elif choice == "6":
+            print_sync_result(sync_headers(header_store))
+
         elif choice == "0":
             print("アプリを終了します。")
             break
@@ -0,0 +1,145 @@
+# pow_solver.py
+
+import os
+import time
+import queue
+import hashlib
+import multiprocessing
+
+# --- 定数 ---
+CHECK_INTERVAL = 4096     # 停止フラグの確認とハッシュ数の集計をこの回数ごとに行う
+PROGRESS_INTERVAL = 2.0   # 進捗表示の間隔（秒）
+POLL_INTERVAL = 0.1       # 親プロセスが結果・キャンセルを確認する間隔（秒）
+
+def _meets_target(digest: bytes, difficulty: int) -> bool:
+    """ハッシュの16進表現が difficulty 個の '0' で始まるかをバイト列のまま判定する"""
+    full, half = divmod(difficulty, 2)
+    if digest[:full] != bytes(full):
+        return False
+    return not half or digest[full] < 0x10
+
+def _search(prefix: bytes, suffix: bytes, difficulty: int, start: int, step: int, should_stop, on_progress):
+    """
+    nonce = start, start+step, ... を順に試す。
+    ハッシュ対象は prefix + str(nonce) + suffix で、固定部分 prefix のハッシュ状態（ミッドステート）を使い回す。
+    見つかれば (nonce, hash) を、should_stop() が真になれば None を返す。
+    """
+    base = hashlib.sha256(prefix)
+    nonce = start
+    while not should_stop():
+        for i in range(CHECK_INTERVAL):
+            h = base.copy()
+            h.update(b"%d%s" % (nonce, suffix))
+            if _meets_target(h.digest(), difficulty):
+                on_progress(i + 1)
+                return nonce, h.hexdigest()
+            nonce += step
+        on_progress(CHECK_INTERVAL)
+    return None
+
+def _worker(prefix, suffix, difficulty, start, step, stop_event, result_queue, hash_counter):
+    """ワーカープロセス本体。nonce空間のうち start から step 飛びの部分を担当する"""
+    def on_progress(count):
+        with hash_counter.get_lock():
+            hash_counter.value += count
+    result = _search(prefix, suffix, difficulty, start, step, stop_event.is_set, on_progress)
+    if result is not None:
+        result_queue.put(result)
+        stop_event.set()
+
+def solve(difficulty: int, index: int, previous_hash: str, merkle_root: str,
+          workers: int = None, cancel_event=None, verbose: bool = True):
+    """
+    条件を満たす nonce を複数プロセスで探索する。
+    Block.calculate_block_hash と同じく index, timestamp, merkle_root, previous_hash, nonce, difficulty
+    の順に連結した文字列をハッシュするが、timestamp は探索開始時に固定する。
+    いずれかのワーカーが見つけた時点で全ワーカーを止める。
+    cancel_event（threading.Event など）がセットされたら探索を打ち切り None を返す。
+    """
+    workers = workers or os.cpu_count() or 1
+    timestamp = time.time()
+    prefix = f"{index}{timestamp}{merkle_root}{previous_hash}".encode()
+    suffix = str(difficulty).encode()
+    started = time.monotonic()
+
+    if workers == 1:
+        result, hashes = _solve_inline(prefix, suffix, difficulty, cancel_event, verbose, started)
+    else:
+        result, hashes = _solve_parallel(prefix, suffix, difficulty, workers, cancel_event, verbose, started)
+
+    elapsed = time.monotonic() - started
+    hashes_per_sec = hashes / elapsed if elapsed > 0 else 0.0
+    if result is None:
+        return None
+    nonce, block_hash = result
+    if verbose:
+        print(f"発見！ Hash: {block_hash} ({hashes:,} hashes, {hashes_per_sec / 1000:,.1f} kH/s, {workers} workers)")
+    return {
+        "nonce": nonce,
+        "timestamp": timestamp,
+        "hash": block_hash,
+        "hashes": hashes,
+        "elapsed": elapsed,
+        "hashes_per_sec": hashes_per_sec,
+        "workers": workers
+    }
+
+def _solve_inline(prefix, suffix, difficulty, cancel_event, verbose, started):
+    """ワーカー数1の場合はプロセスを起動せずにこのプロセスで探索する"""
+    state = {"hashes": 0, "last_report": started}
+
+    def on_progress(count):
+        state["hashes"] += count
+        if verbose and time.monotonic() - state["last_report"] >= PROGRESS_INTERVAL:
+            state["last_report"] = time.monotonic()
+            _print_progress(state["hashes"], started)
+
+    def should_stop():
+        return cancel_event is not None and cancel_event.is_set()
+
+    result = _search(prefix, suffix, difficulty, 0, 1, should_stop, on_progress)
+    return result, state["hashes"]
+
+def _solve_parallel(prefix, suffix, difficulty, workers, cancel_event, verbose, started):
+    ctx = multiprocessing.get_context()
+    stop_event = ctx.Event()
+    result_queue = ctx.Queue()
+    hash_counter = ctx.Value("Q", 0)
+    processes = [
+        ctx.Process(target=_worker, args=(prefix, suffix, difficulty, i, workers, stop_event, result_queue, hash_counter), daemon=True)
+        for i in range(workers)
+    ]
+    for p in processes:
+        p.start()
+
+    result = None
+    last_report = started
+    try:
+        while result is None:
+            try:
+                result = result_queue.get(timeout=POLL_INTERVAL)
+            except queue.Empty:
+                if cancel_event is not None and cancel_event.is_set():
+                    break
+                if not any(p.is_alive() for p in processes):
+                    # 終了直前に書き込まれた結果を取りこぼさないよう、最後にもう一度だけ確認する
+                    try:
+                        result = result_queue.get(timeout=POLL_INTERVAL)
+                    except queue.Empty:
+                        pass
+                    break
+                if verbose and time.monotonic() - last_report >= PROGRESS_INTERVAL:
+                    last_report = time.monotonic()
+                    _print_progress(hash_counter.value, started)
+    finally:
+        stop_event.set()
+        for p in processes:
+            p.join(timeout=1.0)
+            if p.is_alive():
+                p.terminate()
+    return result, hash_counter.value
+
+def _print_progress(hashes: int, started: float):
+    elapsed = time.monotonic() - started
+    rate = hashes / elapsed if elapsed > 0 else 0.0
+    print(f"  ...計算中 ({hashes:,} hashes, {rate / 1000:,.1f} kH/s)")
@@ -1,9 +1,11 @@
 # run.py (プロジェクトのルートディレクトリに配置)
 
+import os
 from api import create_app
 
 # アプリケーションファクトリからFlaskアプリを生成
-app = create_app()
+# TJC_VALIDATE_ON_STARTUP=1 を指定すると、起動時にチェーン全体を再検証する
+app = create_app(validate_on_startup=os.environ.get("TJC_VALIDATE_ON_STARTUP") == "1")
 
 if __name__ == '__main__':
     # データをクリアしたい場合は以下のコメントを外す（デバッグ用）
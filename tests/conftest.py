@@ -0,0 +1,98 @@
+# tests/conftest.py
+#
+# 各テストは一時ディレクトリに作った保存先（file / sqlite）と、その上の新しい Blockchain・APIサーバーで動かす。
+# PoWの計算を軽くするため、難易度はモジュールの読み込み前に TJC_DIFFICULTY=1 にしておく。
+
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+os.environ.setdefault("TJC_DIFFICULTY", "1")
+# 保存先を差し替え忘れた場合でもリポジトリの data/ に書き込まないようにする
+os.environ.setdefault("TJC_DATA_DIR", tempfile.mkdtemp(prefix="tjc-test-"))
+
+import time
+import pytest
+
+from app import blockchain, checkpoint, storage, user
+from app.block import Block
+from app.wallet import generate_keypair, sign_message
+
+def make_storage(kind: str, directory):
+    """directory に kind（"file" / "sqlite"）の保存先を作る"""
+    if kind == "sqlite":
+        from app.sqlite_storage import SqliteStorage
+        return SqliteStorage(str(directory / "tjc.sqlite3"))
+    return storage.FileStorage(
+        storage.FileUserStore(str(directory / "users.json"), str(directory / "users.journal.jsonl")),
+        storage.FileBlockStore(str(directory / "blockchain.jsonl"), str(directory / "blockchain.json"),
+                               str(directory / "blockchain.index.sqlite3")))
+
+def use_storage(monkeypatch, store, directory):
+    """プロセス全体で共有する保存先・アカウント・チェーンを store に差し替える（次のアクセスで読み込み直す）"""
+    monkeypatch.setattr(storage, "_storage", store)
+    monkeypatch.setattr(user, "_users", None)
+    monkeypatch.setattr(user, "_balance_index", [])
+    monkeypatch.setattr(blockchain, "_shared_blockchain", None)
+    monkeypatch.setattr(checkpoint, "CHECKPOINT_DIR", str(directory / "checkpoints"))
+
+def close_storage(store):
+    user._users = None
+    store.users.close()
+    store.blocks.close()
+
+@pytest.fixture(params=["file", "sqlite"])
+def backend(request, tmp_path, monkeypatch):
+    """一時ディレクトリに保存先を作り、プロセス全体で共有する保存先・アカウント・チェーンをそれに差し替える"""
+    store = make_storage(request.param, tmp_path)
+    use_storage(monkeypatch, store, tmp_path)
+    yield request.param
+    close_storage(store)
+
+@pytest.fixture
+def client(backend):
+    from api import create_app
+    return create_app().test_client()
+
+@pytest.fixture
+def keys():
+    """ユーザー名 -> (秘密鍵, 公開鍵)。必要になった時点で作る"""
+    class Keys(dict):
+        def __missing__(self, username):
+            self[username] = generate_keypair()
+            return self[username]
+    return Keys()
+
+def create_users(client, keys, balances: dict):
+    for username, balance in balances.items():
+        response = client.post("/api/create_user", json={
+            "username": username, "public_key": keys[username][1], "initial_balance": balance})
+        assert response.status_code == 201, response.get_json()
+
+def sign_transfer(keys, from_username: str, to_username: str, amount: int) -> str:
+    return sign_message(keys[from_username][0], f"send:{from_username}->{to_username}:{amount}")
+
+def mine_transfers(client, transfers: list[dict], timestamp=None, previous: dict = None) -> dict:
+    """
+    送金のリストを現在の最新ブロック（previous を渡した場合はその {"index", "hash"} のブロック）の上で採掘し、
+    {"nonce", "timestamp", "previous_hash", "index", "hash"} を返す
+    """
+    from api.routes import build_transaction
+    info = client.get("/api/info").get_json()
+    if previous is None:
+        previous = {"index": info["latest_block_index"], "hash": info["latest_block_hash"]}
+    transactions = [build_transaction(t["from_username"], t["to_username"], t["amount"], t["signature"], t.get("comment", ""))
+                    for t in transfers]
+    block = Block(index=previous["index"] + 1, transactions=transactions, previous_hash=previous["hash"],
+                  difficulty=info["difficulty"], timestamp=timestamp or time.time())
+    target = "0" * block.difficulty
+    while not block.hash.startswith(target):
+        block.nonce += 1
+        block.hash = block.calculate_block_hash()
+    return {"nonce": block.nonce, "timestamp": block.timestamp, "previous_hash": block.previous_hash, "index": block.index,
+            "hash": block.hash}
+
+def mine_send(client, payload: dict, timestamp=None) -> dict:
+    """/send の送金内容に、現在の最新ブロックの上で採掘した nonce と timestamp を加えた本文を返す"""
+    return {**payload, **mine_transfers(client, [payload], timestamp)}
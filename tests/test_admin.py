@@ -0,0 +1,49 @@
+# tests/test_admin.py
+#
+# /api/admin/reload の呼び出し元の制限と、ブロックの追加と直列化されること
+
+import threading
+
+from api import routes
+from app.blockchain import get_shared_blockchain
+from app.user import get_balance
+from conftest import create_users, sign_transfer, mine_send
+
+def test_reload_rejects_remote_requests(client):
+    response = client.post("/api/admin/reload", environ_base={"REMOTE_ADDR": "203.0.113.5"})
+    assert response.status_code == 403
+
+def test_reload_requires_token_when_configured(client, monkeypatch):
+    monkeypatch.setattr(routes, "ADMIN_TOKEN", "secret")
+    assert client.post("/api/admin/reload").status_code == 403
+    assert client.post("/api/admin/reload", headers={"X-Admin-Token": "wrong"}).status_code == 403
+    response = client.post("/api/admin/reload", headers={"X-Admin-Token": "secret"},
+                           environ_base={"REMOTE_ADDR": "203.0.113.5"})
+    assert response.status_code == 200
+
+def test_reload_keeps_committed_state(client, keys):
+    create_users(client, keys, {"alice": 100, "bob": 0})
+    payload = {"from_username": "alice", "to_username": "bob", "amount": 10,
+               "signature": sign_transfer(keys, "alice", "bob", 10)}
+    block_hash = client.post("/api/send", json=mine_send(client, payload)).get_json()["block_hash"]
+
+    response = client.post("/api/admin/reload")
+    assert response.status_code == 200
+    assert response.get_json()["latest_block_hash"] == block_hash
+    assert get_balance("alice") == 90
+    assert get_balance("bob") == 10
+
+def test_reload_waits_for_commit(client):
+    blockchain = get_shared_blockchain()
+    done = threading.Event()
+
+    def reload():
+        blockchain.reload()
+        done.set()
+    # コミット中（ロック保持中）は読み直しが始まらない
+    with blockchain._lock:
+        thread = threading.Thread(target=reload)
+        thread.start()
+        assert not done.wait(0.2)
+    thread.join(5)
+    assert done.is_set()
@@ -0,0 +1,32 @@
+# tests/test_api_client.py
+#
+# クライアント（client_app/api_client.py）のスレッドごとのセッションが、スレッドの終了時に閉じられること
+
+import gc
+import os
+import sys
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "client_app"))
+
+from api_client import WalletClient
+
+def test_thread_sessions_are_released_when_threads_end():
+    client = WalletClient()
+    sessions = []
+    threads = [threading.Thread(target=lambda: sessions.append(client.session)) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    gc.collect()
+    assert len(set(map(id, sessions))) == 8
+    assert client._sessions == set()
+    assert all(not session.adapters["http://"].poolmanager.pools for session in sessions)
+
+def test_close_closes_sessions_of_live_threads():
+    client = WalletClient()
+    session = client.session
+    assert client.session is session
+    client.close()
+    assert client._sessions == set()
@@ -0,0 +1,79 @@
+# tests/test_difficulty.py
+#
+# 難易度のリターゲットと、チェーンの作成時に記録したパラメータでの検証
+
+import pytest
+
+from app import blockchain as blockchain_module, difficulty
+from app.block import Block
+from app.blockchain import Blockchain
+from app.difficulty import ChainParams
+from app.validation import validate_blockchain, validate_chain
+
+# 1秒間隔で採掘すると目標（16秒）より速いので、4ブロックごとに難易度が1ずつ上がる
+RETARGET_PARAMS = ChainParams(difficulty=1, target_block_interval=16.0, retarget_window=4, min_difficulty=1, max_difficulty=3)
+
+@pytest.fixture
+def retarget(backend, monkeypatch):
+    monkeypatch.setattr(difficulty, "ENV_PARAMS", RETARGET_PARAMS)
+    monkeypatch.setattr(blockchain_module, "ENV_PARAMS", RETARGET_PARAMS)
+    return RETARGET_PARAMS
+
+def mine(block: Block) -> Block:
+    while not block.hash.startswith("0" * block.difficulty):
+        block.nonce += 1
+        block.hash = block.calculate_block_hash()
+    return block
+
+def next_block(bc: Blockchain, difficulty: int = None, interval: float = 1.0) -> Block:
+    tip = bc.get_latest_block()
+    return mine(Block(index=tip.index + 1, transactions=[], previous_hash=tip.hash,
+                      difficulty=bc.difficulty if difficulty is None else difficulty, timestamp=tip.timestamp + interval))
+
+def grow(bc: Blockchain, count: int):
+    for _ in range(count):
+        assert bc.add_block(next_block(bc))
+
+def test_difficulty_follows_schedule(retarget):
+    bc = Blockchain()
+    grow(bc, 9)
+    assert [block.difficulty for block in bc.chain][1:] == [1, 1, 1, 2, 2, 2, 2, 3, 3]
+    assert validate_blockchain(bc, workers=1)["valid"]
+
+def test_block_ignoring_schedule_is_rejected(retarget):
+    bc = Blockchain()
+    grow(bc, 3)
+    tip = bc.tip
+    assert bc.difficulty == 2
+    assert bc.add_block(next_block(bc, difficulty=1)) is False
+    assert bc.tip == tip
+
+def test_validation_uses_recorded_params(retarget, monkeypatch):
+    grow(Blockchain(), 9)
+    # 運用者が後から設定を変えても、作成時のパラメータで検証する
+    changed = ChainParams(difficulty=4, target_block_interval=0.0, retarget_window=20, min_difficulty=1, max_difficulty=8)
+    monkeypatch.setattr(difficulty, "ENV_PARAMS", changed)
+    monkeypatch.setattr(blockchain_module, "ENV_PARAMS", changed)
+    bc = Blockchain()
+    assert bc.params == RETARGET_PARAMS
+    assert bc.difficulty == 3
+    assert validate_blockchain(bc, workers=1)["valid"]
+
+def test_forged_low_difficulty_chain_is_rejected(retarget):
+    bc = Blockchain()
+    grow(bc, 9)
+    chain = list(bc.chain)
+    forged = [chain[0]]
+    for old in chain[1:]:
+        block = Block(index=old.index, transactions=[], previous_hash=forged[-1].hash, difficulty=0, timestamp=old.timestamp)
+        forged.append(block)
+    result = validate_chain(forged, {}, bc.params, workers=1)
+    assert result["first_invalid_index"] == 1
+
+def test_rewound_timestamp_is_rejected(retarget):
+    bc = Blockchain()
+    grow(bc, 5)
+    tip = bc.get_latest_block()
+    block = mine(Block(index=tip.index + 1, transactions=[], previous_hash=tip.hash, difficulty=bc.difficulty,
+                       timestamp=bc.chain[0].timestamp))
+    assert bc.add_block(block) is False
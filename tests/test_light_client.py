@@ -0,0 +1,67 @@
+# tests/test_light_client.py
+#
+# ライトクライアント（client_app/light_client.py）が、サーバーが記録した難易度のパラメータでヘッダーを検証すること
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "client_app"))
+
+from app import blockchain as blockchain_module, difficulty
+from app.blockchain import get_shared_blockchain
+from light_client import HeaderStore
+from test_difficulty import RETARGET_PARAMS, grow
+
+class FlaskApiClient:
+    """WalletClient.get と同じ呼び出し方で、Flask のテストクライアントに /api 以下のリクエストを送る"""
+    def __init__(self, client):
+        self.client = client
+        self.paths = []
+
+    def get(self, path, params=None):
+        self.paths.append(path)
+        return FlaskApiResponse(self.client.get("/api" + path, query_string=params))
+
+class FlaskApiResponse:
+    def __init__(self, response):
+        self.response = response
+
+    def raise_for_status(self):
+        assert self.response.status_code == 200, self.response.get_json()
+
+    def json(self):
+        return self.response.get_json()
+
+@pytest.fixture
+def retarget_chain(backend, monkeypatch):
+    monkeypatch.setattr(difficulty, "ENV_PARAMS", RETARGET_PARAMS)
+    monkeypatch.setattr(blockchain_module, "ENV_PARAMS", RETARGET_PARAMS)
+    bc = get_shared_blockchain()
+    grow(bc, 9)
+    return bc
+
+def test_info_publishes_chain_params(retarget_chain, client):
+    assert client.get("/api/info").get_json()["chain_params"] == RETARGET_PARAMS._asdict()
+
+def test_headers_are_verified_with_server_params(retarget_chain, client, tmp_path):
+    api = FlaskApiClient(client)
+    store = HeaderStore(str(tmp_path / "headers.jsonl"))
+    # 手元の環境変数（TJC_DIFFICULTY=1、リターゲットなし）ではなくサーバーの記録した値で検証する
+    assert store.sync(api) == 10
+    assert store.params == RETARGET_PARAMS._asdict()
+    assert os.path.exists(tmp_path / "headers.params.json")
+
+    # 再起動後は保存したパラメータを使い、増えた分だけを取得する
+    grow(retarget_chain, 4)
+    api.paths.clear()
+    store = HeaderStore(str(tmp_path / "headers.jsonl"))
+    assert store.params == RETARGET_PARAMS._asdict()
+    assert store.sync(api) == 4
+    assert "/info" not in api.paths
+    assert store.tip["difficulty"] == 3
+
+    store.reset()
+    assert store.params is None
+    assert not os.path.exists(tmp_path / "headers.params.json")
@@ -0,0 +1,10 @@
+# tests/test_metrics.py
+#
+# /api/metrics の出力形式
+
+def test_vk_cache_counts_are_counters(client):
+    text = client.get("/api/metrics").get_data(as_text=True)
+    assert "# TYPE tjc_vk_cache_hits_total counter" in text
+    assert "# TYPE tjc_vk_cache_misses_total counter" in text
+    assert "# TYPE tjc_vk_cache_size gauge" in text
+    assert "tjc_vk_cache_hits " not in text
@@ -0,0 +1,54 @@
+# tests/test_replay.py
+#
+# 使用済みの署名の再送（表記だけを変えたものを含む）が受け付けられないこと
+
+import pytest
+
+from app.user import get_balance
+from app.utils import replay_key
+from conftest import create_users, sign_transfer, mine_send, mine_transfers
+
+def test_replay_key_ignores_hex_notation():
+    signature = "ab" * 32 + "cd" * 32
+    assert replay_key(signature) == "ab" * 32
+    assert replay_key(signature.upper()) == replay_key(signature)
+    assert replay_key(" " + signature) == replay_key(signature)
+    assert replay_key(signature[:64] + " " + signature[64:]) == replay_key(signature)
+
+@pytest.mark.parametrize("variant", [
+    lambda sig: sig,
+    lambda sig: sig.upper(),
+    lambda sig: " " + sig,
+    lambda sig: sig + " ",
+    lambda sig: sig[:64] + " " + sig[64:],
+])
+def test_resent_signature_is_rejected(client, keys, variant):
+    create_users(client, keys, {"alice": 100, "bob": 0})
+    signature = sign_transfer(keys, "alice", "bob", 10)
+    payload = {"from_username": "alice", "to_username": "bob", "amount": 10, "signature": signature}
+    assert client.post("/api/send", json=mine_send(client, payload)).status_code == 201
+
+    resent = {**payload, "signature": variant(signature), "comment": "again"}
+    response = client.post("/api/send", json=mine_send(client, resent))
+    assert response.status_code == 400
+    assert get_balance("alice") == 90
+    assert get_balance("bob") == 10
+
+def test_non_canonical_signature_is_rejected_before_mining(client, keys):
+    create_users(client, keys, {"alice": 100, "bob": 0})
+    signature = sign_transfer(keys, "alice", "bob", 10).upper()
+    response = client.post("/api/send", json={"from_username": "alice", "to_username": "bob", "amount": 10,
+                                              "signature": signature, "nonce": 0, "timestamp": 1.0})
+    assert response.status_code == 400
+    assert "signature" in response.get_json()["error"]
+
+def test_resent_signature_in_batch_is_rejected(client, keys):
+    create_users(client, keys, {"alice": 100, "bob": 0})
+    signature = sign_transfer(keys, "alice", "bob", 10)
+    payload = {"from_username": "alice", "to_username": "bob", "amount": 10, "signature": signature}
+    assert client.post("/api/send", json=mine_send(client, payload)).status_code == 201
+
+    transfers = [{**payload, "signature": " " + signature}]
+    response = client.post("/api/send_batch", json={"transfers": transfers, **mine_transfers(client, transfers)})
+    assert response.status_code == 400
+    assert get_balance("alice") == 90
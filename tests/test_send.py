@@ -0,0 +1,84 @@
+# tests/test_send.py
+#
+# 送金API（/send, /send_batch, /send_chain）でのブロックの追加と、先に追加されたブロックとの競合
+
+from conftest import create_users, sign_transfer, mine_send, mine_transfers
+
+def transfer(keys, from_username: str, to_username: str, amount: int) -> dict:
+    return {"from_username": from_username, "to_username": to_username, "amount": amount,
+            "signature": sign_transfer(keys, from_username, to_username, amount)}
+
+def balances(client, *usernames) -> list[int]:
+    found = client.get("/api/balances", query_string={"usernames": ",".join(usernames)}).get_json()["balances"]
+    return [found[username] for username in usernames]
+
+def latest_index(client) -> int:
+    return client.get("/api/info").get_json()["latest_block_index"]
+
+def test_block_on_stale_tip_returns_409(client, keys):
+    create_users(client, keys, {"alice": 100, "bob": 0})
+    first = mine_send(client, transfer(keys, "alice", "bob", 10))
+    second = mine_send(client, transfer(keys, "alice", "bob", 20))
+    response = client.post("/api/send", json=first)
+    assert response.status_code == 201
+
+    # 同じ最新ブロックの上で採掘した2つ目は、最新の情報付きの 409 になり反映されない
+    response = client.post("/api/send", json=second)
+    assert response.status_code == 409
+    body = response.get_json()
+    assert body["latest_block_hash"] == first["hash"]
+    assert body["latest_block_index"] == first["index"]
+    assert balances(client, "alice", "bob") == [90, 10]
+
+    # 最新ブロックの上で採掘し直せば受け付けられる
+    retried = {**second, **mine_transfers(client, [second])}
+    assert client.post("/api/send", json=retried).status_code == 201
+    assert balances(client, "alice", "bob") == [70, 30]
+
+def test_send_batch_adds_one_block(client, keys):
+    create_users(client, keys, {"alice": 100, "bob": 50, "carol": 0})
+    transfers = [transfer(keys, "alice", "carol", 30), transfer(keys, "bob", "carol", 20)]
+    response = client.post("/api/send_batch", json={"transfers": transfers, **mine_transfers(client, transfers)})
+    assert response.status_code == 201
+    assert len(response.get_json()["txids"]) == 2
+    assert latest_index(client) == 1
+    assert balances(client, "alice", "bob", "carol") == [70, 30, 50]
+
+def test_send_batch_checks_combined_balance(client, keys):
+    create_users(client, keys, {"alice": 100, "bob": 0})
+    # 1件ずつなら足りるが、合計では残高を超える
+    transfers = [transfer(keys, "alice", "bob", 60), transfer(keys, "alice", "bob", 50)]
+    response = client.post("/api/send_batch", json={"transfers": transfers, **mine_transfers(client, transfers)})
+    assert response.status_code == 400
+    assert latest_index(client) == 0
+    assert balances(client, "alice", "bob") == [100, 0]
+
+def mine_run(client, transfer_lists: list[list[dict]]) -> dict:
+    """送金のリストごとに1ブロックずつ、手元で連続して採掘した /send_chain の本文を返す"""
+    blocks = []
+    previous = None
+    for transfers in transfer_lists:
+        mined = mine_transfers(client, transfers, previous=previous)
+        blocks.append({"transfers": transfers, "nonce": mined["nonce"], "timestamp": mined["timestamp"]})
+        previous = mined
+        if len(blocks) == 1:
+            start = {"previous_hash": mined["previous_hash"], "index": mined["index"]}
+    return {"blocks": blocks, **start}
+
+def test_send_chain_spends_funds_from_earlier_block(client, keys):
+    create_users(client, keys, {"alice": 0, "bob": 100, "carol": 0})
+    # 2番目のブロックの送金は、1番目のブロックで入金された残高を使う
+    payload = mine_run(client, [[transfer(keys, "bob", "alice", 40)], [transfer(keys, "alice", "carol", 30)]])
+    response = client.post("/api/send_chain", json=payload)
+    assert response.status_code == 201
+    assert len(response.get_json()["block_hashes"]) == 2
+    assert latest_index(client) == 2
+    assert balances(client, "alice", "bob", "carol") == [10, 60, 30]
+
+def test_send_chain_adds_all_blocks_or_none(client, keys):
+    create_users(client, keys, {"alice": 0, "bob": 100, "carol": 0})
+    payload = mine_run(client, [[transfer(keys, "bob", "alice", 40)], [transfer(keys, "alice", "carol", 50)]])
+    response = client.post("/api/send_chain", json=payload)
+    assert response.status_code == 400
+    assert latest_index(client) == 0
+    assert balances(client, "alice", "bob", "carol") == [0, 100, 0]
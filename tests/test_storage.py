@@ -0,0 +1,130 @@
+# tests/test_storage.py
+#
+# 保存先（file / sqlite）の書き込みの順序と取り消し
+
+import os
+
+import pytest
+
+from app import storage
+from app.storage import AppendOnlyLog, get_storage
+from conftest import create_users, sign_transfer, mine_send, make_storage, use_storage, close_storage
+
+def send(client, keys, from_username: str, to_username: str, amount: int):
+    payload = {"from_username": from_username, "to_username": to_username, "amount": amount,
+               "signature": sign_transfer(keys, from_username, to_username, amount)}
+    return client.post("/api/send", json=mine_send(client, payload))
+
+def chain_state(client) -> dict:
+    """最新ブロック・残高・送金履歴（署名に依存しない項目だけ）"""
+    info = client.get("/api/info").get_json()
+    found = client.get("/api/balances", query_string={"usernames": "alice,bob,carol"}).get_json()["balances"]
+    history = client.get("/api/transactions", query_string={"username": "bob", "limit": 100}).get_json()["transactions"]
+    return {
+        "latest_block_index": info["latest_block_index"],
+        "balances": found,
+        "history": [(tx["block_index"], tx["from"], tx["to"], tx["amount"]) for tx in history],
+    }
+
+def restart(monkeypatch, tmp_path, kind: str):
+    """保存先を閉じ、同じディレクトリから新しいプロセスと同じように読み込み直す"""
+    close_storage(get_storage())
+    store = make_storage(kind, tmp_path)
+    use_storage(monkeypatch, store, tmp_path)
+    return store
+
+@pytest.mark.parametrize("failing", ["blocks.append", "users.record_balances"])
+def test_failed_write_rolls_back_block_and_balances(client, keys, backend, tmp_path, monkeypatch, failing):
+    create_users(client, keys, {"alice": 100, "bob": 0})
+    assert send(client, keys, "alice", "bob", 10).status_code == 201
+    before = chain_state(client)
+
+    part, method = failing.split(".")
+    def fail(*args, **kwargs):
+        raise OSError("書き込みに失敗")
+    with monkeypatch.context() as m:
+        m.setattr(getattr(get_storage(), part), method, fail)
+        assert send(client, keys, "alice", "bob", 20).status_code == 500
+    assert chain_state(client) == before
+
+    # ディスクにも途中までの書き込みが残っていない
+    restart(monkeypatch, tmp_path, backend)
+    assert chain_state(client) == before
+    assert send(client, keys, "alice", "bob", 30).status_code == 201
+    assert chain_state(client)["balances"] == {"alice": 60, "bob": 40}
+
+def test_torn_tail_is_dropped_on_restart(client, keys, backend, tmp_path, monkeypatch):
+    if get_storage().shared:
+        pytest.skip("ファイルの保存先のみ")
+    create_users(client, keys, {"alice": 100, "bob": 0})
+    assert send(client, keys, "alice", "bob", 10).status_code == 201
+    before = chain_state(client)
+    close_storage(get_storage())
+
+    # 追記の途中で止まったレコード
+    with open(tmp_path / "blockchain.jsonl", "ab") as f:
+        f.write(b'{"index":2,"transactions":[')
+    size = os.path.getsize(tmp_path / "blockchain.jsonl")
+
+    restart(monkeypatch, tmp_path, backend)
+    assert chain_state(client) == before
+    assert os.path.getsize(tmp_path / "blockchain.jsonl") < size
+    assert send(client, keys, "alice", "bob", 20).status_code == 201
+
+    restart(monkeypatch, tmp_path, backend)
+    assert chain_state(client)["latest_block_index"] == 2
+    assert chain_state(client)["balances"] == {"alice": 70, "bob": 30}
+
+def test_corruption_before_tail_is_an_error(tmp_path):
+    log = AppendOnlyLog(str(tmp_path / "log.jsonl"))
+    log.append_many([{"n": 1}, {"n": 2}])
+    log.close()
+    with open(log.path, "r+b") as f:
+        f.write(b"#")
+    with pytest.raises(ValueError):
+        list(log.read_records())
+
+def test_file_and_sqlite_give_same_results(keys, tmp_path, monkeypatch):
+    from api import create_app
+    results = {}
+    for kind in ("file", "sqlite"):
+        directory = tmp_path / kind
+        directory.mkdir()
+        use_storage(monkeypatch, make_storage(kind, directory), directory)
+        client = create_app().test_client()
+        create_users(client, keys, {"alice": 100, "bob": 50, "carol": 0})
+        for from_username, to_username, amount in [("alice", "bob", 10), ("bob", "carol", 25), ("alice", "carol", 5)]:
+            assert send(client, keys, from_username, to_username, amount).status_code == 201
+        assert send(client, keys, "carol", "alice", 1000).status_code == 400
+        live = chain_state(client)
+        restart(monkeypatch, directory, kind)
+        assert chain_state(client) == live
+        results[kind] = live
+        close_storage(get_storage())
+    assert results["file"] == results["sqlite"]
+    assert results["file"]["balances"] == {"alice": 85, "bob": 35, "carol": 30}
+
+def test_file_journal_is_synced_after_block_log(client, keys, monkeypatch):
+    if get_storage().shared:
+        pytest.skip("ファイルの保存先のみ")
+    create_users(client, keys, {"alice": 100, "bob": 0})
+    get_storage().users.close()
+    get_storage().blocks.close()
+
+    synced = []
+    real_fsync = os.fsync
+    def recording_fsync(fd):
+        synced.append(fd)
+        real_fsync(fd)
+    monkeypatch.setattr(storage.os, "fsync", recording_fsync)
+
+    payload = {"from_username": "alice", "to_username": "bob", "amount": 10,
+               "signature": sign_transfer(keys, "alice", "bob", 10)}
+    assert client.post("/api/send", json=mine_send(client, payload)).status_code == 201
+    # ブロックごとには fsync しない（グループコミット）
+    assert synced == []
+
+    block_log = get_storage().blocks._log._file.fileno()
+    journal = get_storage().users._journal._file.fileno()
+    get_storage().users.close()
+    assert synced == [block_log, journal]
@@ -0,0 +1,55 @@
+# tests/test_timestamps.py
+#
+# タイムスタンプが数値でないブロックの拒否と、集計用の表の失敗がブロックの追加に影響しないこと
+
+import threading
+
+import pytest
+
+from app.block import Block
+from app.blockchain import get_shared_blockchain
+from app.user import get_balance
+from conftest import create_users, sign_transfer, mine_send
+
+@pytest.mark.parametrize("timestamp", ["abc", "1700000000", True, [1], {"t": 1}])
+def test_send_rejects_non_numeric_timestamp(client, keys, timestamp):
+    create_users(client, keys, {"alice": 100, "bob": 0})
+    blockchain = get_shared_blockchain()
+    tip = blockchain.tip
+    threads = threading.active_count()
+    payload = {"from_username": "alice", "to_username": "bob", "amount": 10,
+               "signature": sign_transfer(keys, "alice", "bob", 10), "nonce": 0, "timestamp": timestamp}
+    response = client.post("/api/send", json=payload)
+    assert response.status_code == 400
+    assert "timestamp" in response.get_json()["error"]
+    assert blockchain.tip == tip
+    assert get_balance("alice") == 100
+    # 保存先からの読み直し（集計用の表などの作り直し）も起きない
+    assert threading.active_count() <= threads
+
+def test_add_block_rejects_non_numeric_timestamp(backend):
+    blockchain = get_shared_blockchain()
+    tip = blockchain.tip
+    block = Block(index=tip.index + 1, transactions=[], previous_hash=tip.hash, difficulty=tip.difficulty, timestamp="abc")
+    while not block.hash.startswith("0" * block.difficulty):
+        block.nonce += 1
+        block.hash = block.calculate_block_hash()
+    assert blockchain.add_block(block) is False
+    assert blockchain.tip == tip
+
+def test_tx_table_failure_does_not_abort_commit(client, keys, monkeypatch):
+    pytest.importorskip("numpy")
+    from app.tx_table import TransactionTable
+    create_users(client, keys, {"alice": 100, "bob": 0})
+
+    def broken_extend(self, blocks):
+        raise ValueError("broken")
+    monkeypatch.setattr(TransactionTable, "extend", broken_extend)
+
+    payload = {"from_username": "alice", "to_username": "bob", "amount": 10,
+               "signature": sign_transfer(keys, "alice", "bob", 10)}
+    response = client.post("/api/send", json=mine_send(client, payload))
+    assert response.status_code == 201
+    assert get_balance("alice") == 90
+    assert get_balance("bob") == 10
+    assert get_shared_blockchain().tip.hash == response.get_json()["block_hash"]